@@ -0,0 +1,77 @@
+"""Admin endpoints: runtime profiling switch and profile reports."""
+import json
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from app.core.profiling import (
+    get_sample_rate,
+    set_sample_rate,
+    is_admin_token,
+    list_profiles,
+    profiles_dir
+)
+from app.core.settings import settings
+from app.models.admin import ProfilingSettings, ProfileListResponse
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Allow the request only with the configured X-Admin-Token."""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Admin API disabled (ADMIN_TOKEN not set)")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiling", response_model=ProfilingSettings)
+async def get_profiling():
+    """
+    Current profiling sample rate of the worker answering.
+    """
+    return ProfilingSettings(sample_rate=get_sample_rate())
+
+
+@router.put("/profiling", response_model=ProfilingSettings)
+async def update_profiling(request: ProfilingSettings):
+    """
+    Change the profiling sample rate, without a restart.
+    
+    Applies to the worker process answering; with several workers, repeat
+    the call or set PROFILE_SAMPLE_RATE.
+    """
+    set_sample_rate(request.sample_rate)
+    return ProfilingSettings(sample_rate=get_sample_rate())
+
+
+@router.get("/profiles", response_model=ProfileListResponse)
+async def get_profiles():
+    """
+    List stored profile reports.
+    """
+    return ProfileListResponse(profiles=list_profiles())
+
+
+def _report_path(profile_id: str, suffix: str):
+    if profile_id not in list_profiles():
+        raise HTTPException(status_code=404, detail=f"Profile '{profile_id}' not found")
+    return profiles_dir() / f"{profile_id}{suffix}"
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """
+    Summary of a profiled request: stage timings, peak memory, top allocations.
+    """
+    return json.loads(_report_path(profile_id, ".json").read_text())
+
+
+@router.get("/profiles/{profile_id}/folded", response_class=PlainTextResponse)
+async def get_profile_stacks(profile_id: str):
+    """
+    Sampled stacks in folded format, for flamegraph.pl or speedscope.
+    """
+    return PlainTextResponse(_report_path(profile_id, ".folded").read_text())
@@ -1,16 +1,47 @@
 """API endpoints for route generation."""
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 
-from app.models.route import RouteRequest, RouteResponse, GPXRouteRequest, GPXRouteResponse
+from app.core.metrics import timed
+from app.core.profiling import run_profiled
+from app.core.settings import settings
+from app.models.route import (
+    RouteRequest,
+    RouteResponse,
+    GPXRouteRequest,
+    GPXRouteResponse,
+    BatchRouteRequest,
+    RouteRefineRequest,
+    RouteRefineResponse
+)
 from app.services.shapes import load_symbol
-from app.services.routing import generate_route
+from app.services.routing import RouteSearchResult
+from app.services.route_library import search_route_with_library
 from app.services.gpx import create_gpx_for_route
+from app.services.batch import stream_batch
+from app.services.refine import remember_route, refine_route, route_states, waypoint_coordinates
 
 
 router = APIRouter(prefix="/route", tags=["routes"])
 
 
+async def _search(request: RouteRequest, polyline) -> RouteSearchResult:
+    """Run the route search for a request in a worker thread."""
+    # CPU-bound: run in a worker thread to keep the event loop responsive
+    return await run_in_threadpool(
+        run_profiled,
+        search_route_with_library,
+        request.symbol_id,
+        polyline,
+        request.start_lat,
+        request.start_lon,
+        request.target_distance_km,
+        max_time_ms=request.max_time_ms or settings.default_route_time_budget_ms,
+        k=request.k
+    )
+
+
 @router.post("", response_model=RouteResponse)
 async def generate_route_endpoint(request: RouteRequest):
     """
@@ -33,18 +64,23 @@ async def generate_route_endpoint(request: RouteRequest):
     
     # Generate route
     try:
-        coordinates, distance_m = generate_route(
-            symbol.polyline,
-            request.start_lat,
-            request.start_lon,
-            request.target_distance_km
-        )
+        result = await _search(request, symbol.polyline)
+        coordinates, distance_m = result.coordinates, result.distance_m
         
         return RouteResponse(
             coordinates=coordinates,
             distance_m=distance_m,
             symbol_id=request.symbol_id,
-            start=(request.start_lat, request.start_lon)
+            start=(request.start_lat, request.start_lon),
+            exhaustive=result.exhaustive,
+            search_time_ms=result.elapsed_ms,
+            alternatives=[vars(alt) for alt in result.alternatives],
+            route_id=remember_route(
+                result, request.symbol_id, symbol.polyline,
+                (request.start_lat, request.start_lon), request.target_distance_km
+            ),
+            waypoints=waypoint_coordinates(result.graph, result.waypoints),
+            library_offset_m=result.library_offset_m
         )
     except Exception as e:
         raise HTTPException(
@@ -53,6 +89,59 @@ async def generate_route_endpoint(request: RouteRequest):
         )
 
 
+@router.post("/refine", response_model=RouteRefineResponse)
+async def refine_route_endpoint(request: RouteRefineRequest):
+    """
+    Re-route a previously generated route after a small edit.
+    
+    Moves the start, changes the target distance and/or drags one waypoint
+    of the route identified by `route_id`, reusing its graph, snapped
+    waypoints and every leg whose end points didn't change. Returns a new
+    `route_id`; the previous one stays valid (e.g. for undo).
+    """
+    state = route_states.get(request.route_id)
+    if state is None and not route_states.owns(request.route_id):
+        # Route states are per worker: this one never had it
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Route '{request.route_id}' belongs to another worker process; refining needs "
+                "sticky sessions or a single worker. Generate the route again"
+            )
+        )
+    if state is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Route '{request.route_id}' not found or expired, generate it again"
+        )
+    
+    start = (request.start_lat, request.start_lon) if request.start_lat is not None else None
+    waypoint = (request.waypoint.index, request.waypoint.lat, request.waypoint.lon) if request.waypoint else None
+    try:
+        result, new_state, recomputed = await run_in_threadpool(
+            run_profiled, refine_route, state, start, request.target_distance_km, waypoint
+        )
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error refining route: {str(e)}"
+        )
+    
+    return RouteRefineResponse(
+        coordinates=result.coordinates,
+        distance_m=result.distance_m,
+        symbol_id=new_state.symbol_id,
+        start=new_state.start,
+        search_time_ms=result.elapsed_ms,
+        route_id=route_states.add(new_state),
+        waypoints=waypoint_coordinates(result.graph, result.waypoints),
+        legs_total=len(result.legs),
+        legs_recomputed=recomputed
+    )
+
+
 @router.post("/gpx", response_model=GPXRouteResponse)
 async def generate_route_with_gpx(request: GPXRouteRequest):
     """
@@ -69,25 +158,31 @@ async def generate_route_with_gpx(request: GPXRouteRequest):
     
     # Generate route
     try:
-        coordinates, distance_m = generate_route(
-            symbol.polyline,
-            request.start_lat,
-            request.start_lon,
-            request.target_distance_km
-        )
+        result = await _search(request, symbol.polyline)
+        coordinates, distance_m = result.coordinates, result.distance_m
         
         # Create GPX
-        gpx_content = create_gpx_for_route(
-            coordinates,
-            request.symbol_id,
-            distance_m
-        )
+        with timed("gpx"):
+            gpx_content = create_gpx_for_route(
+                coordinates,
+                request.symbol_id,
+                distance_m
+            )
         
         return GPXRouteResponse(
             coordinates=coordinates,
             distance_m=distance_m,
             symbol_id=request.symbol_id,
             start=(request.start_lat, request.start_lon),
+            exhaustive=result.exhaustive,
+            search_time_ms=result.elapsed_ms,
+            alternatives=[vars(alt) for alt in result.alternatives],
+            route_id=remember_route(
+                result, request.symbol_id, symbol.polyline,
+                (request.start_lat, request.start_lon), request.target_distance_km
+            ),
+            waypoints=waypoint_coordinates(result.graph, result.waypoints),
+            library_offset_m=result.library_offset_m,
             gpx_content=gpx_content
         )
     except Exception as e:
@@ -113,19 +208,16 @@ async def download_gpx(request: GPXRouteRequest):
     
     # Generate route
     try:
-        coordinates, distance_m = generate_route(
-            symbol.polyline,
-            request.start_lat,
-            request.start_lon,
-            request.target_distance_km
-        )
+        result = await _search(request, symbol.polyline)
+        coordinates, distance_m = result.coordinates, result.distance_m
         
         # Create GPX
-        gpx_content = create_gpx_for_route(
-            coordinates,
-            request.symbol_id,
-            distance_m
-        )
+        with timed("gpx"):
+            gpx_content = create_gpx_for_route(
+                coordinates,
+                request.symbol_id,
+                distance_m
+            )
         
         # Return as downloadable file
         filename = f"{request.symbol_id}_{distance_m/1000:.1f}km.gpx"
@@ -142,3 +234,24 @@ async def download_gpx(request: GPXRouteRequest):
             detail=f"Error generating route: {str(e)}"
         )
 
+
+@router.post("/batch")
+async def generate_route_batch(request: BatchRouteRequest):
+    """
+    Generate many routes, streamed back as NDJSON.
+    
+    Requests are grouped by overlapping graph region; each group loads its
+    street graph once and its routes are evaluated on a worker pool. One
+    line is written per route as soon as it finishes, in completion order
+    (use `index` to match lines to requests).
+    """
+    if len(request.requests) > settings.batch_max_requests:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(request.requests)} requests (max {settings.batch_max_requests})"
+        )
+    
+    return StreamingResponse(
+        stream_batch(request.requests),
+        media_type="application/x-ndjson"
+    )
@@ -1,72 +1,146 @@
 """API endpoints for symbol management."""
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
-import uuid
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
+from functools import lru_cache
+from typing import List, Optional, Tuple
 
+from app.core.http_cache import cached_json_response, weak_etag
+from app.core.metrics import SYMBOL_UPLOADS
+from app.core.settings import settings
 from app.models.symbol import SymbolMetadata, NormalizedSymbol, SymbolListResponse
 from app.services.shapes import (
+    get_upload_pool,
+    shutdown_upload_pool,
     process_svg_upload,
     load_symbol,
-    list_symbols
+    list_symbols,
+    symbol_version,
+    symbols_version
 )
 
 
 router = APIRouter(prefix="/symbols", tags=["symbols"])
 
+# Uploads queued for or running in the upload pool (this worker)
+_pending_uploads = 0
+
 
 @router.post("", response_model=NormalizedSymbol, status_code=201)
-async def upload_symbol(file: UploadFile = File(...)):
+async def upload_symbol(response: Response, file: UploadFile = File(...)):
     """
     Upload a new SVG symbol.
     
     The SVG will be parsed, normalized, and stored for use in route generation.
+    An SVG that is already stored returns the existing symbol (200).
     """
+    global _pending_uploads
+    
     # Validate file type
     if not file.filename.endswith('.svg'):
         raise HTTPException(status_code=400, detail="File must be an SVG")
     
-    # Read content
-    content = await file.read()
-    svg_content = content.decode('utf-8')
+    # Read content, one byte past the limit to detect oversized files
+    max_bytes = settings.symbol_max_upload_kb * 1024
+    content = await file.read(max_bytes + 1)
+    if len(content) > max_bytes:
+        SYMBOL_UPLOADS.inc(outcome="rejected")
+        raise HTTPException(
+            status_code=413,
+            detail=f"SVG larger than {settings.symbol_max_upload_kb} KB"
+        )
     
-    # Generate unique ID
-    symbol_id = file.filename.rsplit('.', 1)[0]
-    # Make it URL-safe
-    symbol_id = symbol_id.lower().replace(' ', '_')
-    # Add UUID suffix if needed to ensure uniqueness
-    symbol_id = f"{symbol_id}_{uuid.uuid4().hex[:8]}"
+    if _pending_uploads >= settings.symbol_max_pending_uploads:
+        SYMBOL_UPLOADS.inc(outcome="rejected")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many uploads in progress",
+            headers={"Retry-After": "1"}
+        )
+    
+    # Base of the symbol ID, made URL-safe; the content hash is appended
+    symbol_name = file.filename.rsplit('.', 1)[0]
+    symbol_name = symbol_name.lower().replace(' ', '_')
     
+    _pending_uploads += 1
     try:
-        # Process the SVG
-        normalized_symbol = process_svg_upload(
-            svg_content,
-            symbol_id,
+        # Process the SVG in the upload pool, off the event loop
+        loop = asyncio.get_running_loop()
+        normalized_symbol, created = await loop.run_in_executor(
+            get_upload_pool(),
+            process_svg_upload,
+            content,
+            symbol_name,
             file.filename
         )
-        return normalized_symbol
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): start a fresh pool next time
+        shutdown_upload_pool()
+        SYMBOL_UPLOADS.inc(outcome="error")
+        raise HTTPException(status_code=503, detail="SVG processing unavailable, retry")
     except Exception as e:
+        SYMBOL_UPLOADS.inc(outcome="invalid")
         raise HTTPException(
             status_code=400,
             detail=f"Error processing SVG: {str(e)}"
         )
+    finally:
+        _pending_uploads -= 1
+    
+    SYMBOL_UPLOADS.inc(outcome="created" if created else "duplicate")
+    if not created:
+        response.status_code = 200
+    return normalized_symbol
+
+
+@lru_cache(maxsize=settings.symbol_body_cache_size)
+def _symbol_body(symbol_id: str, version: Tuple[int, int]) -> bytes:
+    """Serialized symbol; a new file version is a new cache key."""
+    return load_symbol(symbol_id).model_dump_json().encode()
+
+
+# Serialized symbol list and the registry ETag it was built for
+_list_body: Tuple[Optional[str], bytes] = (None, b"")
 
 
 @router.get("", response_model=SymbolListResponse)
-async def get_symbols():
+async def get_symbols(request: Request):
     """
     List all available symbols.
+    
+    Revalidated with ETag / Last-Modified (304 when no symbol changed).
     """
-    symbols = list_symbols()
-    return SymbolListResponse(symbols=symbols)
+    entries, last_modified = symbols_version()
+    etag = weak_etag(*entries)
+    
+    def render() -> bytes:
+        global _list_body
+        if _list_body[0] != etag:
+            body = SymbolListResponse(symbols=list_symbols()).model_dump_json().encode()
+            _list_body = (etag, body)
+        return _list_body[1]
+    
+    return cached_json_response(
+        request, render, etag, last_modified or None, "no-cache"
+    )
 
 
 @router.get("/{symbol_id}", response_model=NormalizedSymbol)
-async def get_symbol(symbol_id: str):
+async def get_symbol(symbol_id: str, request: Request):
     """
     Get a specific symbol by ID.
+    
+    Symbols are content-addressed and don't change once stored, so they
+    can be cached for SYMBOL_CACHE_MAX_AGE_S and revalidated with ETag.
     """
     try:
-        return load_symbol(symbol_id)
+        version = symbol_version(symbol_id)
+        return cached_json_response(
+            request,
+            lambda: _symbol_body(symbol_id, version),
+            weak_etag(symbol_id, *version),
+            version[0] / 1e9,
+            f"public, max-age={settings.symbol_cache_max_age_s}"
+        )
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"Symbol '{symbol_id}' not found")
-
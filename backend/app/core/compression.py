@@ -0,0 +1,133 @@
+"""Negotiated response compression (brotli when installed, else gzip).
+
+Route coordinates and GPX files are large, repetitive text that compress
+about 5-10x. Responses are buffered and compressed whole; streamed NDJSON
+(batch routes) passes through untouched so its lines still arrive as they
+are produced.
+"""
+import gzip
+from typing import List, Optional
+
+try:
+    import brotli
+except ImportError:  # Optional dependency: gzip only
+    brotli = None
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/gpx+xml",
+    "application/xml",
+    "text/",
+    "image/svg+xml",
+)
+# Streamed line by line: never buffered
+STREAMING_TYPES = ("application/x-ndjson", "text/event-stream")
+
+
+def _accepted_encodings(accept_encoding: str) -> List[str]:
+    """Codings from an Accept-Encoding header, excluding those with q=0."""
+    codings = []
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                pass
+        if coding and q > 0:
+            codings.append(coding)
+    return codings
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best supported coding the client accepts: br, then gzip."""
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses of compressible types above a size.
+
+    Args:
+        app: Wrapped application
+        minimum_size: Smaller bodies are sent as they are
+        gzip_level: gzip compression level
+        brotli_quality: brotli quality (4 is fast, with gzip-9-like ratios)
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or content_type.startswith(STREAMING_TYPES)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=start["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            if len(body) >= self.minimum_size:
+                body = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                # ETags set by the app are weak, so they stay valid for the encoded body
+                headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,79 @@
+"""Conditional GET support: ETag / Last-Modified validators and 304 responses."""
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Optional
+
+from fastapi import Request, Response
+
+
+def weak_etag(*parts) -> str:
+    """
+    Weak ETag from the parts identifying a representation's version.
+
+    Weak, so it stays valid whether or not the body gets compressed.
+    """
+    digest = hashlib.sha1("\x1f".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[float] = None) -> bool:
+    """
+    True if the client's cached copy is current (RFC 9110 section 13.1).
+
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cache_headers(etag: str, last_modified: Optional[float], cache_control: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def cached_json_response(
+    request: Request,
+    render: Callable[[], bytes],
+    etag: str,
+    last_modified: Optional[float],
+    cache_control: str
+) -> Response:
+    """
+    A 304 if the client's copy is current, else the JSON body with validators.
+
+    Args:
+        request: Incoming request (conditional headers)
+        render: Builds the serialized JSON body, only called for a 200
+        etag: ETag of the current representation
+        last_modified: Modification time (epoch seconds), if known
+        cache_control: Cache-Control header value
+
+    Returns:
+        Response
+    """
+    headers = cache_headers(etag, last_modified, cache_control)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    return Response(content=render(), media_type="application/json", headers=headers)
@@ -0,0 +1,133 @@
+"""Structured, leveled logging with request correlation ids and sampling.
+
+Records are stamped with the current request id in the calling thread and
+handed to a background listener through a queue, so the routing loop never
+blocks on stdout. Disabled levels cost a single ``isEnabledFor`` check.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from app.core.settings import settings
+
+
+# Current request correlation id and whether its low-level records are kept
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+_sampled_var: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Attributes present on every LogRecord; anything else came from `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id"
+}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def bind_request(request_id: str) -> None:
+    """
+    Attach a correlation id to the current context and decide sampling.
+
+    Sampling is per request: a sampled request logs all of its DEBUG/INFO
+    records, an unsampled one only WARNING and above.
+    """
+    request_id_var.set(request_id)
+    _sampled_var.set(random.random() < settings.log_sample_rate)
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the request id and drop unsampled low-level records."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return record.levelno >= logging.WARNING or _sampled_var.get()
+
+
+class StructuredFormatter(logging.Formatter):
+    """Render records as key=value text or one JSON object per line."""
+
+    def __init__(self, json_output: bool = False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            key: value for key, value in vars(record).items()
+            if key not in _RESERVED_ATTRS
+        }
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+        request_id = getattr(record, "request_id", "-")
+
+        if self.json_output:
+            payload = {
+                "ts": f"{timestamp}.{int(record.msecs):03d}",
+                "level": record.levelname,
+                "logger": record.name,
+                "request_id": request_id,
+                "msg": record.getMessage(),
+                **fields
+            }
+            return json.dumps(payload, default=str)
+
+        line = f"{timestamp} {record.levelname:<7} {record.name} [{request_id}] {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps `extra` fields instead of flattening the record."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.msg = f"{record.msg}\n{record.exc_text}"
+            record.message = record.msg
+            record.exc_info = None
+            record.exc_text = None
+        return record
+
+
+def setup_logging() -> None:
+    """
+    Configure the ``app`` logger hierarchy (idempotent).
+
+    Log output goes through a QueueHandler to a background QueueListener
+    that writes to stderr.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(StructuredFormatter(json_output=settings.log_json))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _ContextQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(settings.log_level.upper())
+    app_logger.handlers = [queue_handler]
+    app_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
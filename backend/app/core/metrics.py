@@ -0,0 +1,268 @@
+"""In-process metrics with Prometheus text exposition and per-request timings."""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+
+# Latency buckets in seconds: route generation ranges from milliseconds
+# (a cached leg) to minutes (a cold graph download on a sparse area).
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    """Render a Prometheus label set such as {stage="snap",le="0.5"}."""
+    parts = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Base class holding the name, help text and label names of a metric."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(f"{line}\n" for line in self._samples())
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def total(self) -> float:
+        """Sum over all label sets."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0.0)]
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+    """Value that can be set to anything (reuses the counter's storage)."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        for key, state in items:
+            for bound, count in zip(self.buckets, state):
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {state[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {state[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}"
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ("method", "path", "status")
+)
+IMPORT_SECONDS = registry.gauge(
+    "app_import_seconds",
+    "Time taken to import the application and each heavy dependency",
+    ("module",)
+)
+ROUTE_STAGE_SECONDS = registry.histogram(
+    "route_stage_duration_seconds",
+    "Time spent in each route generation stage",
+    ("stage",)
+)
+ROUTE_CANDIDATES = registry.counter(
+    "route_candidates_total",
+    "Rotation/scale candidates evaluated, by outcome",
+    ("outcome",)
+)
+ROUTE_SCALE_PREDICTIONS = registry.counter(
+    "route_scale_predictions_total",
+    "Routes found, by where their scale came from (hint, predicted, corrected or sweep)",
+    ("outcome",)
+)
+ROUTE_EARLY_EXITS = registry.counter(
+    "route_early_exits_total",
+    "Searches stopped early because a good enough route was found"
+)
+ROUTE_LEGS = registry.counter(
+    "route_legs_total",
+    "Leg path lookups, by outcome (hit: leg already computed in this search)",
+    ("outcome",)
+)
+SYMBOL_UPLOADS = registry.counter(
+    "symbol_uploads_total",
+    "SVG uploads, by outcome (duplicate: content already stored)",
+    ("outcome",)
+)
+ROUTE_LIBRARY = registry.counter(
+    "route_library_lookups_total",
+    "Route library lookups, by outcome (reused, warm_start or miss)",
+    ("outcome",)
+)
+PRECOMPUTE_JOBS = registry.counter(
+    "precompute_jobs_total",
+    "Precompute jobs finished, by outcome (stored, no_route or failed)",
+    ("outcome",)
+)
+ROUTE_FALLBACKS = registry.counter(
+    "route_fallbacks_total",
+    "Searches that returned the start point only, by reason",
+    ("reason",)
+)
+
+
+# Per-request stage durations (seconds), filled by timed() and
+# reported in the Server-Timing header by the HTTP middleware.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def start_request_timings() -> Dict[str, float]:
+    """Begin collecting stage timings for the current request context."""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def current_request_timings() -> Optional[Dict[str, float]]:
+    """Stage timings collected so far for the current request, if any."""
+    return _request_timings.get()
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Time a block, record it in the stage histogram and the current
+    request's timing breakdown.
+
+    Repeated stages within one request (e.g. each shortest-path leg)
+    are summed in the breakdown but observed individually.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        ROUTE_STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+
+def server_timing_header(timings: Dict[str, float]) -> str:
+    """Format stage timings as a Server-Timing header value (durations in ms)."""
+    return ", ".join(
+        f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+    )
@@ -0,0 +1,230 @@
+"""Opt-in profiling of single route requests.
+
+A request is profiled when it carries ``X-Profile: <admin token>`` or is
+picked by the sampling rate (settable at runtime through /admin/profiling).
+While its route search runs, a background thread samples the stack of the
+thread doing the work, and tracemalloc traces allocations. The report is
+written under ``<data_dir>/profiles``, named after the request id plus a
+unique suffix (``X-Profile-Id`` response header):
+
+- ``<id>.folded``: one ``frame;frame;frame count`` line per distinct
+  stack, for flamegraph.pl, speedscope or inferno
+- ``<id>.json``: stage timings, sample count, peak traced memory and the
+  source lines holding the most traced memory when the work finished.
+  tracemalloc can't tell threads apart: the memory figures are
+  process-wide (``"memory_scope": "process"``) and include whatever other
+  requests allocated meanwhile
+
+Only one request per process is profiled at a time; others run normally.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+from app.core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Runtime sampling rate (admin flag, per process); starts from settings
+_sample_rate = settings.profile_sample_rate
+
+_profile_var: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+# tracemalloc and the sampler are process-wide: one profiled request at a time
+_active = threading.Lock()
+
+
+def get_sample_rate() -> float:
+    return _sample_rate
+
+
+def set_sample_rate(rate: float) -> None:
+    """Profile this fraction of route requests from now on (this process)."""
+    global _sample_rate
+    _sample_rate = rate
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """True if token matches the configured admin token (never when none is set)."""
+    return bool(token and settings.admin_token) and hmac.compare_digest(token, settings.admin_token)
+
+
+def profiles_dir() -> Path:
+    return settings.data_dir / "profiles"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into folded stacks."""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        super().__init__(name="profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """Profile of one request: stack samples and allocations of its route work."""
+
+    def __init__(self, request_id: str, path: str, reason: str):
+        self.request_id = request_id
+        # Report file name: client-supplied ids can't escape the directory,
+        # and requests reusing an id don't overwrite each other's report
+        self.name = f"{re.sub(r'[^A-Za-z0-9_-]', '_', request_id)[:64]}-{uuid.uuid4().hex[:8]}"
+        self.path = path
+        self.reason = reason  # "header" or "sampled"
+        self.sampler: Optional[StackSampler] = None
+        self.elapsed_s = 0.0
+        self.peak_bytes = 0
+        self.top_allocations = []
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call fn on the current thread under the sampler and tracemalloc."""
+        self.sampler = StackSampler(threading.get_ident(), settings.profile_interval_ms / 1000.0)
+        # Someone else (e.g. PYTHONTRACEMALLOC) may be tracing already
+        owns_tracing = not tracemalloc.is_tracing()
+        if owns_tracing:
+            tracemalloc.start(settings.profile_traceback_frames)
+        tracemalloc.reset_peak()
+        self.sampler.start()
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.elapsed_s = time.perf_counter() - started
+            self.sampler.stop()
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+            if owns_tracing:
+                tracemalloc.stop()
+            self.top_allocations = [
+                {"where": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+                for stat in snapshot.statistics("lineno")[:settings.profile_top_allocations]
+            ]
+
+    def save(self, timings: Optional[Dict[str, float]] = None) -> Optional[Path]:
+        """
+        Write the folded stacks and summary of a finished profile.
+
+        Returns:
+            Path of the JSON summary, or None if the profiled work never ran
+        """
+        if self.sampler is None:
+            return None
+        directory = profiles_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"{self.name}.folded").write_text(self.sampler.folded())
+        summary = {
+            "request_id": self.request_id,
+            "path": self.path,
+            "reason": self.reason,
+            "created": time.time(),
+            "elapsed_ms": round(self.elapsed_s * 1000.0, 1),
+            "stages_ms": {stage: round(seconds * 1000.0, 1) for stage, seconds in (timings or {}).items()},
+            "samples": sum(self.sampler.stacks.values()),
+            "interval_ms": settings.profile_interval_ms,
+            # tracemalloc traces every thread: concurrent requests are included
+            "memory_scope": "process",
+            "peak_traced_bytes": self.peak_bytes,
+            "top_allocations": self.top_allocations
+        }
+        path = directory / f"{self.name}.json"
+        path.write_text(json.dumps(summary, indent=2))
+        _prune(directory, settings.profile_max_reports)
+        logger.info(
+            "Request profiled",
+            extra={"path": self.path, "samples": summary["samples"], "peak_traced_bytes": self.peak_bytes}
+        )
+        return path
+
+
+def _prune(directory: Path, max_reports: int) -> None:
+    """Delete the oldest reports beyond max_reports."""
+    summaries = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for summary in summaries[max_reports:]:
+        summary.unlink(missing_ok=True)
+        summary.with_suffix(".folded").unlink(missing_ok=True)
+
+
+def list_profiles() -> list:
+    """Names of the stored reports, newest first."""
+    directory = profiles_dir()
+    if not directory.exists():
+        return []
+    summaries = sorted(directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    return [summary.stem for summary in summaries]
+
+
+def start_request_profile(request_id: str, path: str, header: Optional[str]) -> Optional[RequestProfile]:
+    """
+    Decide whether the current request is profiled and bind its profile.
+
+    Args:
+        request_id: Correlation id, used to name the report
+        path: Request path
+        header: Value of the X-Profile header, if any
+
+    Returns:
+        The bound RequestProfile, or None if the request isn't profiled
+    """
+    if is_admin_token(header):
+        reason = "header"
+    elif _sample_rate > 0 and random.random() < _sample_rate:
+        reason = "sampled"
+    else:
+        return None
+    profile = RequestProfile(request_id, path, reason)
+    _profile_var.set(profile)
+    return profile
+
+
+def run_profiled(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Call fn, profiling it if the current request is profiled.
+
+    Call it on the thread that does the work (e.g. through run_in_threadpool).
+    """
+    profile = _profile_var.get()
+    if profile is None or not _active.acquire(blocking=False):
+        return fn(*args, **kwargs)
+    try:
+        return profile.run(fn, *args, **kwargs)
+    finally:
+        _active.release()
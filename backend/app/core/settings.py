@@ -1,7 +1,7 @@
 """Application settings and configuration."""
 from pydantic_settings import BaseSettings
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 
 class Settings(BaseSettings):
@@ -17,19 +17,87 @@ class Settings(BaseSettings):
     # Network types: "walk" (pedestrian), "bike" (cycling), "drive" (car), "all" (everything)
     osm_network_type: str = "walk"  # Best for running/walking routes
     osm_cache_dir: Path = Path("./data/osm_cache")
+    overpass_endpoint: str = "https://overpass-api.de/api"
+    graph_cache_size: int = 8  # Street graphs kept in memory per worker
+    graph_cache_ttl_s: float = 7 * 24 * 3600.0  # Disk cache lifetime of built graphs
+    graph_store_max_mb: float = 4096.0  # Disk (and shared page cache) budget of the graph store
+    graph_undirected: Optional[bool] = None  # Two-way streets only; default: True for "walk"
+    
+    # Geocoding settings
+    nominatim_url: str = "https://nominatim.openstreetmap.org/search"
+    nominatim_min_interval_s: float = 1.0  # Nominatim usage policy: max 1 req/s
+    geocoder_providers: List[str] = ["gazetteer", "nominatim"]  # Tried in order
+    gazetteer_path: Optional[Path] = None  # CSV with name,lat,lon for offline lookups
+    geocode_cache_size: int = 4096
+    geocode_cache_ttl_s: float = 7 * 24 * 3600.0
+    geocode_disk_cache: bool = True
     
     # Route generation settings
     default_graph_radius_km: float = 3.0  # Reduced for performance
     max_snap_distance_m: float = 300.0  # Increased from 200 for better matching
+    feasibility_cell_m: float = 50.0  # Cell size of the per-graph street distance raster
+    feasibility_max_cells: int = 250_000  # Cells grow beyond feasibility_cell_m to stay under this
     shape_sample_points: int = 200  # Increased for better shape fidelity
+    default_route_time_budget_ms: Optional[int] = None  # Used when a request sets no max_time_ms
+    alternative_max_overlap: float = 0.7  # Max shared street segments between alternative routes
+    route_state_cache_size: int = 256  # Generated routes kept per worker for /route/refine
+    route_state_ttl_s: float = 1800.0
+    route_library_enabled: bool = True  # Store generated routes and reuse them for nearby requests
+    route_library_radius_m: float = 500.0  # Stored routes starting this close warm-start the search
+    route_library_reuse_m: float = 50.0  # Stored routes starting this close have their placement replayed
+    route_library_distance_tolerance: float = 0.1  # Max relative difference of target distances
+    route_library_max_routes: int = 100_000  # Routes generated for requests; precomputed ones don't count
+    
+    # Precompute settings (off-peak generation of popular routes into the route library)
+    precompute_enabled: bool = False
+    precompute_regions: List[Tuple[float, float, float]] = []  # (lat, lon, radius_km) of each region
+    precompute_symbols: List[str] = []  # Default: the most requested symbols
+    precompute_top_symbols: int = 5
+    precompute_distances_km: List[float] = [3.0, 5.0, 10.0]
+    precompute_grid_step_m: float = 70.0  # At most route_library_reuse_m * sqrt(2) so every start is reused
+    precompute_window: str = "01:00-06:00"  # Local time; empty: always
+    precompute_workers: int = 1  # Low-priority processes
+    precompute_refresh_s: float = 7 * 24 * 3600.0  # Routes recomputed after this (graphs may change)
+    precompute_max_routes: int = 200_000  # Plans with more jobs (one library route each) are refused
+    precompute_job_estimate_s: float = 2.0  # Run time per job assumed until jobs have been measured
+    
+    # Symbol upload settings
+    symbol_max_upload_kb: int = 512
+    symbol_workers: int = 2  # Processes parsing uploaded SVGs
+    symbol_max_pending_uploads: int = 16  # Uploads queued or parsing; more get a 503
+    symbol_cache_max_age_s: int = 3600  # Cache-Control max-age of GET /symbols/{id}
+    symbol_body_cache_size: int = 256  # Serialized symbols kept in memory per worker
+    
+    # Response compression settings
+    compression_min_bytes: int = 1024  # Smaller responses are sent uncompressed
+    
+    # Batch route generation settings
+    batch_max_requests: int = 500
+    batch_max_group_radius_km: float = 5.0  # Largest graph shared by one group of requests
+    batch_workers: int = 4
+    
+    # Startup settings
+    warm_up_on_start: bool = True  # Import heavy dependencies in the background after startup
+    
+    # Admin and profiling settings
+    admin_token: Optional[str] = None  # Enables /admin and the X-Profile header when set
+    profile_sample_rate: float = 0.0  # Fraction of route requests profiled (changeable via /admin/profiling)
+    profile_interval_ms: float = 2.0  # Stack sampling interval
+    profile_traceback_frames: int = 1  # Frames kept per traced allocation
+    profile_top_allocations: int = 20
+    profile_max_reports: int = 200  # Oldest reports deleted beyond this
+    
+    # Logging settings
+    log_level: str = "INFO"  # DEBUG logs every candidate tried
+    log_json: bool = False  # One JSON object per line instead of key=value text
+    log_sample_rate: float = 1.0  # Fraction of requests logging below WARNING
     
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Ensure directories exist
+    def ensure_directories(self) -> None:
+        """Create the data directories (at application startup, not at import)."""
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.symbols_dir.mkdir(parents=True, exist_ok=True)
         self.osm_cache_dir.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,68 @@
+"""Process startup: timed imports of heavy dependencies and background warm-up.
+
+The API imports only what it needs to serve requests; the geospatial and
+SVG stacks (osmnx with geopandas/shapely/pandas, scipy, svgpathtools,
+lxml) are imported on first use. Right after startup a background thread
+imports them ahead of time, so the first route request doesn't pay for
+them either, while /health answers immediately.
+"""
+import importlib
+import logging
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Optional
+
+from app.core.metrics import IMPORT_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+# Heavy dependencies in warm-up order, most needed first
+HEAVY_MODULES = ("osmnx", "scipy.spatial", "svgpathtools", "lxml.etree")
+
+import_times: Dict[str, float] = {}
+warmed_up = threading.Event()
+_warm_up_thread: Optional[threading.Thread] = None
+
+
+def record_import_time(module: str, seconds: float) -> None:
+    """Report how long importing `module` took (log, /metrics, /health)."""
+    import_times[module] = seconds
+    IMPORT_SECONDS.set(seconds, module=module)
+    logger.info("Imported", extra={"import": module, "seconds": round(seconds, 3)})
+
+
+def timed_import(module: str) -> ModuleType:
+    """Import a module, recording its import time if this call loaded it."""
+    already_loaded = module in sys.modules
+    start = time.perf_counter()
+    loaded = importlib.import_module(module)
+    if not already_loaded:
+        record_import_time(module, time.perf_counter() - start)
+    return loaded
+
+
+def warm_up() -> None:
+    """Import heavy dependencies and configure them."""
+    start = time.perf_counter()
+    try:
+        for module in HEAVY_MODULES:
+            timed_import(module)
+        from app.services.osm import get_osmnx
+        get_osmnx()
+    except Exception as e:
+        # Not fatal: the import is retried (and fails loudly) on first use
+        logger.warning("Warm-up failed", extra={"error": str(e)})
+    finally:
+        warmed_up.set()
+    logger.info("Warm-up done", extra={"seconds": round(time.perf_counter() - start, 3)})
+
+
+def start_warm_up() -> None:
+    """Run warm_up on a daemon thread (once per process)."""
+    global _warm_up_thread
+    if _warm_up_thread is None:
+        _warm_up_thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+        _warm_up_thread.start()
@@ -1,11 +1,33 @@
 """Main FastAPI application."""
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+import uuid
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 
 from app.core.settings import settings
-from app.api import symbols, routes
-from app.services.geocoding import geocode_address
+from app.core.compression import CompressionMiddleware
+from app.core.log import setup_logging, bind_request, request_id_var
+from app.core.metrics import (
+    registry,
+    HTTP_REQUEST_SECONDS,
+    current_request_timings,
+    start_request_timings,
+    server_timing_header
+)
+from app.core.profiling import start_request_profile
+from app.core.startup import record_import_time, start_warm_up, warmed_up
+from app.api import admin, symbols, routes
+from app.services.geocoding import geocode_address, close_geocoder
+from app.services.shapes import shutdown_upload_pool
+from app.services.precompute import start_scheduler, stop_scheduler
+
 
+setup_logging()
+record_import_time("app.main", time.perf_counter() - _import_started)
 
 # Create FastAPI app
 app = FastAPI(
@@ -22,10 +44,61 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Route coordinates and GPX files compress well (brotli if installed, else gzip)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.compression_min_bytes)
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Profile route requests asked for with X-Profile or picked by sampling."""
+    profile = None
+    if request.url.path.startswith("/route"):
+        profile = start_request_profile(
+            request_id_var.get(), request.url.path, request.headers.get("X-Profile")
+        )
+    response = await call_next(request)
+    if profile is not None and await run_in_threadpool(profile.save, current_request_timings()):
+        response.headers["X-Profile-Id"] = profile.name
+    return response
+
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Record request latency and expose the stage breakdown as Server-Timing."""
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    
+    # Label by route template (e.g. /symbols/{symbol_id}) to bound cardinality
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    HTTP_REQUEST_SECONDS.observe(
+        elapsed,
+        method=request.method,
+        path=path,
+        status=str(response.status_code)
+    )
+    
+    timings["total"] = elapsed
+    response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+@app.middleware("http")
+async def bind_request_id(request: Request, call_next):
+    """Tag log records with a correlation id (client-supplied X-Request-ID or generated)."""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+    bind_request(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 
 # Include routers
 app.include_router(symbols.router)
 app.include_router(routes.router)
+app.include_router(admin.router)
 
 
 @app.get("/")
@@ -37,6 +110,7 @@ async def root():
         "endpoints": {
             "symbols": "/symbols",
             "route": "/route",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -44,19 +118,46 @@ async def root():
 
 @app.get("/health")
 async def health():
-    """Health check endpoint."""
-    return {"status": "healthy"}
+    """Health check endpoint (answers during warm-up too)."""
+    return {"status": "healthy", "warmed_up": warmed_up.is_set()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
 
 
 @app.get("/geocode")
 async def geocode(address: str):
     """Geocode an address to lat/lon coordinates."""
-    result = geocode_address(address)
+    result = await geocode_address(address)
     if result:
         lat, lon = result
         return {"lat": lat, "lon": lon, "address": address}
     else:
-        return {"error": "Address not found"}, 404
+        raise HTTPException(status_code=404, detail="Address not found")
+
+
+@app.on_event("startup")
+async def startup():
+    """Create data directories and warm up heavy dependencies in the background."""
+    settings.ensure_directories()
+    if settings.warm_up_on_start:
+        start_warm_up()
+    if settings.precompute_enabled:
+        start_scheduler()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled upstream connections and upload and precompute workers."""
+    await close_geocoder()
+    shutdown_upload_pool()
+    await run_in_threadpool(stop_scheduler)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,13 @@
+"""Data models for the admin API."""
+from pydantic import BaseModel, Field
+from typing import List
+
+
+class ProfilingSettings(BaseModel):
+    """Runtime profiling settings of one worker process."""
+    sample_rate: float = Field(..., ge=0, le=1, description="Fraction of route requests profiled")
+
+
+class ProfileListResponse(BaseModel):
+    """Stored profile reports."""
+    profiles: List[str] = Field(..., description="Report ids (request ids), newest first")
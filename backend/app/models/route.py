@@ -1,6 +1,6 @@
 """Data models for route generation."""
-from pydantic import BaseModel, Field
-from typing import List, Tuple
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Optional, Tuple
 
 
 class RouteRequest(BaseModel):
@@ -9,6 +9,21 @@ class RouteRequest(BaseModel):
     start_lat: float = Field(..., ge=-90, le=90, description="Starting latitude")
     start_lon: float = Field(..., ge=-180, le=180, description="Starting longitude")
     target_distance_km: float = Field(..., gt=0, le=50, description="Target distance in kilometers")
+    max_time_ms: Optional[int] = Field(
+        None, gt=0, le=600_000,
+        description="Search time budget; the best route found when it expires is returned"
+    )
+    k: int = Field(1, ge=1, le=10, description="Number of distinct routes wanted (best + alternatives)")
+
+
+class RouteAlternative(BaseModel):
+    """A distinct runner-up route found by the same search."""
+    coordinates: List[Tuple[float, float]] = Field(..., description="List of [lat, lon] pairs")
+    distance_m: float = Field(..., description="Total distance in meters")
+    score: float = Field(..., description="Shape/distance score, higher is better")
+    snap_rate: float = Field(..., description="Share of symbol points snapped to streets")
+    rotation: float = Field(..., description="Symbol rotation in degrees")
+    scale_factor: float = Field(..., description="Symbol scale relative to the target distance")
 
 
 class RouteResponse(BaseModel):
@@ -17,6 +32,50 @@ class RouteResponse(BaseModel):
     distance_m: float = Field(..., description="Total distance in meters")
     symbol_id: str
     start: Tuple[float, float] = Field(..., description="Starting coordinates [lat, lon]")
+    exhaustive: bool = Field(True, description="False if the time budget stopped the search early")
+    search_time_ms: float = Field(0.0, description="Time spent searching, in milliseconds")
+    alternatives: List[RouteAlternative] = Field(
+        default_factory=list, description="Up to k - 1 distinct alternatives, best first"
+    )
+    route_id: Optional[str] = Field(None, description="Id to refine this route with POST /route/refine")
+    waypoints: List[Tuple[float, float]] = Field(
+        default_factory=list, description="Snapped symbol waypoints [lat, lon] the route goes through"
+    )
+    library_offset_m: Optional[float] = Field(
+        None,
+        description=(
+            "Set when the route replays a stored route's placement: distance in meters "
+            "from the requested start to that stored route's start"
+        )
+    )
+
+
+class WaypointMove(BaseModel):
+    """A waypoint dragged to a new position."""
+    index: int = Field(..., ge=0, description="Index in the route's waypoints")
+    lat: float = Field(..., ge=-90, le=90)
+    lon: float = Field(..., ge=-180, le=180)
+
+
+class RouteRefineRequest(BaseModel):
+    """Small edit of a previously generated route."""
+    route_id: str = Field(..., description="route_id of the route to refine")
+    start_lat: Optional[float] = Field(None, ge=-90, le=90, description="New starting latitude")
+    start_lon: Optional[float] = Field(None, ge=-180, le=180, description="New starting longitude")
+    target_distance_km: Optional[float] = Field(None, gt=0, le=50, description="New target distance")
+    waypoint: Optional[WaypointMove] = None
+
+    @model_validator(mode="after")
+    def check_start(self) -> "RouteRefineRequest":
+        if (self.start_lat is None) != (self.start_lon is None):
+            raise ValueError("start_lat and start_lon must be given together")
+        return self
+
+
+class RouteRefineResponse(RouteResponse):
+    """Refined route; its route_id can be refined again."""
+    legs_total: int = Field(..., description="Legs between consecutive waypoints")
+    legs_recomputed: int = Field(..., description="Legs whose path had to be searched again")
 
 
 class GPXRouteRequest(RouteRequest):
@@ -28,3 +87,15 @@ class GPXRouteResponse(RouteResponse):
     """Response with route and GPX data."""
     gpx_content: str = Field(..., description="GPX file content as string")
 
+
+class BatchRouteRequest(BaseModel):
+    """Many route requests generated together."""
+    requests: List[RouteRequest] = Field(..., min_length=1, description="Routes to generate")
+
+
+class BatchRouteLine(BaseModel):
+    """One NDJSON line of a batch response, emitted as each route finishes."""
+    index: int = Field(..., description="Position of the request in the batch")
+    status: str = Field(..., description="'ok' or 'error'")
+    route: Optional[RouteResponse] = None
+    detail: Optional[str] = Field(None, description="Error message when status is 'error'")
@@ -1,6 +1,6 @@
 """Data models for SVG symbols."""
 from pydantic import BaseModel
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 
 class SymbolMetadata(BaseModel):
@@ -10,6 +10,7 @@ class SymbolMetadata(BaseModel):
     original_filename: str
     num_points: int
     normalized_length: float = 1.0
+    content_hash: Optional[str] = None  # SHA-256 of the canonicalized SVG
 
 
 class NormalizedSymbol(BaseModel):
@@ -0,0 +1,173 @@
+"""Batch route generation sharing one street graph per region."""
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Set, Tuple
+
+from app.core.settings import settings
+from app.services.compact_graph import CompactGraph
+from app.models.route import RouteRequest, RouteResponse, BatchRouteLine
+from app.services.osm import distance_m, get_graph_around_point, get_spatial_index
+from app.services.routing import graph_radius_km
+from app.services.route_library import search_route_with_library
+from app.services.shapes import load_symbol
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RegionGroup:
+    """Batch requests served by one graph centered on the group's first start."""
+    center: Tuple[float, float]
+    radius_km: float
+    members: List[Tuple[int, RouteRequest]]
+
+
+def group_requests(requests: List[RouteRequest], max_radius_km: float = None) -> List[RegionGroup]:
+    """
+    Greedily group requests whose graph regions overlap.
+
+    A request joins the first group whose graph, grown to cover the
+    request's own graph radius, stays within max_radius_km.
+
+    Args:
+        requests: Route requests in batch order
+        max_radius_km: Largest graph radius a group may need
+
+    Returns:
+        List of RegionGroup
+    """
+    if max_radius_km is None:
+        max_radius_km = settings.batch_max_group_radius_km
+
+    groups: List[RegionGroup] = []
+    for index, request in enumerate(requests):
+        point = (request.start_lat, request.start_lon)
+        needed_km = graph_radius_km(request.target_distance_km)
+        for group in groups:
+            radius_km = max(group.radius_km, distance_m(group.center, point) / 1000.0 + needed_km)
+            if radius_km <= max_radius_km:
+                group.radius_km = radius_km
+                group.members.append((index, request))
+                break
+        else:
+            groups.append(RegionGroup(point, needed_km, [(index, request)]))
+    return groups
+
+
+def _load_group_graph(group: RegionGroup) -> CompactGraph:
+    graph = get_graph_around_point(group.center[0], group.center[1], group.radius_km)
+    # Build the spatial index once, before the group's routes share it
+    get_spatial_index(graph)
+    return graph
+
+
+def _load_symbols(symbol_ids: Set[str]) -> Dict[str, list]:
+    """Load each distinct symbol once; missing symbols are left out."""
+    polylines = {}
+    for symbol_id in symbol_ids:
+        try:
+            polylines[symbol_id] = load_symbol(symbol_id).polyline
+        except FileNotFoundError:
+            pass
+    return polylines
+
+
+def _route_one(graph: CompactGraph, polyline: list, index: int, request: RouteRequest) -> BatchRouteLine:
+    try:
+        result = search_route_with_library(
+            request.symbol_id,
+            polyline,
+            request.start_lat,
+            request.start_lon,
+            request.target_distance_km,
+            graph=graph,
+            max_time_ms=request.max_time_ms or settings.default_route_time_budget_ms,
+            k=request.k
+        )
+    except Exception as e:
+        logger.warning("Batch route failed", extra={"index": index, "error": str(e)})
+        return BatchRouteLine(index=index, status="error", detail=f"Error generating route: {str(e)}")
+
+    return BatchRouteLine(
+        index=index,
+        status="ok",
+        route=RouteResponse(
+            coordinates=result.coordinates,
+            distance_m=result.distance_m,
+            symbol_id=request.symbol_id,
+            start=(request.start_lat, request.start_lon),
+            exhaustive=result.exhaustive,
+            search_time_ms=result.elapsed_ms,
+            alternatives=[vars(alt) for alt in result.alternatives],
+            library_offset_m=result.library_offset_m
+        )
+    )
+
+
+async def stream_batch(requests: List[RouteRequest]) -> AsyncIterator[str]:
+    """
+    Generate routes for a batch, yielding one NDJSON line per route as it finishes.
+
+    Each region group loads its graph and spatial index once; the group's
+    routes are then evaluated on a thread pool. At most batch_workers
+    groups hold a graph at the same time.
+    """
+    loop = asyncio.get_running_loop()
+    lines: asyncio.Queue = asyncio.Queue()
+
+    # Unknown symbols fail right away instead of after their graph loads
+    polylines = await loop.run_in_executor(None, _load_symbols, {r.symbol_id for r in requests})
+    valid = []
+    for index, request in enumerate(requests):
+        if request.symbol_id in polylines:
+            valid.append((index, request))
+        else:
+            yield BatchRouteLine(
+                index=index, status="error", detail=f"Symbol '{request.symbol_id}' not found"
+            ).model_dump_json() + "\n"
+
+    groups = group_requests([request for _, request in valid])
+    # Map group members back to their position in the original batch
+    for group in groups:
+        group.members = [(valid[i][0], request) for i, request in group.members]
+    logger.info("Batch start", extra={"requests": len(requests), "groups": len(groups)})
+
+    pool = ThreadPoolExecutor(max_workers=settings.batch_workers, thread_name_prefix="batch")
+    active_groups = asyncio.Semaphore(settings.batch_workers)
+
+    def submit(fn, *args) -> asyncio.Future:
+        # Keep request id / timings context in the worker thread
+        context = contextvars.copy_context()
+        return loop.run_in_executor(pool, context.run, fn, *args)
+
+    async def run_group(group: RegionGroup) -> None:
+        async with active_groups:
+            try:
+                graph = await submit(_load_group_graph, group)
+            except Exception as e:
+                logger.warning("Batch graph load failed", extra={"center": group.center, "error": str(e)})
+                for index, _ in group.members:
+                    await lines.put(BatchRouteLine(index=index, status="error", detail=f"Error loading graph: {str(e)}"))
+                return
+
+            tasks = [
+                submit(_route_one, graph, polylines[request.symbol_id], index, request)
+                for index, request in group.members
+            ]
+            for task in asyncio.as_completed(tasks):
+                await lines.put(await task)
+
+    group_tasks = [asyncio.create_task(run_group(group)) for group in groups]
+    try:
+        for _ in range(len(valid)):
+            line = await lines.get()
+            yield line.model_dump_json() + "\n"
+    finally:
+        # Client gone or batch done: drop queued work
+        for task in group_tasks:
+            task.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
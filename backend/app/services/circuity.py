@@ -0,0 +1,133 @@
+"""Per-graph circuity: how much longer street paths are than straight lines.
+
+A symbol scaled to a perimeter of L meters becomes a street route of
+about L x circuity, so the scale that hits a target distance can be
+predicted instead of swept. Circuity depends on the distance (short hops
+detour around blocks relatively more), so it is measured in distance
+bands from shortest paths between sampled node pairs.
+
+The model is estimated once per graph: when a region is built it is
+stored in the graph's attributes (and so in the graph store); graphs
+stored before that estimate it on first use.
+"""
+import math
+import threading
+import weakref
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from app.services.compact_graph import CompactGraph, OneToManySearch
+from app.services.osm import M_PER_DEG, get_spatial_index
+
+
+# Straight-line distance bands (m) the circuity is measured in
+BANDS_M = (100.0, 200.0, 400.0, 800.0, 1600.0, 3200.0)
+SAMPLE_SOURCES = 16
+SAMPLES_PER_BAND = 2  # Targets per source and band
+# Paths longer than this many times the straight line are detours around
+# the graph's edge (or unreachable), not street circuity
+MAX_CIRCUITY = 2.5
+# Fallback when no pair could be measured (typical city street networks)
+DEFAULT_CIRCUITY = 1.3
+# Straight-line distance between a shape's turning points, as a fraction of
+# its perimeter: the distance the circuity is read at
+CHORD_FRACTION = 1 / 8
+
+
+class CircuityModel:
+    """
+    Circuity by straight-line distance band of one graph.
+
+    Args:
+        bands: Circuity of each band of BANDS_M (None where unmeasured)
+    """
+
+    def __init__(self, bands: Sequence[Optional[float]]):
+        self.bands = list(bands)
+        measured = [(i, c) for i, c in enumerate(self.bands) if c is not None]
+        # Band centers (log scale) and their circuity, for interpolation
+        self._x = np.array([math.log(BANDS_M[i] * BANDS_M[i + 1]) / 2 for i, _ in measured])
+        self._y = np.array([c for _, c in measured])
+
+    @classmethod
+    def estimate(cls, graph: CompactGraph, seed: int = 0) -> "CircuityModel":
+        """
+        Measure a graph's circuity from sampled shortest paths.
+
+        Each sampled source runs one Dijkstra, resumed for targets picked
+        in every distance band.
+
+        Args:
+            graph: Street graph
+            seed: Sampling seed (fixed: the same graph gives the same model)
+
+        Returns:
+            CircuityModel
+        """
+        n = graph.number_of_nodes()
+        if n < 2:
+            return cls([None] * (len(BANDS_M) - 1))
+        rng = np.random.default_rng(seed)
+        index = get_spatial_index(graph)
+        plane = index.to_plane(graph.lats, graph.lons) * M_PER_DEG
+        path_m = np.zeros(len(BANDS_M) - 1)
+        straight_m = np.zeros(len(BANDS_M) - 1)
+        for source in rng.choice(n, min(SAMPLE_SOURCES, n), replace=False):
+            distances = np.hypot(*(plane - plane[source]).T)
+            band_of = np.searchsorted(BANDS_M, distances, side="right") - 1
+            targets = []
+            for band in range(len(BANDS_M) - 1):
+                in_band = np.flatnonzero(band_of == band)
+                if len(in_band):
+                    picked = rng.choice(in_band, min(SAMPLES_PER_BAND, len(in_band)), replace=False)
+                    targets.extend((band, int(target)) for target in picked)
+            # Nearest first: the search only grows
+            targets.sort(key=lambda t: distances[t[1]])
+            search = OneToManySearch(int(source))
+            for band, target in targets:
+                bound = distances[target] * MAX_CIRCUITY
+                if search.run_until(graph, target, bound):
+                    path_m[band] += search.dist[target]
+                    straight_m[band] += distances[target]
+        return cls([
+            float(path / straight) if straight > 0 else None
+            for path, straight in zip(path_m, straight_m)
+        ])
+
+    def circuity(self, distance_m: float) -> float:
+        """Circuity at a straight-line distance (interpolated between bands)."""
+        if not len(self._y):
+            return DEFAULT_CIRCUITY
+        return float(np.interp(math.log(max(distance_m, 1.0)), self._x, self._y))
+
+    def predict_scale_factor(self, target_distance_m: float) -> float:
+        """
+        Scale factor (of a shape whose perimeter is the target distance)
+        whose street route should measure the target distance.
+        """
+        return 1.0 / self.circuity(target_distance_m * CHORD_FRACTION)
+
+    def to_list(self) -> List[Optional[float]]:
+        return [None if c is None else round(c, 4) for c in self.bands]
+
+
+# Models live as long as their graph, like spatial indexes
+_models: "weakref.WeakKeyDictionary[CompactGraph, CircuityModel]" = weakref.WeakKeyDictionary()
+_model_lock = threading.Lock()
+
+
+def get_circuity_model(graph: CompactGraph) -> CircuityModel:
+    """Return the graph's circuity model: stored with the graph, else estimated once."""
+    model = _models.get(graph)
+    if model is None:
+        with _model_lock:
+            model = _models.get(graph)
+            if model is None:
+                stored = graph.graph.get("circuity")
+                if stored is not None and len(stored) == len(BANDS_M) - 1:
+                    model = CircuityModel(stored)
+                else:
+                    model = CircuityModel.estimate(graph)
+                _models[graph] = model
+    return model
@@ -0,0 +1,230 @@
+"""Compact street graph used for routing.
+
+osmnx graphs keep every OSM tag, edge geometry and a dict per node and
+edge; routing only needs node coordinates, adjacency and edge lengths.
+CompactGraph stores those in flat numpy arrays (CSR adjacency, int32 node
+indices, float32 coordinates and lengths) and keeps a map back to OSM ids.
+Saved graphs can be memory-mapped read-only, so worker processes share them.
+"""
+import heapq
+import itertools
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import networkx as nx
+
+
+class CompactGraph:
+    """
+    Street graph in CSR form.
+
+    Nodes are indices 0..n-1 (OSM ids in `osm_ids`). Coordinates are
+    float32 offsets from a float64 origin, which keeps sub-millimetre
+    precision. Parallel edges are merged, keeping the shortest.
+    """
+
+    # Arrays saved to / mapped from disk by save_graph and load_graph
+    ARRAYS = ("osm_ids", "dlat", "dlon", "indptr", "indices", "lengths")
+
+    def __init__(
+        self,
+        osm_ids: np.ndarray,
+        origin: Tuple[float, float],
+        dlat: np.ndarray,
+        dlon: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        lengths: np.ndarray,
+        undirected: bool,
+        attributes: Optional[dict] = None
+    ):
+        # asarray: arrays already of the right type (e.g. memory-mapped) aren't copied
+        self.osm_ids = np.asarray(osm_ids, dtype=np.int64)
+        self.origin = origin
+        self.dlat = np.asarray(dlat, dtype=np.float32)
+        self.dlon = np.asarray(dlon, dtype=np.float32)
+        self.indptr = np.asarray(indptr, dtype=np.int32)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.lengths = np.asarray(lengths, dtype=np.float32)
+        self.undirected = undirected
+        # Graph-level attributes (region, fixture center, ...), as nx's graph.graph
+        self.graph = dict(attributes or {})
+
+    @property
+    def lats(self) -> np.ndarray:
+        return self.origin[0] + self.dlat.astype(np.float64)
+
+    @property
+    def lons(self) -> np.ndarray:
+        return self.origin[1] + self.dlon.astype(np.float64)
+
+    def number_of_nodes(self) -> int:
+        return len(self.osm_ids)
+
+    def number_of_edges(self) -> int:
+        """Street segments; a two-way segment of an undirected graph counts once."""
+        return len(self.indices) // 2 if self.undirected else len(self.indices)
+
+    def has_node(self, node: int) -> bool:
+        return 0 <= node < len(self.osm_ids)
+
+    def coordinates(self, nodes) -> np.ndarray:
+        """(lat, lon) of each node as an (n, 2) float64 array."""
+        nodes = np.asarray(nodes, dtype=np.int64)
+        return np.column_stack([
+            self.origin[0] + self.dlat[nodes].astype(np.float64),
+            self.origin[1] + self.dlon[nodes].astype(np.float64)
+        ])
+
+    def neighbors(self, node: int) -> Tuple[List[int], List[float]]:
+        """Successor nodes of `node` and the matching edge lengths in meters."""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end].tolist(), self.lengths[start:end].tolist()
+
+    def edge_length(self, u: int, v: int) -> Optional[float]:
+        """Length of edge u -> v in meters, None if there is no such edge."""
+        start, end = self.indptr[u], self.indptr[u + 1]
+        hits = np.flatnonzero(self.indices[start:end] == v)
+        return float(self.lengths[start + hits[0]]) if len(hits) else None
+
+    def nbytes(self) -> int:
+        """Memory held by the arrays."""
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+
+def compact_graph(graph: "nx.MultiDiGraph", undirected: bool = False) -> CompactGraph:
+    """
+    Convert an osmnx graph to a CompactGraph.
+
+    Args:
+        graph: Graph with node 'x'/'y' and edge 'length' attributes
+        undirected: Treat every street as two-way: reverse and parallel
+            duplicates collapse into one segment (its shortest length),
+            usable in both directions
+
+    Returns:
+        CompactGraph; graph-level attributes are carried over
+    """
+    osm_ids = list(graph.nodes)
+    index: Dict[int, int] = {node: i for i, node in enumerate(osm_ids)}
+    lats = np.array([data['y'] for _, data in graph.nodes(data=True)], dtype=np.float64)
+    lons = np.array([data['x'] for _, data in graph.nodes(data=True)], dtype=np.float64)
+
+    # Shortest length per (u, v), like nx.shortest_path picks among parallel edges
+    shortest: Dict[Tuple[int, int], float] = {}
+    for u, v, length in graph.edges(data="length", default=1.0):
+        pair = (index[u], index[v])
+        if undirected and pair[0] > pair[1]:
+            pair = (pair[1], pair[0])
+        if pair[0] == pair[1]:
+            continue  # Self-loops never shorten a path
+        if length < shortest.get(pair, float("inf")):
+            shortest[pair] = length
+
+    pairs = np.array(list(shortest), dtype=np.int64).reshape(-1, 2)
+    lengths = np.fromiter(shortest.values(), dtype=np.float64, count=len(shortest))
+    if undirected:
+        pairs = np.vstack([pairs, pairs[:, ::-1]])
+        lengths = np.concatenate([lengths, lengths])
+
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    sources, targets, lengths = pairs[order, 0], pairs[order, 1], lengths[order]
+    indptr = np.zeros(len(osm_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=len(osm_ids)), out=indptr[1:])
+
+    origin = (float(lats.mean()), float(lons.mean())) if len(lats) else (0.0, 0.0)
+    return CompactGraph(
+        np.array(osm_ids, dtype=np.int64), origin,
+        (lats - origin[0]).astype(np.float32), (lons - origin[1]).astype(np.float32),
+        indptr, targets, lengths, undirected, graph.graph
+    )
+
+
+def save_graph(graph: CompactGraph, directory: Path) -> None:
+    """Write a graph as one .npy file per array plus a meta.json."""
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in CompactGraph.ARRAYS:
+        np.save(directory / f"{name}.npy", getattr(graph, name))
+    meta = {"origin": graph.origin, "undirected": graph.undirected, "attributes": graph.graph}
+    (directory / "meta.json").write_text(json.dumps(meta))
+
+
+def load_graph(directory: Path, mmap: bool = True) -> CompactGraph:
+    """
+    Read a graph written by save_graph.
+
+    Args:
+        directory: Graph directory
+        mmap: Map the arrays read-only instead of reading them, so processes
+            loading the same graph share its pages through the OS page cache
+
+    Returns:
+        CompactGraph
+    """
+    meta = json.loads((directory / "meta.json").read_text())
+    arrays = [
+        np.load(directory / f"{name}.npy", mmap_mode="r" if mmap else None)
+        for name in CompactGraph.ARRAYS
+    ]
+    # JSON turned tuples (region, center, ...) into lists
+    attributes = {
+        key: tuple(value) if isinstance(value, list) else value
+        for key, value in meta["attributes"].items()
+    }
+    osm_ids, dlat, dlon, indptr, indices, lengths = arrays
+    return CompactGraph(
+        osm_ids, tuple(meta["origin"]), dlat, dlon,
+        indptr, indices, lengths, meta["undirected"], attributes
+    )
+
+
+class OneToManySearch:
+    """Dijkstra from one source that can be resumed for further targets."""
+
+    __slots__ = ("source", "dist", "pred", "settled", "heap", "_tie")
+
+    def __init__(self, source: int):
+        self.source = source
+        self.dist: Dict[int, float] = {source: 0.0}
+        self.pred: Dict[int, Optional[int]] = {source: None}
+        self.settled = set()
+        self._tie = itertools.count()
+        self.heap: List[Tuple[float, int, int]] = [(0.0, next(self._tie), source)]
+
+    def run_until(self, graph: CompactGraph, target: int, max_dist: float = float("inf")) -> bool:
+        """
+        Settle nodes until `target` is settled or the frontier passes max_dist.
+
+        Returns:
+            True if the target is settled, False otherwise
+        """
+        heap, dist, pred, settled = self.heap, self.dist, self.pred, self.settled
+        while target not in settled and heap and heap[0][0] <= max_dist:
+            d, _, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            for v, length in zip(*graph.neighbors(u)):
+                if v in settled:
+                    continue
+                nd = d + length
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd, next(self._tie), v))
+        return target in settled
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.heap
+
+    def path_to(self, target: int) -> List[int]:
+        path = [target]
+        while path[-1] != self.source:
+            path.append(self.pred[path[-1]])
+        path.reverse()
+        return path
@@ -0,0 +1,119 @@
+"""Fast rejection of symbol placements that can't snap to enough streets.
+
+Placements over parks, water or the coast fail the snap-rate threshold
+only after every point has been snapped. A FeasibilityRaster, built once
+per graph, stores the distance from each grid cell to the nearest street
+node, so a placement is checked with one vectorized lookup instead of a
+nearest-node query per point.
+
+The check is conservative: a point counts as snappable if some point of
+its cell could be within the snap distance of a node. The raster bounds
+the snap rate from above, so it never rejects a placement that snapping
+would accept.
+"""
+import math
+import threading
+import weakref
+from typing import List, Tuple
+
+import numpy as np
+
+from app.core.settings import settings
+from app.services.compact_graph import CompactGraph
+from app.services.osm import M_PER_DEG, SpatialIndex, get_spatial_index
+
+
+class FeasibilityRaster:
+    """
+    Grid of distances to the nearest street node over a graph's extent.
+
+    The grid lives in the spatial index's plane (longitude scaled by
+    cos(latitude)), where the snap check measures its distances too. It covers the nodes' bounding
+    box padded by the snap distance; points outside are beyond reach.
+    """
+
+    def __init__(
+        self,
+        graph: CompactGraph,
+        index: SpatialIndex,
+        max_distance_m: float,
+        cell_m: float,
+        max_cells: int
+    ):
+        """
+        Args:
+            graph: Graph the raster covers
+            index: The graph's spatial index
+            max_distance_m: Snap distance the raster checks against
+            cell_m: Cell size in meters (grown to stay within max_cells)
+            max_cells: Upper bound on the number of cells
+        """
+        self.index = index
+        self.max_distance = max_distance_m / M_PER_DEG
+        if not graph.number_of_nodes():
+            self.origin = (0.0, 0.0)
+            self.cell = 1.0
+            self.distance = np.full((0, 0), np.inf, dtype=np.float32)
+            self.reachable = np.zeros((0, 0), dtype=bool)
+            return
+
+        nodes = index.to_plane(graph.lats, graph.lons)
+        pad = self.max_distance + cell_m / M_PER_DEG
+        low = nodes.min(axis=0) - pad
+        extent = nodes.max(axis=0) + pad - low
+        cell = max(cell_m / M_PER_DEG, math.sqrt(extent[0] * extent[1] / max_cells))
+        shape = np.ceil(extent / cell).astype(int)
+
+        rows = low[0] + (np.arange(shape[0]) + 0.5) * cell
+        cols = low[1] + (np.arange(shape[1]) + 0.5) * cell
+        centers = np.column_stack([np.repeat(rows, shape[1]), np.tile(cols, shape[0])])
+        self.origin = (float(low[0]), float(low[1]))
+        self.cell = cell
+        self.distance = index.plane_distances(centers).reshape(shape).astype(np.float32)
+        # Any point of a cell is within half a diagonal of its center
+        self.reachable = self.distance - cell * math.sqrt(0.5) <= self.max_distance
+
+    def max_snap_rate(self, polyline: List[Tuple[float, float]]) -> float:
+        """
+        Upper bound of snap_polyline_to_graph's success rate for a polyline.
+
+        Args:
+            polyline: List of (lat, lon) points
+
+        Returns:
+            Fraction of points that may snap within the snap distance
+        """
+        if not polyline:
+            return 0.0
+        points = np.asarray(polyline, dtype=float)
+        plane = self.index.to_plane(points[:, 0], points[:, 1])
+        cells = np.floor((plane - self.origin) / self.cell).astype(np.int64)
+        inside = (
+            (cells >= 0).all(axis=1)
+            & (cells[:, 0] < self.reachable.shape[0])
+            & (cells[:, 1] < self.reachable.shape[1])
+        )
+        cells = cells[inside]
+        return int(self.reachable[cells[:, 0], cells[:, 1]].sum()) / len(polyline)
+
+    def nbytes(self) -> int:
+        return self.distance.nbytes + self.reachable.nbytes
+
+
+# Rasters live as long as their graph, like spatial indexes
+_rasters: "weakref.WeakKeyDictionary[CompactGraph, FeasibilityRaster]" = weakref.WeakKeyDictionary()
+_raster_lock = threading.Lock()
+
+
+def get_feasibility_raster(graph: CompactGraph) -> FeasibilityRaster:
+    """Return the graph's feasibility raster, building it on first use."""
+    raster = _rasters.get(graph)
+    if raster is None:
+        with _raster_lock:
+            raster = _rasters.get(graph)
+            if raster is None:
+                raster = _rasters[graph] = FeasibilityRaster(
+                    graph, get_spatial_index(graph), settings.max_snap_distance_m,
+                    settings.feasibility_cell_m, settings.feasibility_max_cells
+                )
+    return raster
@@ -1,40 +1,294 @@
-"""Geocoding service for address search."""
-import requests
-from typing import Optional, Tuple
+"""Geocoding service for address search.
 
+Queries are normalized and answered from an in-memory LRU cache, then a
+persistent SQLite cache, then the configured providers in order. Nominatim
+is called through a shared pooled async client behind a client-side rate
+limiter (its usage policy allows 1 request per second); a local gazetteer
+file can answer offline.
+"""
+import asyncio
+import csv
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 
-def geocode_address(address: str) -> Optional[Tuple[float, float]]:
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+Coordinates = Tuple[float, float]
+
+
+def normalize_query(address: str) -> str:
+    """Canonical cache key: case-folded, single-spaced, without stray punctuation."""
+    query = address.casefold().strip()
+    query = re.sub(r"\s*,\s*", ", ", query)
+    query = re.sub(r"\s+", " ", query)
+    return query.strip(" ,.;")
+
+
+class GeocodingProvider:
+    """A source of coordinates for a normalized query."""
+
+    name = "base"
+
+    async def geocode(self, query: str) -> Optional[Coordinates]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class RateLimiter:
+    """Space out calls so that at most one starts every `min_interval_s`."""
+
+    def __init__(self, min_interval_s: float):
+        self.min_interval_s = min_interval_s
+        self._lock = asyncio.Lock()
+        self._last_call = 0.0
+
+    async def wait(self) -> None:
+        async with self._lock:
+            delay = self._last_call + self.min_interval_s - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_call = time.monotonic()
+
+
+class NominatimProvider(GeocodingProvider):
+    """Nominatim (OpenStreetMap) over a shared keep-alive HTTP client."""
+
+    name = "nominatim"
+
+    def __init__(self, url: str = None, min_interval_s: float = None):
+        self.url = url or settings.nominatim_url
+        self._limiter = RateLimiter(
+            settings.nominatim_min_interval_s if min_interval_s is None else min_interval_s
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=10.0,
+                headers={"User-Agent": "ShapeRouteGenerator/0.1"},
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+            )
+        return self._client
+
+    async def geocode(self, query: str) -> Optional[Coordinates]:
+        params = {"q": query, "format": "json", "limit": 1}
+        await self._limiter.wait()
+        response = await self._get_client().get(self.url, params=params)
+        response.raise_for_status()
+
+        results = response.json()
+        if results:
+            return float(results[0]["lat"]), float(results[0]["lon"])
+        return None
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class GazetteerProvider(GeocodingProvider):
+    """
+    Offline lookups in a local CSV file with ``name,lat,lon`` columns.
+
+    Names are matched after normalization, so "Paris" also answers
+    "  paris ".
+    """
+
+    name = "gazetteer"
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._entries: Dict[str, Coordinates] = {}
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                self._entries[normalize_query(row["name"])] = (float(row["lat"]), float(row["lon"]))
+
+    async def geocode(self, query: str) -> Optional[Coordinates]:
+        return self._entries.get(query)
+
+
+class GeocodeCache:
     """
-    Geocode an address using Nominatim (OpenStreetMap).
-    
+    LRU memory cache backed by a SQLite table, both with a TTL.
+
+    Misses ("address not found") are cached too, so repeated bad queries
+    don't reach the provider either.
+    """
+
+    def __init__(self, path: Optional[Path], max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._memory: "OrderedDict[str, Tuple[Optional[Coordinates], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode "
+                "(query TEXT PRIMARY KEY, lat REAL, lon REAL, expires REAL)"
+            )
+            self._db.commit()
+
+    def get(self, query: str) -> Tuple[bool, Optional[Coordinates]]:
+        """Return (hit, coordinates); coordinates is None for a cached miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(query)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(query)
+                    return True, entry[0]
+                del self._memory[query]
+
+            if self._db is None:
+                return False, None
+            row = self._db.execute(
+                "SELECT lat, lon, expires FROM geocode WHERE query = ?", (query,)
+            ).fetchone()
+        if row is None or row[2] <= now:
+            return False, None
+        coords = (row[0], row[1]) if row[0] is not None else None
+        self._remember(query, coords, row[2])
+        return True, coords
+
+    def set(self, query: str, coords: Optional[Coordinates]) -> None:
+        expires = time.time() + self.ttl_s
+        self._remember(query, coords, expires)
+        if self._db is not None:
+            lat, lon = coords if coords else (None, None)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO geocode (query, lat, lon, expires) VALUES (?, ?, ?, ?)",
+                    (query, lat, lon, expires)
+                )
+                self._db.commit()
+
+    def _remember(self, query: str, coords: Optional[Coordinates], expires: float) -> None:
+        with self._lock:
+            self._memory[query] = (coords, expires)
+            self._memory.move_to_end(query)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+# Provider factories by name, in the order given by settings.geocoder_providers.
+# A factory returns None when the provider isn't configured.
+PROVIDERS: Dict[str, Callable[[], Optional[GeocodingProvider]]] = {
+    "nominatim": NominatimProvider,
+    "gazetteer": lambda: GazetteerProvider(settings.gazetteer_path) if settings.gazetteer_path else None,
+}
+
+
+def register_provider(name: str, factory: Callable[[], Optional[GeocodingProvider]]) -> None:
+    """Make a provider available to settings.geocoder_providers."""
+    PROVIDERS[name] = factory
+
+
+class Geocoder:
+    """Cache in front of a chain of providers; the first answer wins."""
+
+    def __init__(self, providers: List[GeocodingProvider], cache: GeocodeCache):
+        self.providers = providers
+        self.cache = cache
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def geocode(self, address: str) -> Optional[Coordinates]:
+        query = normalize_query(address)
+        if not query:
+            return None
+
+        hit, coords = await run_in_threadpool(self.cache.get, query)
+        if hit:
+            return coords
+
+        # Identical concurrent misses share one upstream lookup. It runs as a
+        # task of its own, so a caller going away doesn't cancel it for the others
+        task = self._in_flight.get(query)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup(address, query))
+            self._in_flight[query] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(query, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, address: str, query: str) -> Optional[Coordinates]:
+        coords = None
+        failures = 0
+        for provider in self.providers:
+            try:
+                coords = await provider.geocode(query)
+            except Exception as e:
+                # Provider failure: the next provider may still answer
+                failures += 1
+                logger.warning(
+                    "Geocoding error",
+                    extra={"provider": provider.name, "address": address, "error": str(e)}
+                )
+                continue
+            if coords is not None:
+                break
+
+        # A miss is only cached when every provider answered: one that failed
+        # may still know the address on the next call
+        if coords is not None or failures == 0:
+            await run_in_threadpool(self.cache.set, query, coords)
+        return coords
+
+    async def close(self) -> None:
+        for provider in self.providers:
+            await provider.close()
+
+
+_geocoder: Optional[Geocoder] = None
+
+
+def get_geocoder() -> Geocoder:
+    """Process-wide geocoder built from settings on first use."""
+    global _geocoder
+    if _geocoder is None:
+        providers = []
+        for name in settings.geocoder_providers:
+            provider = PROVIDERS[name]()
+            if provider is not None:
+                providers.append(provider)
+        cache_path = settings.data_dir / "geocode_cache.sqlite" if settings.geocode_disk_cache else None
+        cache = GeocodeCache(cache_path, settings.geocode_cache_size, settings.geocode_cache_ttl_s)
+        _geocoder = Geocoder(providers, cache)
+    return _geocoder
+
+
+async def close_geocoder() -> None:
+    """Release the pooled HTTP client (called on application shutdown)."""
+    global _geocoder
+    if _geocoder is not None:
+        await _geocoder.close()
+        _geocoder = None
+
+
+async def geocode_address(address: str) -> Optional[Coordinates]:
+    """
+    Geocode an address.
+
     Args:
         address: Address string to geocode
-    
+
     Returns:
         Tuple of (lat, lon) or None if not found
     """
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {
-        "q": address,
-        "format": "json",
-        "limit": 1
-    }
-    headers = {
-        "User-Agent": "ShapeRouteGenerator/0.1"
-    }
-    
-    try:
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        results = response.json()
-        if results and len(results) > 0:
-            lat = float(results[0]["lat"])
-            lon = float(results[0]["lon"])
-            return (lat, lon)
-        
-        return None
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-        return None
-
+    return await get_geocoder().geocode(address)
@@ -0,0 +1,211 @@
+"""Street graphs shared by all worker processes through memory-mapped files.
+
+Each region is saved once as a directory of .npy arrays (see
+compact_graph.save_graph). Workers map those files read-only, so however
+many uvicorn workers serve a city, its graph sits in memory once, in the
+OS page cache.
+
+A worker holding a region in its in-memory cache registers a reference (a
+marker file named after its pid). When the store grows past its size
+limit, the least recently used regions that no live process references
+are deleted.
+"""
+import json
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional
+
+from app.services.compact_graph import CompactGraph, load_graph, save_graph
+
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock shared by all worker processes on this machine."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ~10 s; keep waiting for the loader
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def try_file_lock(path: Path) -> Optional[BinaryIO]:
+    """
+    Take an exclusive lock without waiting.
+
+    Returns:
+        The open lock file (the lock lasts until it is closed), or None if
+        another process holds the lock
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    f = open(path, "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # No cheap liveness check: markers of dead processes expire with the region
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class GraphStore:
+    """
+    Directory of memory-mappable graphs with cross-process references.
+
+    Layout under `root`: ``<region>/`` holds the arrays of one graph and
+    ``refs/<region>/<pid>`` marks a process currently holding it.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._refs = root / "refs"
+
+    def _dir(self, name: str) -> Path:
+        return self.root / name
+
+    def load(self, name: str, max_age_s: float) -> Optional[CompactGraph]:
+        """Map a stored graph, or None if it is missing or older than max_age_s."""
+        directory = self._dir(name)
+        meta = directory / "meta.json"
+        try:
+            if time.time() - meta.stat().st_mtime >= max_age_s:
+                return None
+            graph = load_graph(directory)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        # Directory mtime records the last use, for eviction
+        os.utime(directory)
+        return graph
+
+    def save(self, name: str, graph: CompactGraph) -> CompactGraph:
+        """
+        Store a graph (replacing any previous version) and map it back.
+
+        Callers hold the region's lock, so there's a single writer. Processes
+        still mapping a replaced version keep reading it until they drop it.
+
+        Returns:
+            The memory-mapped stored graph
+        """
+        directory = self._dir(name)
+        tmp_dir = directory.with_name(f"{name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        save_graph(graph, tmp_dir)
+        if directory.exists():
+            old_dir = directory.with_name(f"{name}.{os.getpid()}.old")
+            os.replace(directory, old_dir)
+            os.replace(tmp_dir, directory)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, directory)
+        return load_graph(directory)
+
+    def acquire(self, name: str) -> None:
+        """Mark the region as used by this process."""
+        marker = self._refs / name / str(os.getpid())
+        marker.parent.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+
+    def release(self, name: str) -> None:
+        """Drop this process's reference to the region."""
+        try:
+            (self._refs / name / str(os.getpid())).unlink()
+        except FileNotFoundError:
+            pass
+
+    def references(self, name: str) -> List[int]:
+        """Pids of live processes holding the region; stale markers are removed."""
+        pids = []
+        for marker in (self._refs / name).glob("*"):
+            try:
+                pid = int(marker.name)
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                pids.append(pid)
+            else:
+                marker.unlink(missing_ok=True)
+        return pids
+
+    def size(self, name: str) -> int:
+        return sum(f.stat().st_size for f in self._dir(name).glob("*") if f.is_file())
+
+    def regions(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return [
+            p.name for p in self.root.iterdir()
+            # Skip versions being written or replaced by a save
+            if p.is_dir() and p.name != "refs" and p.suffix not in (".tmp", ".old")
+            and (p / "meta.json").exists()
+        ]
+
+    def evict(self) -> List[str]:
+        """
+        Delete least recently used, unreferenced regions until the store fits max_bytes.
+
+        Returns:
+            Names of the evicted regions
+        """
+        with file_lock(self.root / ".evict.lock"):
+            regions = sorted(self.regions(), key=lambda name: self._dir(name).stat().st_mtime)
+            sizes = {name: self.size(name) for name in regions}
+            total = sum(sizes.values())
+            evicted = []
+            for name in regions:
+                if total <= self.max_bytes:
+                    break
+                if self.references(name):
+                    continue
+                # Mapped pages stay valid for any process that still has them open
+                shutil.rmtree(self._dir(name), ignore_errors=True)
+                shutil.rmtree(self._refs / name, ignore_errors=True)
+                total -= sizes[name]
+                evicted.append(name)
+        if evicted:
+            logger.info("Graph store evicted regions", extra={"regions": evicted, "bytes": total})
+        return evicted
@@ -0,0 +1,82 @@
+"""Shortest leg paths shared by all candidates of a route search.
+
+Candidates of one search (every rotation/scale placement) snap to many of
+the same street nodes, so the same legs come up again and again. A
+LegCache runs one Dijkstra per distinct leg start node and keeps it: a
+later leg from the same node resumes that search only as far as its end
+node (often already settled), and a leg seen before costs a dict lookup.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from app.core.metrics import timed, ROUTE_LEGS
+from app.services.compact_graph import CompactGraph, OneToManySearch
+from app.services.osm import shortest_path
+
+
+class LegCache:
+    """
+    Leg paths between node pairs on one graph, computed at most once.
+
+    Searches from a node stop at `max_leg_m`: a longer leg is looked up with
+    a plain shortest path instead of growing the shared search further.
+    """
+
+    def __init__(
+        self,
+        graph: CompactGraph,
+        max_leg_m: float = float("inf"),
+        known_legs: Iterable[List[int]] = ()
+    ):
+        """
+        Args:
+            graph: Graph the legs are computed on
+            max_leg_m: Search bound of each one-to-many Dijkstra
+            known_legs: Paths already computed on this graph, reused as they are
+        """
+        self.graph = graph
+        self.max_leg_m = max_leg_m
+        self._paths: Dict[Tuple[int, int], List[int]] = {
+            (leg[0], leg[-1]): leg for leg in known_legs if len(leg) > 1
+        }
+        self._searches: Dict[int, OneToManySearch] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, start: int, end: int) -> List[int]:
+        """
+        Shortest path from start to end.
+
+        Returns:
+            List of node IDs; just [start] if end is unreachable
+
+        Raises:
+            KeyError: If either node isn't in the graph
+        """
+        key = (start, end)
+        path = self._paths.get(key)
+        if path is not None:
+            self.hits += 1
+            ROUTE_LEGS.inc(outcome="hit")
+            return path
+
+        self.misses += 1
+        ROUTE_LEGS.inc(outcome="miss")
+        for node in key:
+            if not self.graph.has_node(node):
+                raise KeyError(f"Node {node} not in graph")
+
+        with timed("shortest_path"):
+            search = self._searches.get(start)
+            if search is None:
+                search = self._searches[start] = OneToManySearch(start)
+            if search.run_until(self.graph, end, self.max_leg_m):
+                path = search.path_to(end)
+            elif search.exhausted:
+                # Unreachable: same answer as shortest_path
+                path = [start]
+            else:
+                # Beyond the bound: rare, don't grow the shared search for it
+                path = shortest_path(self.graph, start, end)
+
+        self._paths[key] = path
+        return path
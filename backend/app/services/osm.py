@@ -1,115 +1,398 @@
 """Service for loading and caching OpenStreetMap data."""
-import pickle
+import logging
+import math
+import threading
+import weakref
+from collections import OrderedDict
 from pathlib import Path
-from typing import Tuple
-import osmnx as ox
-import networkx as nx
+from typing import TYPE_CHECKING, Callable, Dict, Tuple
+import numpy as np
 
 from app.core.settings import settings
+from app.core.startup import timed_import
+from app.services.compact_graph import CompactGraph, OneToManySearch, compact_graph
+from app.services.graph_store import GraphStore, file_lock
 
+if TYPE_CHECKING:
+    import networkx as nx
 
-# Configure osmnx
-ox.settings.use_cache = True
-ox.settings.cache_folder = str(settings.osm_cache_dir)
+
+logger = logging.getLogger(__name__)
+
+_osmnx = None
+_osmnx_lock = threading.Lock()
+
+
+def get_osmnx():
+    """
+    Import and configure osmnx on first use.
+    
+    osmnx pulls in geopandas, shapely, pandas and scikit-learn; it's only
+    needed to download a region, so the API doesn't import it at startup.
+    """
+    global _osmnx
+    if _osmnx is None:
+        with _osmnx_lock:
+            if _osmnx is None:
+                ox = timed_import("osmnx")
+                ox.settings.use_cache = True
+                ox.settings.cache_folder = str(settings.osm_cache_dir)
+                ox.settings.overpass_endpoint = settings.overpass_endpoint
+                _osmnx = ox
+    return _osmnx
+
+# Graph centers are snapped to this grid (degrees, ~220 m in latitude) so
+# that nearby start points share one region; the radius is padded to cover
+# the snapping offset.
+REGION_GRID_DEG = 0.002
+REGION_RADIUS_STEP_KM = 0.25
+
+GRAPHS_DIR = settings.osm_cache_dir / "graphs"
+LOCKS_DIR = settings.osm_cache_dir / "locks"
+
+
+def region_key(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float]:
+    """
+    Quantize a graph request to a shared region.
+    
+    Returns:
+        (center_lat, center_lon, radius_km) of a region that fully covers
+        the requested circle.
+    """
+    center_lat = round(lat / REGION_GRID_DEG) * REGION_GRID_DEG
+    center_lon = round(lon / REGION_GRID_DEG) * REGION_GRID_DEG
+    # Worst-case offset between the requested and snapped centers
+    offset_km = math.hypot(
+        REGION_GRID_DEG / 2 * 111.0,
+        REGION_GRID_DEG / 2 * 111.0 * math.cos(math.radians(lat))
+    )
+    radius = math.ceil((radius_km + offset_km) / REGION_RADIUS_STEP_KM) * REGION_RADIUS_STEP_KM
+    return round(center_lat, 6), round(center_lon, 6), radius
+
+
+def _region_name(key: Tuple[float, float, float]) -> str:
+    lat, lon, radius = key
+    return f"{settings.osm_network_type}_{lat:.4f}_{lon:.4f}_{radius:.1f}"
+
+
+class _SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result."""
+    
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, "_SingleFlight._Call"] = {}
+    
+    def do(self, key: str, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+_loads = _SingleFlight()
+_store = GraphStore(GRAPHS_DIR, int(settings.graph_store_max_mb * 1024 * 1024))
+_memory_cache: "OrderedDict[str, CompactGraph]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _remember(name: str, graph: CompactGraph) -> None:
+    with _memory_lock:
+        _memory_cache[name] = graph
+        _memory_cache.move_to_end(name)
+        while len(_memory_cache) > settings.graph_cache_size:
+            evicted, _ = _memory_cache.popitem(last=False)
+            # Other workers may now drop the region from the shared store
+            _store.release(evicted)
+
+
+def _undirected() -> bool:
+    if settings.graph_undirected is not None:
+        return settings.graph_undirected
+    # Walking works both ways along every street
+    return settings.osm_network_type == "walk"
+
+
+def _compact(graph: "nx.MultiDiGraph", key: Tuple[float, float, float]) -> CompactGraph:
+    """Keep only what routing needs from a downloaded graph."""
+    # Imported here: the circuity model builds on this module's spatial index
+    from app.services.circuity import CircuityModel
+    
+    compact = compact_graph(graph, undirected=_undirected())
+    compact.graph = {"crs": graph.graph.get("crs"), "region": key}
+    # Stored with the graph, so workers mapping it don't estimate it again
+    compact.graph["circuity"] = CircuityModel.estimate(compact).to_list()
+    return compact
+
+
+def _load_region(key: Tuple[float, float, float]) -> CompactGraph:
+    """Map a region from the shared graph store, downloading it at most once."""
+    name = _region_name(key)
+    
+    with file_lock(LOCKS_DIR / f"{name}.lock"):
+        # Reference first: the region must not be evicted while we map it
+        _store.acquire(name)
+        try:
+            # Another worker process may have built it while we waited
+            graph = _store.load(name, settings.graph_cache_ttl_s)
+            if graph is not None:
+                logger.debug("Graph mapped from store", extra={"region": name})
+            else:
+                graph = _store.save(name, _build_region(key))
+                logger.debug(
+                    "Graph stored",
+                    extra={"region": name, "nodes": graph.number_of_nodes(), "bytes": graph.nbytes()}
+                )
+        except BaseException:
+            _store.release(name)
+            raise
+    _store.evict()
+    
+    _remember(name, graph)
+    return graph
+
+
+def _build_region(key: Tuple[float, float, float]) -> CompactGraph:
+    """Download a region and compact it."""
+    center_lat, center_lon, radius_km = key
+    # Use walk network for pedestrian/runner routes
+    graph = get_osmnx().graph_from_point(
+        (center_lat, center_lon),
+        dist=radius_km * 1000,
+        network_type=settings.osm_network_type,
+        simplify=True,
+        truncate_by_edge=True  # Cut exactly at radius for smaller graph
+    )
+    logger.debug("Graph downloaded", extra={"region": _region_name(key)})
+    return _compact(graph, key)
 
 
 def get_graph_around_point(
     lat: float,
     lon: float,
     radius_km: float = None
-) -> nx.MultiDiGraph:
+) -> CompactGraph:
     """
     Load street graph around a point.
     
+    Requests are snapped to a shared region (see region_key). Concurrent
+    requests for the same region wait for a single load, across threads
+    and, through a file lock, across worker processes. Graphs live in a
+    memory-mapped store shared by all workers (see GraphStore), so the
+    returned graph is read-only.
+    
     Args:
         lat: Latitude of center point
         lon: Longitude of center point
         radius_km: Radius in km (defaults to settings value)
     
     Returns:
-        NetworkX MultiDiGraph representing the street network
+        CompactGraph of the street network
     """
     if radius_km is None:
         radius_km = settings.default_graph_radius_km
     
-    # Convert km to meters
-    radius_m = radius_km * 1000
+    key = region_key(lat, lon, radius_km)
+    name = _region_name(key)
     
-    # Download graph
-    # Use walk network for pedestrian/runner routes
-    graph = ox.graph_from_point(
-        (lat, lon),
-        dist=radius_m,
-        network_type=settings.osm_network_type,
-        simplify=True,
-        truncate_by_edge=True  # Cut exactly at radius for smaller graph
-    )
+    with _memory_lock:
+        graph = _memory_cache.get(name)
+        if graph is None:
+            # A larger cached region around a nearby center also covers us
+            for cached_name, cached_graph in _memory_cache.items():
+                if _covers(cached_graph.graph.get("region"), lat, lon, radius_km):
+                    name, graph = cached_name, cached_graph
+                    break
+        if graph is not None:
+            _memory_cache.move_to_end(name)
+            return graph
     
-    return graph
+    return _loads.do(name, lambda: _load_region(key))
+
+
+M_PER_DEG = 111000.0  # Meters per degree of latitude (and of longitude at the equator)
+
+
+def distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Equirectangular distance in meters between two (lat, lon) points a few km apart."""
+    dy = (a[0] - b[0]) * M_PER_DEG
+    dx = (a[1] - b[1]) * M_PER_DEG * math.cos(math.radians(a[0]))
+    return math.hypot(dx, dy)
+
+
+def _covers(region: Tuple[float, float, float], lat: float, lon: float, radius_km: float) -> bool:
+    """True if the region's circle contains the circle of radius_km around (lat, lon)."""
+    if region is None:
+        return False
+    center_lat, center_lon, region_radius_km = region
+    return distance_m((lat, lon), (center_lat, center_lon)) / 1000.0 + radius_km <= region_radius_km
+
+
+def offsets_to_latlon(offsets_m: np.ndarray, lat: float, lon: float) -> np.ndarray:
+    """
+    Place (north, east) offsets in meters around a point.
+    
+    Local equirectangular projection: a degree of longitude shrinks with
+    cos(latitude), so shapes keep their proportions at any latitude.
+    
+    Args:
+        offsets_m: (n, 2) array of (north, east) offsets in meters
+        lat: Latitude of the origin
+        lon: Longitude of the origin
+    
+    Returns:
+        (n, 2) array of (lat, lon)
+    """
+    lon_m = M_PER_DEG * max(math.cos(math.radians(lat)), 1e-6)
+    return np.column_stack([lat + offsets_m[:, 0] / M_PER_DEG, lon + offsets_m[:, 1] / lon_m])
+
+
+class SpatialIndex:
+    """
+    KD-tree over graph nodes for nearest-node queries.
+    
+    Coordinates are scaled to a local equirectangular plane (longitude
+    compressed by cos(latitude)) so Euclidean nearest matches great-circle
+    nearest at city scale. Plane distances are in degrees of latitude
+    (x M_PER_DEG for meters).
+    """
+    
+    def __init__(self, graph: CompactGraph):
+        from scipy.spatial import cKDTree
+        
+        lats, lons = graph.lats, graph.lons
+        self.lon_scale = math.cos(math.radians(float(lats.mean()))) if len(lats) else 1.0
+        self._tree = cKDTree(np.column_stack([lats, lons * self.lon_scale]))
+    
+    def to_plane(self, lats, lons) -> np.ndarray:
+        """Project points to the index's plane as an (n, 2) array."""
+        return np.column_stack([np.asarray(lats, dtype=float), np.asarray(lons, dtype=float) * self.lon_scale])
+    
+    def query(self, lats, lons) -> np.ndarray:
+        """Return the nearest node index for each point."""
+        _, idx = self._tree.query(self.to_plane(lats, lons))
+        return idx
+    
+    def plane_distances(self, points: np.ndarray) -> np.ndarray:
+        """Distance in the plane (degrees) from each plane point to its nearest node."""
+        distances, _ = self._tree.query(points)
+        return distances
+
+
+# Derived indexes live as long as their graph
+_spatial_indexes: "weakref.WeakKeyDictionary[CompactGraph, SpatialIndex]" = weakref.WeakKeyDictionary()
+_spatial_index_lock = threading.Lock()
 
 
-def nearest_node(graph: nx.MultiDiGraph, lat: float, lon: float) -> int:
+def get_spatial_index(graph: CompactGraph) -> SpatialIndex:
+    """Return the graph's spatial index, building it on first use."""
+    index = _spatial_indexes.get(graph)
+    if index is None:
+        with _spatial_index_lock:
+            index = _spatial_indexes.get(graph)
+            if index is None:
+                index = _spatial_indexes[graph] = SpatialIndex(graph)
+    return index
+
+
+def nearest_node(graph: CompactGraph, lat: float, lon: float) -> int:
     """
     Find the nearest graph node to a lat/lon point.
     
     Args:
-        graph: NetworkX graph
+        graph: Compact street graph
         lat: Latitude
         lon: Longitude
     
     Returns:
-        Node ID of nearest node
+        Index of nearest node
     """
-    return ox.nearest_nodes(graph, lon, lat)
+    return nearest_nodes(graph, [lat], [lon])[0]
 
 
-def shortest_path(graph: nx.MultiDiGraph, start_node: int, end_node: int) -> list:
+def nearest_nodes(graph: CompactGraph, lats: list, lons: list) -> list:
     """
-    Calculate shortest path between two nodes.
+    Find the nearest graph node to each of many lat/lon points.
+    
+    Uses the graph's cached spatial index (built once per graph).
     
     Args:
-        graph: NetworkX graph
-        start_node: Starting node ID
-        end_node: Ending node ID
+        graph: Compact street graph
+        lats: Latitudes
+        lons: Longitudes
     
     Returns:
-        List of node IDs representing the path
+        List of node indices, one per point
+    """
+    return get_spatial_index(graph).query(lats, lons).tolist()
+
+
+def shortest_path(graph: CompactGraph, start_node: int, end_node: int) -> list:
+    """
+    Calculate shortest path between two nodes.
     
-    Raises:
-        nx.NetworkXNoPath: If no path exists
+    Args:
+        graph: Compact street graph
+        start_node: Starting node index
+        end_node: Ending node index
+    
+    Returns:
+        List of node indices representing the path, just the start
+        node if no path exists
     """
-    try:
-        return nx.shortest_path(graph, start_node, end_node, weight='length')
-    except nx.NetworkXNoPath:
-        # Return just the start node if no path found
-        return [start_node]
+    search = OneToManySearch(start_node)
+    if search.run_until(graph, end_node):
+        return search.path_to(end_node)
+    # Return just the start node if no path found
+    return [start_node]
 
 
-def nodes_to_coordinates(graph: nx.MultiDiGraph, nodes: list) -> list:
+def nodes_to_coordinates(graph: CompactGraph, nodes: list) -> list:
     """
-    Convert a list of node IDs to (lat, lon) coordinates.
+    Convert a list of node indices to (lat, lon) coordinates.
     
     Args:
-        graph: NetworkX graph
-        nodes: List of node IDs
+        graph: Compact street graph
+        nodes: List of node indices
     
     Returns:
         List of (lat, lon) tuples
     """
-    coords = []
-    for node in nodes:
-        node_data = graph.nodes[node]
-        coords.append((node_data['y'], node_data['x']))
-    return coords
+    if not len(nodes):
+        return []
+    return [(lat, lon) for lat, lon in graph.coordinates(nodes).tolist()]
 
 
-def calculate_path_length(graph: nx.MultiDiGraph, nodes: list) -> float:
+def calculate_path_length(graph: CompactGraph, nodes: list) -> float:
     """
     Calculate total length of a path in meters.
     
     Args:
-        graph: NetworkX graph
-        nodes: List of node IDs
+        graph: Compact street graph
+        nodes: List of node indices
     
     Returns:
         Total path length in meters
@@ -117,15 +400,9 @@ def calculate_path_length(graph: nx.MultiDiGraph, nodes: list) -> float:
     total_length = 0.0
     
     for i in range(len(nodes) - 1):
-        u, v = nodes[i], nodes[i + 1]
-        # Get edge data
-        if graph.has_edge(u, v):
-            edge_data = graph.get_edge_data(u, v)
-            # Handle MultiDiGraph (multiple edges between nodes)
-            if isinstance(edge_data, dict) and 0 in edge_data:
-                total_length += edge_data[0].get('length', 0)
-            else:
-                total_length += edge_data.get('length', 0)
+        # Consecutive nodes without an edge between them add nothing
+        length = graph.edge_length(nodes[i], nodes[i + 1])
+        if length is not None:
+            total_length += length
     
     return total_length
-
@@ -0,0 +1,507 @@
+"""Off-peak precomputation of popular symbols into the route library.
+
+Live requests consult the route library before searching (see
+search_route_with_library). This fills it ahead of time: for each
+configured region, a grid of start points x the most requested symbols
+(or a configured list) x common distances is queued in a local SQLite job
+queue, and worked off by low-priority processes during the configured
+off-peak window. Every result is stored as a precomputed library route, so
+at peak hours a request starting near a grid point is answered from the
+library, and one between grid points starts from a placement known to
+work nearby.
+
+Only one process per data directory runs the scheduler (a file lock picks
+it among the API workers). Jobs survive restarts; routes are recomputed
+after precompute_refresh_s, when the street graphs may have changed.
+
+Usage (from the backend directory, e.g. from cron instead of the API):
+
+    python -m app.services.precompute            # queue status
+    python -m app.services.precompute --plan     # queue jobs for the configured regions
+    python -m app.services.precompute --run      # work off pending jobs now, ignoring the window
+"""
+import argparse
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.metrics import PRECOMPUTE_JOBS
+from app.core.settings import settings
+from app.services.graph_store import try_file_lock
+from app.services.osm import M_PER_DEG
+from app.services.route_library import PLACEMENT_VERSION, get_route_library
+from app.services.routing import search_route
+from app.services.shapes import load_symbol
+
+
+logger = logging.getLogger(__name__)
+
+# Attempts before a job is marked failed
+MAX_ATTEMPTS = 3
+# Seconds between scheduler passes (and between leader election tries)
+POLL_INTERVAL_S = 1.0
+LEADER_RETRY_S = 60.0
+
+
+def grid_points(lat: float, lon: float, radius_km: float, step_m: float) -> List[Tuple[float, float]]:
+    """
+    Square grid of start points within a circle, nearest the center first.
+
+    Args:
+        lat: Latitude of the region's center
+        lon: Longitude of the region's center
+        radius_km: Radius of the region
+        step_m: Grid spacing in meters
+
+    Returns:
+        List of (lat, lon)
+    """
+    radius_m = radius_km * 1000.0
+    steps = int(radius_m // step_m)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    points = []
+    for i in range(-steps, steps + 1):
+        for j in range(-steps, steps + 1):
+            north_m, east_m = i * step_m, j * step_m
+            if math.hypot(north_m, east_m) <= radius_m:
+                points.append((math.hypot(north_m, east_m), north_m, east_m))
+    points.sort()
+    return [
+        (round(lat + north_m / M_PER_DEG, 6), round(lon + east_m / (M_PER_DEG * cos_lat), 6))
+        for _, north_m, east_m in points
+    ]
+
+
+def _window_minutes(window: str) -> Tuple[int, int]:
+    """Start and end minute of the day of an "HH:MM-HH:MM" window."""
+    def parse(hhmm: str) -> int:
+        hours, _, minutes = hhmm.strip().partition(":")
+        return int(hours) * 60 + int(minutes or 0)
+
+    start, _, end = window.partition("-")
+    return parse(start), parse(end)
+
+
+def in_window(window: str, now: Optional[datetime] = None) -> bool:
+    """
+    True if the local time is within an "HH:MM-HH:MM" window (may wrap midnight).
+
+    An empty window is always open.
+    """
+    if not window:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    start_minute, end_minute = _window_minutes(window)
+    if start_minute <= end_minute:
+        return start_minute <= minute < end_minute
+    return minute >= start_minute or minute < end_minute
+
+
+def window_s(window: str) -> float:
+    """Length of a window in seconds (a whole day if empty)."""
+    if not window:
+        return 24 * 3600.0
+    start_minute, end_minute = _window_minutes(window)
+    return ((end_minute - start_minute) % (24 * 60)) * 60.0
+
+
+def plan_jobs(
+    symbols: List[str],
+    regions: List[Tuple[float, float, float]],
+    distances_km: List[float],
+    step_m: float
+) -> List[Tuple[str, float, float, float, int]]:
+    """
+    Jobs of symbols x region grids x distances.
+
+    Args:
+        symbols: Symbol ids, most popular first
+        regions: (lat, lon, radius_km) of each region
+        distances_km: Target distances
+        step_m: Grid spacing in meters
+
+    Returns:
+        (symbol_id, lat, lon, distance_km, priority) of each job
+    """
+    jobs = []
+    for region in regions:
+        points = grid_points(*region, step_m)
+        for rank, symbol_id in enumerate(symbols):
+            for distance_km in distances_km:
+                for index, (lat, lon) in enumerate(points):
+                    # Every symbol's center points before anyone's outskirts
+                    priority = index * len(symbols) + rank
+                    jobs.append((symbol_id, lat, lon, distance_km, priority))
+    return jobs
+
+
+class JobQueue:
+    """
+    Precompute jobs in a SQLite database: one row per symbol x start x distance.
+
+    Jobs go pending -> running -> done, or back to pending on failure until
+    MAX_ATTEMPTS, then failed. Lower priority values run first.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY, symbol_id TEXT, lat REAL, lon REAL, distance_km REAL, "
+            "priority INTEGER, status TEXT DEFAULT 'pending', attempts INTEGER DEFAULT 0, "
+            "updated REAL, seconds REAL, UNIQUE (symbol_id, lat, lon, distance_km))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority)")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != PLACEMENT_VERSION:
+            # The library dropped the routes of finished jobs (see PLACEMENT_VERSION)
+            self._db.execute("UPDATE jobs SET status = 'pending', attempts = 0 WHERE status != 'pending'")
+            self._db.execute(f"PRAGMA user_version = {PLACEMENT_VERSION}")
+        self._db.commit()
+
+    def plan(self, jobs: List[Tuple[str, float, float, float, int]], refresh_s: float) -> int:
+        """
+        Make the queue hold exactly the planned jobs.
+
+        Existing jobs keep their state but get the new priority; routes
+        older than refresh_s are queued again. Jobs no longer planned (their
+        symbol, grid point or distance was dropped) are deleted, unless
+        running.
+
+        Args:
+            jobs: (symbol_id, lat, lon, distance_km, priority) of each job
+            refresh_s: Age after which a finished job runs again
+
+        Returns:
+            Number of jobs planned
+        """
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO jobs (symbol_id, lat, lon, distance_km, priority, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (symbol_id, lat, lon, distance_km) "
+                "DO UPDATE SET priority = excluded.priority",
+                [(*job, now) for job in jobs]
+            )
+            self._db.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS planned "
+                "(symbol_id TEXT, lat REAL, lon REAL, distance_km REAL, "
+                "PRIMARY KEY (symbol_id, lat, lon, distance_km))"
+            )
+            self._db.execute("DELETE FROM planned")
+            self._db.executemany("INSERT OR IGNORE INTO planned VALUES (?, ?, ?, ?)", [job[:4] for job in jobs])
+            self._db.execute(
+                "DELETE FROM jobs WHERE status != 'running' AND NOT EXISTS (SELECT 1 FROM planned p "
+                "WHERE p.symbol_id = jobs.symbol_id AND p.lat = jobs.lat AND p.lon = jobs.lon "
+                "AND p.distance_km = jobs.distance_km)"
+            )
+            self._db.execute("DELETE FROM planned")
+            self._db.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0 "
+                "WHERE status IN ('done', 'failed') AND updated < ?",
+                (now - refresh_s,)
+            )
+            self._db.commit()
+        return len(jobs)
+
+    def claim(self) -> Optional[Tuple[int, str, float, float, float]]:
+        """Mark the next pending job running and return (id, symbol_id, lat, lon, distance_km)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, symbol_id, lat, lon, distance_km FROM jobs "
+                "WHERE status = 'pending' ORDER BY priority LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? "
+                    "WHERE id = ?",
+                    (time.time(), row[0])
+                )
+                self._db.commit()
+        return row
+
+    def finish(self, job_id: int, ok: bool, seconds: Optional[float] = None) -> None:
+        """Record a job's outcome: done, or pending again / failed after MAX_ATTEMPTS."""
+        with self._lock:
+            if ok:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'done', updated = ?, seconds = ? WHERE id = ?",
+                    (time.time(), seconds, job_id)
+                )
+            else:
+                self._db.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "updated = ? WHERE id = ?",
+                    (MAX_ATTEMPTS, time.time(), job_id)
+                )
+            self._db.commit()
+
+    def release_running(self) -> None:
+        """Return running jobs to pending (their process is gone)."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+            self._db.commit()
+
+    def mean_seconds(self) -> Optional[float]:
+        """Mean run time of the finished jobs, or None before any has run."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT AVG(seconds) FROM jobs WHERE status = 'done' AND seconds IS NOT NULL"
+            ).fetchone()
+        return row[0]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs by status."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _lower_priority() -> None:
+    """Pool initializer: leave the CPU to the API workers."""
+    if hasattr(os, "nice"):
+        os.nice(19)
+
+
+def run_job(symbol_id: str, lat: float, lon: float, distance_km: float) -> Tuple[str, float]:
+    """
+    Generate one route and store it in the route library (in a worker process).
+
+    Returns:
+        ("stored", or "no_route" when the search found none; run time in seconds)
+    """
+    started = time.perf_counter()
+    symbol = load_symbol(symbol_id)
+    library = get_route_library()
+    start = (lat, lon)
+    match = library.best_match(
+        symbol_id, start, distance_km,
+        settings.route_library_radius_m, settings.route_library_distance_tolerance
+    )
+    result = search_route(
+        symbol.polyline, lat, lon, distance_km,
+        hint=(match.rotation, match.scale_factor) if match is not None else None
+    )
+    if result.rotation is None:
+        return "no_route", time.perf_counter() - started
+    library.add(symbol_id, start, distance_km, result, precomputed=True)
+    return "stored", time.perf_counter() - started
+
+
+def planned_symbols() -> List[str]:
+    """Configured symbols, else the most requested ones lately."""
+    if settings.precompute_symbols:
+        return list(settings.precompute_symbols)
+    since = time.time() - settings.precompute_refresh_s
+    return get_route_library().popular_symbols(settings.precompute_top_symbols, since)
+
+
+def plan(queue: "JobQueue") -> int:
+    """
+    Queue the configured regions' jobs.
+
+    A plan with more jobs than precompute_max_routes (each job keeps one
+    library route, and routes of jobs no longer planned are dropped) is
+    refused. One that can't run within the off-peak
+    windows of a refresh period is queued with a warning.
+
+    Returns:
+        Number of jobs planned
+    """
+    symbols = planned_symbols()
+    if not symbols:
+        return 0
+    jobs = plan_jobs(
+        symbols,
+        [tuple(region) for region in settings.precompute_regions],
+        settings.precompute_distances_km,
+        settings.precompute_grid_step_m
+    )
+    if len(jobs) > settings.precompute_max_routes:
+        logger.error(
+            "Precompute plan refused: more jobs than PRECOMPUTE_MAX_ROUTES",
+            extra={"jobs": len(jobs), "max_routes": settings.precompute_max_routes}
+        )
+        return 0
+
+    job_s = queue.mean_seconds() or settings.precompute_job_estimate_s
+    needed_s = len(jobs) * job_s / settings.precompute_workers
+    available_s = window_s(settings.precompute_window) * settings.precompute_refresh_s / (24 * 3600.0)
+    if needed_s > available_s:
+        logger.warning(
+            "Precompute plan doesn't fit the off-peak windows of a refresh period",
+            extra={"jobs": len(jobs), "job_s": round(job_s, 2), "needed_h": round(needed_s / 3600.0, 1),
+                   "available_h": round(available_s / 3600.0, 1)}
+        )
+
+    # Routes of jobs no longer planned: the library holds at most one per planned job
+    dropped = get_route_library().drop_precomputed([job[:4] for job in jobs])
+    planned = queue.plan(jobs, settings.precompute_refresh_s)
+    logger.info("Precompute planned", extra={"symbols": symbols, "jobs": planned, "dropped_routes": dropped})
+    return planned
+
+
+class PrecomputeScheduler(threading.Thread):
+    """
+    Works off the job queue with low-priority processes while the window is open.
+
+    Keeps two jobs per worker in flight, plans once per day, and stops the
+    processes when the window closes (jobs in flight are queued again).
+    """
+
+    def __init__(self, window: str, workers: int):
+        super().__init__(name="precompute", daemon=True)
+        self.window = window
+        self.workers = workers
+        self._stop_event = threading.Event()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[Future, int] = {}
+        self._leader_lock = None
+        self._planned_on = None
+
+    def run(self) -> None:
+        queue: Optional[JobQueue] = None
+        next_leader_try = 0.0
+        while not self._stop_event.wait(POLL_INTERVAL_S):
+            if queue is None:
+                if time.monotonic() < next_leader_try:
+                    continue
+                self._leader_lock = try_file_lock(settings.data_dir / "precompute.lock")
+                if self._leader_lock is None:
+                    next_leader_try = time.monotonic() + LEADER_RETRY_S
+                    continue
+                logger.info("Precompute scheduler leading")
+                queue = JobQueue(settings.data_dir / "precompute.sqlite")
+                queue.release_running()
+            try:
+                self._step(queue)
+            except Exception as e:
+                logger.error("Precompute pass failed", extra={"error": str(e)})
+        if queue is not None:
+            self._stop_pool(queue)
+            queue.close()
+            self._leader_lock.close()
+
+    def drain(self, queue: JobQueue) -> None:
+        """Work off all pending jobs in the foreground (window and planning aside)."""
+        self._planned_on = datetime.now().date()
+        try:
+            self._step(queue)
+            while self._in_flight:
+                time.sleep(POLL_INTERVAL_S)
+                self._step(queue)
+        finally:
+            self._stop_pool(queue)
+
+    def _step(self, queue: JobQueue) -> None:
+        self._collect(queue)
+        if not in_window(self.window):
+            if self._pool is not None:
+                self._stop_pool(queue)
+            return
+        today = datetime.now().date()
+        if self._planned_on != today:
+            plan(queue)
+            self._planned_on = today
+        if self._pool is None:
+            # spawn: forking a process running threads isn't safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_lower_priority
+            )
+        while len(self._in_flight) < self.workers * 2:
+            job = queue.claim()
+            if job is None:
+                break
+            job_id, *args = job
+            self._in_flight[self._pool.submit(run_job, *args)] = job_id
+
+    def _collect(self, queue: JobQueue) -> None:
+        for future in [f for f in self._in_flight if f.done()]:
+            job_id = self._in_flight.pop(future)
+            try:
+                outcome, seconds = future.result()
+            except Exception as e:
+                outcome, seconds = "failed", None
+                logger.warning("Precompute job failed", extra={"job": job_id, "error": str(e)})
+            PRECOMPUTE_JOBS.inc(outcome=outcome)
+            # No route is an answer too: retrying won't change it
+            queue.finish(job_id, outcome != "failed", seconds)
+
+    def _stop_pool(self, queue: JobQueue) -> None:
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._in_flight.clear()
+        queue.release_running()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+_scheduler: Optional[PrecomputeScheduler] = None
+
+
+def start_scheduler() -> None:
+    """Start the background scheduler (once per process; one process leads)."""
+    global _scheduler
+    if _scheduler is not None:
+        return
+    if not settings.route_library_enabled:
+        logger.warning("Precompute needs the route library, which is disabled")
+        return
+    _scheduler = PrecomputeScheduler(settings.precompute_window, settings.precompute_workers)
+    _scheduler.start()
+
+
+def stop_scheduler() -> None:
+    """Stop the scheduler and its worker processes."""
+    global _scheduler
+    scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        scheduler.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plan", action="store_true", help="Queue jobs for the configured regions")
+    parser.add_argument("--run", action="store_true", help="Work off pending jobs now, ignoring the window")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=settings.log_level)
+    settings.ensure_directories()
+    lock = try_file_lock(settings.data_dir / "precompute.lock")
+    if lock is None and (args.plan or args.run):
+        print("Another process is running the precompute scheduler", flush=True)
+        return 1
+    queue = JobQueue(settings.data_dir / "precompute.sqlite")
+    if args.plan:
+        print(f"Planned {plan(queue)} jobs")
+    if args.run:
+        queue.release_running()
+        PrecomputeScheduler("", settings.precompute_workers).drain(queue)
+    for status, count in sorted(queue.counts().items()):
+        print(f"{status}: {count}")
+    queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
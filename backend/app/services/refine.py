@@ -0,0 +1,222 @@
+"""Incremental re-routing of a previously generated route.
+
+Every generated route is kept for a while (per worker, in memory) with its
+graph, snapped waypoints and per-leg paths. A refinement (moved start,
+new distance or one dragged waypoint) re-snaps only what moved and
+recomputes only the legs whose end nodes changed; all other legs are
+reused as they are.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import List, Optional, Tuple
+
+from app.core.metrics import timed
+from app.core.settings import settings
+from app.services.compact_graph import CompactGraph
+from app.services.legs import LegCache
+from app.services.osm import (
+    get_graph_around_point,
+    nearest_nodes,
+    nodes_to_coordinates,
+    calculate_path_length
+)
+from app.services.routing import (
+    RouteSearchResult,
+    build_legs,
+    graph_radius_km,
+    join_legs,
+    place_symbol,
+    route_score,
+    snap_polyline_to_graph,
+    unique_consecutive
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RouteState:
+    """Everything needed to refine a generated route without searching again."""
+    symbol_id: str
+    symbol_polyline: List[Tuple[float, float]]
+    start: Tuple[float, float]
+    target_distance_km: float
+    rotation: float
+    scale_factor: float
+    snap_rate: float
+    waypoints: List[int]
+    legs: List[List[int]]
+    graph: CompactGraph
+
+
+class RouteStateStore:
+    """
+    LRU of route states with a TTL, keyed by route id.
+
+    States live in this worker process only. Route ids start with the
+    worker's id, so a request reaching another worker (several uvicorn
+    workers without sticky sessions) is told apart from an expired route.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # Random per process: pids repeat across hosts and restarts
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._states: "OrderedDict[str, Tuple[RouteState, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def owns(self, route_id: str) -> bool:
+        """True if route_id was issued by this worker (whether or not it expired)."""
+        return route_id.startswith(f"{self.worker_id}-")
+
+    def add(self, state: RouteState) -> str:
+        route_id = f"{self.worker_id}-{uuid.uuid4().hex}"
+        with self._lock:
+            self._states[route_id] = (state, time.monotonic() + self.ttl_s)
+            while len(self._states) > self.max_entries:
+                self._states.popitem(last=False)
+        return route_id
+
+    def get(self, route_id: str) -> Optional[RouteState]:
+        with self._lock:
+            entry = self._states.get(route_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._states[route_id]
+                return None
+            self._states.move_to_end(route_id)
+            return entry[0]
+
+
+route_states = RouteStateStore(settings.route_state_cache_size, settings.route_state_ttl_s)
+
+
+def remember_route(
+    result: RouteSearchResult,
+    symbol_id: str,
+    symbol_polyline: List[Tuple[float, float]],
+    start: Tuple[float, float],
+    target_distance_km: float
+) -> Optional[str]:
+    """
+    Keep a search result for later refinement.
+
+    Returns:
+        Route id, or None if the search found no route
+    """
+    if not result.waypoints or result.graph is None:
+        return None
+    return route_states.add(RouteState(
+        symbol_id=symbol_id,
+        symbol_polyline=symbol_polyline,
+        start=start,
+        target_distance_km=target_distance_km,
+        rotation=result.rotation,
+        scale_factor=result.scale_factor,
+        snap_rate=result.snap_rate,
+        waypoints=result.waypoints,
+        legs=result.legs,
+        graph=result.graph
+    ))
+
+
+def waypoint_coordinates(graph: Optional[CompactGraph], waypoints: List[int]) -> List[Tuple[float, float]]:
+    """(lat, lon) of each snapped waypoint, for the client to drag."""
+    if graph is None:
+        return []
+    return nodes_to_coordinates(graph, waypoints)
+
+
+def refine_route(
+    state: RouteState,
+    start: Optional[Tuple[float, float]] = None,
+    target_distance_km: Optional[float] = None,
+    waypoint: Optional[Tuple[int, float, float]] = None
+) -> Tuple[RouteSearchResult, RouteState, int]:
+    """
+    Recompute a route after a small edit, reusing unchanged legs.
+
+    A new start or distance re-places the symbol with the route's rotation
+    and scale factor and re-snaps it; a moved waypoint only re-snaps that
+    waypoint. Legs whose (start, end) nodes didn't change are reused.
+
+    Args:
+        state: Route to refine
+        start: New (lat, lon) start point
+        target_distance_km: New target distance
+        waypoint: (index, lat, lon) of a waypoint to move, applied last
+
+    Returns:
+        Tuple of (result, new_state, legs_recomputed)
+
+    Raises:
+        IndexError: If the waypoint index is out of range
+    """
+    started = time.perf_counter()
+    start = start or state.start
+    target_distance_km = target_distance_km or state.target_distance_km
+    graph = state.graph
+    waypoints = state.waypoints
+    snap_rate = state.snap_rate
+
+    if start != state.start or target_distance_km != state.target_distance_km:
+        # Usually the same cached graph; a larger one if the route outgrew it
+        with timed("graph_load"):
+            graph = get_graph_around_point(start[0], start[1], graph_radius_km(target_distance_km))
+        placed = place_symbol(
+            state.symbol_polyline, state.rotation,
+            target_distance_km * 1000.0 * state.scale_factor,
+            start[0], start[1]
+        )
+        with timed("snap"):
+            snapped_nodes, snap_rate = snap_polyline_to_graph(placed, graph)
+        waypoints = unique_consecutive(snapped_nodes)
+
+    if waypoint is not None:
+        index, lat, lon = waypoint
+        if not 0 <= index < len(waypoints):
+            raise IndexError(f"Waypoint index {index} out of range (route has {len(waypoints)})")
+        with timed("snap"):
+            node = nearest_nodes(graph, [lat], [lon])[0]
+        waypoints = unique_consecutive(waypoints[:index] + [node] + waypoints[index + 1:])
+
+    # Legs of the previous route are valid only on the graph they came from
+    leg_cache = LegCache(graph, known_legs=state.legs if graph is state.graph else ())
+    legs = build_legs(graph, waypoints, leg_cache)
+    recomputed = leg_cache.misses
+
+    route_nodes = join_legs(legs)
+    with timed("path_length"):
+        distance_m = calculate_path_length(graph, route_nodes)
+    distance_error = abs(distance_m / 1000.0 - target_distance_km) / target_distance_km
+    with timed("serialize"):
+        coordinates = nodes_to_coordinates(graph, route_nodes) if route_nodes else [start]
+
+    new_state = replace(
+        state, start=start, target_distance_km=target_distance_km,
+        snap_rate=snap_rate, waypoints=waypoints, legs=legs, graph=graph
+    )
+    result = RouteSearchResult(
+        coordinates, distance_m,
+        score=route_score(snap_rate, distance_error),
+        snap_rate=snap_rate,
+        rotation=state.rotation,
+        scale_factor=state.scale_factor,
+        waypoints=waypoints,
+        legs=legs,
+        graph=graph,
+        stop_reason="refined",
+        elapsed_ms=(time.perf_counter() - started) * 1000.0
+    )
+    logger.info(
+        "Route refined",
+        extra={"legs": len(legs), "recomputed": recomputed, "distance_km": round(distance_m / 1000, 2)}
+    )
+    return result, new_state, recomputed
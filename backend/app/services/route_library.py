@@ -0,0 +1,411 @@
+"""Library of generated routes, searchable by symbol and start point.
+
+Popular symbols are requested again and again from nearby start points.
+Every generated route is stored (SQLite, with an R*Tree index on its start
+point) with the placement that produced it. A new request for the same
+symbol and a similar distance then:
+
+- replays the placement of a stored route that starts practically at the
+  same point: one candidate routed from the new start, no search
+- otherwise starts the search with the stored placement (rotation, scale)
+  of the best stored route nearby, which usually fits the new start too
+  and ends the search after a single candidate
+"""
+import json
+import logging
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.core.metrics import ROUTE_LIBRARY
+from app.core.settings import settings
+from app.services.compact_graph import CompactGraph
+from app.services.osm import M_PER_DEG, distance_m
+from app.services.routing import RouteSearchResult, is_good_enough, route_placement, search_route
+
+
+logger = logging.getLogger(__name__)
+
+# Best scoring candidates read per lookup (busy spots hold many routes)
+MAX_MATCH_ROWS = 64
+# Route ids between two trims of the oldest request routes
+TRIM_INTERVAL = 1000
+# Meaning of the stored placements (PRAGMA user_version). Bump it when
+# place_symbol changes how rotation and scale_factor place a symbol: routes
+# stored before would be replayed and hinted at the wrong scale.
+# 1: scale_factor relative to the target distance in meters (circuity model)
+PLACEMENT_VERSION = 1
+
+
+@dataclass
+class LibraryRoute:
+    """A stored route and the placement that produced it."""
+    id: int
+    symbol_id: str
+    start: Tuple[float, float]
+    target_distance_km: float
+    distance_m: float
+    score: float
+    snap_rate: float
+    rotation: float
+    scale_factor: float
+    offset_m: float = 0.0  # Distance from the queried start point
+
+
+class RouteLibrary:
+    """
+    Stored routes in a SQLite database shared by all worker processes.
+
+    Start points are indexed with an R*Tree when SQLite has the module, or
+    a (symbol_id, lat, lon) B-tree otherwise. The oldest routes generated
+    for requests are dropped beyond `max_routes` (checked every
+    TRIM_INTERVAL routes). Precomputed routes don't count: each replaces
+    the previous route of its job, and the precompute plan bounds them.
+    """
+
+    def __init__(self, path: Path, max_routes: int):
+        self.max_routes = max_routes
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=10.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # A route lost in a power cut is simply generated again
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            "id INTEGER PRIMARY KEY, symbol_id TEXT, lat REAL, lon REAL, "
+            "target_distance_km REAL, distance_m REAL, score REAL, snap_rate REAL, "
+            "rotation REAL, scale_factor REAL, coordinates TEXT, created REAL, "
+            "precomputed INTEGER DEFAULT 0)"
+        )
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != PLACEMENT_VERSION:
+            # Placements of another version can't be replayed: start over
+            dropped = self._db.execute("DELETE FROM routes").rowcount
+            self._db.execute("DROP TABLE IF EXISTS route_starts")
+            self._db.execute(f"PRAGMA user_version = {PLACEMENT_VERSION}")
+            if dropped:
+                logger.warning(
+                    "Route library placements outdated, routes dropped",
+                    extra={"routes": dropped, "version": version}
+                )
+        # One precomputed route per job (symbol x grid point x distance)
+        self._db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS routes_precomputed "
+            "ON routes (symbol_id, lat, lon, target_distance_km) WHERE precomputed = 1"
+        )
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS route_starts "
+                "USING rtree(id, min_lat, max_lat, min_lon, max_lon)"
+            )
+            self.rtree = True
+        except sqlite3.OperationalError:
+            # SQLite built without R*Tree
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS routes_symbol_start ON routes (symbol_id, lat, lon)"
+            )
+            self.rtree = False
+        self._db.commit()
+
+    def add(
+        self,
+        symbol_id: str,
+        start: Tuple[float, float],
+        target_distance_km: float,
+        result: RouteSearchResult,
+        precomputed: bool = False
+    ) -> int:
+        """
+        Store a generated route.
+
+        Args:
+            symbol_id: Symbol of the route
+            start: (lat, lon) start point
+            target_distance_km: Requested distance
+            result: The search result
+            precomputed: Generated ahead of time rather than for a request;
+                replaces the precomputed route with the same key
+
+        Returns:
+            Id of the stored route
+        """
+        with self._lock:
+            if precomputed:
+                self._delete(
+                    "SELECT id FROM routes WHERE precomputed = 1 AND symbol_id = ? "
+                    "AND lat = ? AND lon = ? AND target_distance_km = ?",
+                    (symbol_id, start[0], start[1], target_distance_km)
+                )
+            cursor = self._db.execute(
+                "INSERT INTO routes (symbol_id, lat, lon, target_distance_km, distance_m, score, "
+                "snap_rate, rotation, scale_factor, coordinates, created, precomputed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    symbol_id, start[0], start[1], target_distance_km, result.distance_m,
+                    result.score, result.snap_rate, result.rotation, result.scale_factor,
+                    json.dumps(result.coordinates), time.time(), int(precomputed)
+                )
+            )
+            route_id = cursor.lastrowid
+            if self.rtree:
+                self._db.execute(
+                    "INSERT INTO route_starts VALUES (?, ?, ?, ?, ?)",
+                    (route_id, start[0], start[0], start[1], start[1])
+                )
+            if route_id % TRIM_INTERVAL == 0:
+                self._trim()
+            self._db.commit()
+        return route_id
+
+    def _delete(self, select_ids: str, params: tuple) -> int:
+        """Delete the routes whose ids a query selects (lock held, no commit)."""
+        ids = [(row[0],) for row in self._db.execute(select_ids, params)]
+        if self.rtree:
+            self._db.executemany("DELETE FROM route_starts WHERE id = ?", ids)
+        self._db.executemany("DELETE FROM routes WHERE id = ?", ids)
+        return len(ids)
+
+    def _trim(self) -> None:
+        """Drop the oldest request routes beyond max_routes (lock held, no commit)."""
+        # Ids grow with insertion order
+        row = self._db.execute(
+            "SELECT id FROM routes WHERE precomputed = 0 ORDER BY id DESC LIMIT 1 OFFSET ?",
+            (self.max_routes,)
+        ).fetchone()
+        if row is not None:
+            dropped = self._delete(
+                "SELECT id FROM routes WHERE precomputed = 0 AND id <= ?", (row[0],)
+            )
+            logger.info("Route library trimmed", extra={"routes": dropped})
+
+    def drop_precomputed(self, keep: List[Tuple[str, float, float, float]]) -> int:
+        """
+        Delete the precomputed routes of jobs no longer planned.
+
+        Args:
+            keep: (symbol_id, lat, lon, target_distance_km) of the planned jobs
+
+        Returns:
+            Number of routes deleted
+        """
+        with self._lock:
+            self._db.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS kept "
+                "(symbol_id TEXT, lat REAL, lon REAL, target_distance_km REAL, "
+                "PRIMARY KEY (symbol_id, lat, lon, target_distance_km))"
+            )
+            self._db.execute("DELETE FROM kept")
+            self._db.executemany("INSERT OR IGNORE INTO kept VALUES (?, ?, ?, ?)", keep)
+            dropped = self._delete(
+                "SELECT id FROM routes r WHERE precomputed = 1 AND NOT EXISTS (SELECT 1 FROM kept k "
+                "WHERE k.symbol_id = r.symbol_id AND k.lat = r.lat AND k.lon = r.lon "
+                "AND k.target_distance_km = r.target_distance_km)",
+                ()
+            )
+            self._db.execute("DELETE FROM kept")
+            self._db.commit()
+        return dropped
+
+    def best_match(
+        self,
+        symbol_id: str,
+        start: Tuple[float, float],
+        target_distance_km: float,
+        radius_m: float,
+        distance_tolerance: float
+    ) -> Optional[LibraryRoute]:
+        """
+        Best stored route for a symbol near a start point.
+
+        Args:
+            symbol_id: Symbol of the route
+            start: (lat, lon) start point
+            target_distance_km: Wanted distance
+            radius_m: Largest distance between the stored and given starts
+            distance_tolerance: Largest relative difference of target distances
+
+        Returns:
+            The highest scoring matching route (the closest among equals),
+            or None
+        """
+        dlat = radius_m / M_PER_DEG
+        dlon = dlat / max(math.cos(math.radians(start[0])), 1e-6)
+        bbox = (start[0] - dlat, start[0] + dlat, start[1] - dlon, start[1] + dlon)
+        distances = (
+            target_distance_km * (1 - distance_tolerance),
+            target_distance_km * (1 + distance_tolerance)
+        )
+        columns = (
+            "r.id, r.symbol_id, r.lat, r.lon, r.target_distance_km, r.distance_m, r.score, "
+            "r.snap_rate, r.rotation, r.scale_factor"
+        )
+        if self.rtree:
+            query = (
+                f"SELECT {columns} FROM route_starts s JOIN routes r ON r.id = s.id "
+                "WHERE s.min_lat >= ? AND s.max_lat <= ? AND s.min_lon >= ? AND s.max_lon <= ? "
+                "AND r.symbol_id = ? AND r.target_distance_km BETWEEN ? AND ? "
+                "ORDER BY r.score DESC LIMIT ?"
+            )
+            params = (*bbox, symbol_id, *distances, MAX_MATCH_ROWS)
+        else:
+            query = (
+                f"SELECT {columns} FROM routes r WHERE r.symbol_id = ? "
+                "AND r.lat BETWEEN ? AND ? AND r.lon BETWEEN ? AND ? "
+                "AND r.target_distance_km BETWEEN ? AND ? "
+                "ORDER BY r.score DESC LIMIT ?"
+            )
+            params = (symbol_id, *bbox, *distances, MAX_MATCH_ROWS)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+
+        best = None
+        for row in rows:
+            offset_m = distance_m(start, (row[2], row[3]))
+            if offset_m > radius_m:
+                continue  # In the bounding box's corners
+            if best is None or (row[6], -offset_m) > (best[0][6], -best[1]):
+                best = (row, offset_m)
+        if best is None:
+            return None
+
+        row, offset_m = best
+        return LibraryRoute(
+            row[0], row[1], (row[2], row[3]), row[4], row[5], row[6], row[7], row[8], row[9], offset_m
+        )
+
+    def popular_symbols(self, limit: int, since: float = 0.0) -> List[str]:
+        """
+        Symbols with the most routes generated for requests.
+
+        Args:
+            limit: Number of symbols
+            since: Only count routes created after this time (epoch seconds)
+
+        Returns:
+            Symbol ids, most requested first
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT symbol_id FROM routes WHERE precomputed = 0 AND created >= ? "
+                "GROUP BY symbol_id ORDER BY COUNT(*) DESC LIMIT ?",
+                (since, limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_library: Optional[RouteLibrary] = None
+_library_lock = threading.Lock()
+
+
+def get_route_library() -> RouteLibrary:
+    """Process-wide route library, opened on first use."""
+    global _library
+    if _library is None:
+        with _library_lock:
+            if _library is None:
+                _library = RouteLibrary(
+                    settings.data_dir / "route_library.sqlite", settings.route_library_max_routes
+                )
+    return _library
+
+
+def search_route_with_library(
+    symbol_id: str,
+    symbol_polyline: List[Tuple[float, float]],
+    start_lat: float,
+    start_lon: float,
+    target_distance_km: float,
+    graph: CompactGraph = None,
+    max_time_ms: Optional[float] = None,
+    k: int = 1
+) -> RouteSearchResult:
+    """
+    search_route, answered or warm-started from the route library.
+
+    The placement of a good enough stored route starting within
+    route_library_reuse_m is routed from the requested start, without a
+    search (only for k = 1: alternatives aren't stored). The result starts
+    at the requested point and can be refined like a searched route. If
+    the placement doesn't fit there as well, or there's no such route, the
+    best stored route within route_library_radius_m hints the search, and
+    the new route is stored.
+
+    Args:
+        symbol_id: ID of the symbol, the library key
+        symbol_polyline: Normalized symbol polyline
+        start_lat: Starting latitude
+        start_lon: Starting longitude
+        target_distance_km: Target distance in kilometers
+        graph: Optional pre-loaded graph
+        max_time_ms: Optional time budget for the search
+        k: Number of distinct routes wanted (best + alternatives)
+
+    Returns:
+        RouteSearchResult; stop_reason is "library" for a replayed
+        placement, with library_offset_m set
+    """
+    if not settings.route_library_enabled:
+        return search_route(
+            symbol_polyline, start_lat, start_lon, target_distance_km,
+            graph=graph, max_time_ms=max_time_ms, k=k
+        )
+
+    started = time.perf_counter()
+    start = (start_lat, start_lon)
+    library = get_route_library()
+
+    def lookup(radius_m: float) -> Optional[LibraryRoute]:
+        try:
+            return library.best_match(
+                symbol_id, start, target_distance_km,
+                radius_m, settings.route_library_distance_tolerance
+            )
+        except sqlite3.Error as e:
+            logger.warning("Route library lookup failed", extra={"error": str(e)})
+            return None
+
+    match = lookup(settings.route_library_reuse_m) if k == 1 else None
+    if match is not None:
+        distance_error = abs(match.distance_m / 1000.0 - target_distance_km) / target_distance_km
+        if is_good_enough(match.snap_rate, distance_error):
+            replay = route_placement(
+                symbol_polyline, start_lat, start_lon, target_distance_km,
+                match.rotation, match.scale_factor, graph=graph
+            )
+            # The search below reuses the loaded graph
+            graph = replay.graph
+            if replay.stop_reason == "good_enough":
+                ROUTE_LIBRARY.inc(outcome="reused")
+                logger.info(
+                    "Route reused from library",
+                    extra={"library_id": match.id, "offset_m": round(match.offset_m, 1)}
+                )
+                replay.stop_reason = "library"
+                replay.library_offset_m = round(match.offset_m, 1)
+                replay.elapsed_ms = (time.perf_counter() - started) * 1000.0
+                return replay
+
+    match = lookup(settings.route_library_radius_m)
+    ROUTE_LIBRARY.inc(outcome="warm_start" if match is not None else "miss")
+    result = search_route(
+        symbol_polyline, start_lat, start_lon, target_distance_km,
+        graph=graph, max_time_ms=max_time_ms, k=k,
+        hint=(match.rotation, match.scale_factor) if match is not None else None
+    )
+
+    # Fallbacks (no route found) aren't worth keeping
+    if result.rotation is not None:
+        try:
+            library.add(symbol_id, start, target_distance_km, result)
+        except sqlite3.Error as e:
+            logger.warning("Route library write failed", extra={"error": str(e)})
+    return result
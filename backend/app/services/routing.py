@@ -1,19 +1,38 @@
 """Service for shape-based route generation."""
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
 import numpy as np
-import networkx as nx
-from typing import List, Tuple
-from scipy.spatial.distance import cdist
 
 from app.core.settings import settings
+from app.core.metrics import (
+    timed,
+    ROUTE_CANDIDATES,
+    ROUTE_EARLY_EXITS,
+    ROUTE_FALLBACKS,
+    ROUTE_SCALE_PREDICTIONS
+)
+from app.services.circuity import get_circuity_model
+from app.services.compact_graph import CompactGraph
+from app.services.feasibility import get_feasibility_raster
+from app.services.legs import LegCache
 from app.services.osm import (
+    M_PER_DEG,
     get_graph_around_point,
-    nearest_node,
-    shortest_path,
+    get_spatial_index,
+    nearest_nodes,
     nodes_to_coordinates,
+    offsets_to_latlon,
     calculate_path_length
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 def simplify_polyline(polyline: List[Tuple[float, float]], num_points: int = 30) -> List[Tuple[float, float]]:
     """
     Simplify a polyline to keep only the most important points.
@@ -74,7 +93,7 @@ def transform_polyline(
 
 def snap_polyline_to_graph(
     polyline: List[Tuple[float, float]],
-    graph: nx.MultiDiGraph,
+    graph: CompactGraph,
     max_distance_m: float = None
 ) -> Tuple[List[int], float]:
     """
@@ -84,7 +103,7 @@ def snap_polyline_to_graph(
     
     Args:
         polyline: List of (lat, lon) points
-        graph: NetworkX graph
+        graph: Compact street graph
         max_distance_m: Maximum snap distance in meters
     
     Returns:
@@ -95,104 +114,313 @@ def snap_polyline_to_graph(
     if max_distance_m is None:
         max_distance_m = settings.max_snap_distance_m
     
-    snapped_nodes = []
-    successful_snaps = 0
+    if not polyline:
+        return [], 0
     
-    for lat, lon in polyline:
-        try:
-            node = nearest_node(graph, lat, lon)
-            
-            # Check if node is within acceptable distance
-            node_data = graph.nodes[node]
-            node_lat, node_lon = node_data['y'], node_data['x']
-            
-            # Simple euclidean distance check (rough approximation)
-            # For more accuracy, could use haversine distance
-            dist_deg = np.sqrt((lat - node_lat)**2 + (lon - node_lon)**2)
-            dist_m = dist_deg * 111000  # Rough conversion: 1 degree ≈ 111km
-            
-            if dist_m <= max_distance_m:
-                snapped_nodes.append(node)
-                successful_snaps += 1
-            else:
-                # Still add the node but don't count as successful
-                snapped_nodes.append(node)
-        except Exception as e:
-            print(f"Error snapping point ({lat}, {lon}): {e}")
-            # Skip this point
-            continue
+    lats = [lat for lat, _ in polyline]
+    lons = [lon for _, lon in polyline]
+    try:
+        # One spatial query for the whole polyline
+        snapped_nodes = nearest_nodes(graph, lats, lons)
+    except Exception as e:
+        logger.warning("Error snapping polyline", extra={"points": len(polyline), "error": str(e)})
+        return [], 0
+    
+    # Check if nodes are within acceptable distance
+    node_coords = graph.coordinates(snapped_nodes)
+    
+    # Distance in the spatial index's local metric plane
+    index = get_spatial_index(graph)
+    offsets = index.to_plane(lats, lons) - index.to_plane(node_coords[:, 0], node_coords[:, 1])
+    dist_m = np.hypot(offsets[:, 0], offsets[:, 1]) * M_PER_DEG
     
-    success_rate = successful_snaps / len(polyline) if polyline else 0
+    # Nodes beyond the limit are kept but don't count as successful
+    successful_snaps = int((dist_m <= max_distance_m).sum())
+    
+    success_rate = successful_snaps / len(polyline)
     return snapped_nodes, success_rate
 
 
-def build_route_from_nodes(
-    graph: nx.MultiDiGraph,
-    nodes: List[int]
-) -> Tuple[List[int], float]:
+def build_legs(
+    graph: CompactGraph,
+    nodes: List[int],
+    leg_cache: Optional[LegCache] = None
+) -> List[List[int]]:
     """
-    Build a complete route by finding shortest paths between consecutive nodes.
+    Find the shortest path of each leg between consecutive nodes.
     
     Args:
-        graph: NetworkX graph
+        graph: Compact street graph
         nodes: List of target node IDs to visit in order
+        leg_cache: Optional cache shared with other routes on the same graph;
+            legs it already knows are reused instead of recomputed
     
     Returns:
-        Tuple of (route_nodes, total_distance_m)
-        - route_nodes: Complete list of node IDs forming the route
-        - total_distance_m: Total distance in meters
+        One node list per consecutive pair, starting at the pair's first node
     """
-    if not nodes:
-        return [], 0.0
+    if leg_cache is None:
+        leg_cache = LegCache(graph)
     
-    route_nodes = []
+    legs = []
     
     for i in range(len(nodes) - 1):
         start, end = nodes[i], nodes[i + 1]
         
         # Skip if same node
         if start == end:
-            if not route_nodes:
-                route_nodes.append(start)
+            legs.append([start])
             continue
         
         # Find shortest path
         try:
-            path = shortest_path(graph, start, end)
-            
-            # Add path, avoiding duplicates at connection points
-            if not route_nodes:
-                route_nodes.extend(path)
-            else:
-                route_nodes.extend(path[1:])  # Skip first node (already in route)
+            legs.append(leg_cache.path(start, end))
         except Exception as e:
-            print(f"Error finding path from {start} to {end}: {e}")
-            # Just add the end node to keep going
-            if not route_nodes:
-                route_nodes.append(start)
-            route_nodes.append(end)
+            logger.warning("Error finding path", extra={"from_node": start, "to_node": end, "error": str(e)})
+            # Just go straight to the end node to keep going
+            legs.append([start, end])
+    
+    return legs
+
+
+def join_legs(legs: List[List[int]]) -> List[int]:
+    """Concatenate legs, avoiding duplicates at connection points."""
+    route_nodes = []
+    for leg in legs:
+        if not route_nodes:
+            route_nodes.extend(leg)
+        else:
+            route_nodes.extend(leg[1:])  # Skip first node (already in route)
+    return route_nodes
+
+
+def build_route_from_nodes(
+    graph: CompactGraph,
+    nodes: List[int]
+) -> Tuple[List[int], float]:
+    """
+    Build a complete route by finding shortest paths between consecutive nodes.
+    
+    Args:
+        graph: Compact street graph
+        nodes: List of target node IDs to visit in order
+    
+    Returns:
+        Tuple of (route_nodes, total_distance_m)
+        - route_nodes: Complete list of node IDs forming the route
+        - total_distance_m: Total distance in meters
+    """
+    if not nodes:
+        return [], 0.0
+    
+    route_nodes = join_legs(build_legs(graph, nodes))
     
     # Calculate total distance
-    total_distance = calculate_path_length(graph, route_nodes)
+    with timed("path_length"):
+        total_distance = calculate_path_length(graph, route_nodes)
     
     return route_nodes, total_distance
 
 
-def generate_route(
+# Candidate acceptance thresholds
+MIN_SNAP_RATE = 0.2  # Fraction of shape points snapped within max_snap_distance_m
+MAX_DISTANCE_ERROR = 0.3  # Accept routes within ±30% of target (very tolerant)
+
+# Search space (reduced for performance)
+ROTATIONS = [0, 90, 180, 270]  # 4 main angles instead of 8
+# Fallback sweep. Street routes are longer than the shape, so below 1 mostly
+SCALE_FACTORS = [0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1]
+
+
+@dataclass
+class Candidate:
+    """A rotation/scale placement of the symbol snapped to the graph."""
+    rotation: float
+    scale_factor: float
+    nodes: List[int]  # Snapped waypoints, consecutive duplicates removed
+    snap_rate: float
+    legs: List[List[int]] = field(default_factory=list)  # Filled once the route is built
+
+
+@dataclass
+class RouteAlternative:
+    """A distinct runner-up route from the same search."""
+    coordinates: List[Tuple[float, float]]
+    distance_m: float
+    score: float
+    snap_rate: float
+    rotation: float
+    scale_factor: float
+
+
+@dataclass
+class RouteSearchResult:
+    """Best route found by search_route and how the search ended."""
+    coordinates: List[Tuple[float, float]]
+    distance_m: float
+    score: float = 0.0
+    snap_rate: float = 0.0
+    rotation: Optional[float] = None
+    scale_factor: Optional[float] = None
+    alternatives: List[RouteAlternative] = field(default_factory=list)
+    waypoints: List[int] = field(default_factory=list)  # Snapped waypoints of the best route
+    legs: List[List[int]] = field(default_factory=list)  # Paths between consecutive waypoints
+    graph: Optional[CompactGraph] = field(default=None, repr=False, compare=False)
+    candidates_evaluated: int = 0
+    exhaustive: bool = True  # False when the time budget cut the search short
+    stop_reason: str = "exhausted"  # exhausted, good_enough, deadline, no_graph, refined or library
+    elapsed_ms: float = 0.0
+    # For a library route: distance (m) from the start of the stored route it replays
+    library_offset_m: Optional[float] = None
+
+
+def graph_radius_km(target_distance_km: float) -> float:
+    """Radius of street graph needed around the start for a target distance."""
+    # Use smaller radius for better performance (max 3 km)
+    return min(target_distance_km * 0.6, 3.0)
+
+
+def place_symbol(
+    symbol_polyline: List[Tuple[float, float]],
+    rotation: float,
+    scale_m: float,
+    start_lat: float,
+    start_lon: float
+) -> List[Tuple[float, float]]:
+    """
+    Rotate and scale the symbol, anchor it on the start point and simplify it.
+    
+    The symbol's x axis points north and its y axis east.
+    
+    Args:
+        symbol_polyline: Normalized symbol polyline
+        rotation: Rotation in degrees
+        scale_m: Scale in meters per normalized unit
+        start_lat: Starting latitude
+        start_lon: Starting longitude
+    
+    Returns:
+        Simplified list of (lat, lon) waypoints
+    """
+    # First transform with rotation and scale (centered at origin)
+    arr = np.array(symbol_polyline)
+    arr = arr * scale_m
+    
+    # Rotate
+    angle_rad = np.deg2rad(rotation)
+    cos_a, sin_a = np.cos(angle_rad), np.sin(angle_rad)
+    rotation_matrix = np.array([
+        [cos_a, -sin_a],
+        [sin_a, cos_a]
+    ])
+    arr = arr @ rotation_matrix.T
+    
+    # Find the closest point to origin (this will be placed at start point)
+    distances_to_origin = np.sqrt(np.sum(arr ** 2, axis=1))
+    closest_idx = np.argmin(distances_to_origin)
+    offset = arr[closest_idx]
+    
+    # Translate so the closest point is at the start location
+    arr = offsets_to_latlon(arr - offset, start_lat, start_lon)
+    
+    transformed = [(float(x), float(y)) for x, y in arr]
+    
+    # IMPORTANT: Simplify to reduce zigzags - keep only key points
+    # For star: ~25 points is enough to capture 5 branches
+    return simplify_polyline(transformed, num_points=25)
+
+
+def unique_consecutive(nodes: List[int]) -> List[int]:
+    """Drop consecutive duplicate nodes."""
+    unique_nodes = []
+    for node in nodes:
+        if not unique_nodes or node != unique_nodes[-1]:
+            unique_nodes.append(node)
+    return unique_nodes
+
+
+def route_score(snap_rate: float, distance_error: float) -> float:
+    """Score prioritizing snap rate (shape quality) over distance precision."""
+    # Weight: 80% shape quality, 20% distance accuracy
+    return snap_rate * (1.0 - distance_error * 0.2)
+
+
+def is_good_enough(snap_rate: float, distance_error: float) -> bool:
+    """True for a route worth stopping the search for."""
+    return snap_rate > 0.6 and distance_error < 0.25
+
+
+def route_overlap(route_a: List[int], route_b: List[int]) -> float:
+    """Jaccard overlap of the (undirected) street segments used by two routes."""
+    edges_a = {frozenset(pair) for pair in zip(route_a, route_a[1:])}
+    edges_b = {frozenset(pair) for pair in zip(route_b, route_b[1:])}
+    union = edges_a | edges_b
+    if not union:
+        return 1.0 if set(route_a) == set(route_b) else 0.0
+    return len(edges_a & edges_b) / len(union)
+
+
+def select_distinct_routes(
+    scored_routes: List[Tuple[float, "Candidate", List[int], float]],
+    k: int,
+    max_overlap: float = None
+) -> List[Tuple[float, "Candidate", List[int], float]]:
+    """
+    Pick up to k best-scoring routes that don't overlap each other too much.
+    
+    Args:
+        scored_routes: (score, candidate, route_nodes, distance_m) tuples
+        k: Number of routes wanted
+        max_overlap: Highest segment overlap allowed with an already picked route
+    
+    Returns:
+        Selected tuples, best first
+    """
+    if max_overlap is None:
+        max_overlap = settings.alternative_max_overlap
+    
+    selected = []
+    # Stable sort: among equal scores the first evaluated wins, as for the best route
+    for entry in sorted(scored_routes, key=lambda e: -e[0]):
+        if len(selected) >= k:
+            break
+        if all(route_overlap(entry[2], other[2]) <= max_overlap for other in selected):
+            selected.append(entry)
+    return selected
+
+
+def search_route(
     symbol_polyline: List[Tuple[float, float]],
     start_lat: float,
     start_lon: float,
     target_distance_km: float,
-    graph: nx.MultiDiGraph = None
-) -> Tuple[List[Tuple[float, float]], float]:
+    graph: CompactGraph = None,
+    max_time_ms: Optional[float] = None,
+    k: int = 1,
+    hint: Optional[Tuple[float, float]] = None
+) -> RouteSearchResult:
     """
-    Generate a route that matches a symbol shape.
+    Anytime search for the route that best matches a symbol shape.
     
-    This is the main routing algorithm. It:
     1. Loads the street graph around the start point
-    2. Tries multiple rotations and scales of the normalized symbol
-    3. Snaps the transformed symbol to the graph
-    4. Builds a connected route through the snapped nodes
+    2. Predicts the scale hitting the target distance from the graph's
+       circuity model, and places and snaps the symbol at that scale in
+       every rotation (plus the hinted placement); placements the graph's
+       feasibility raster rules out aren't snapped at all
+    3. Builds routes for the most promising candidates first (the hinted
+       placement, then highest snap rate). A route off target is followed
+       by its placement rescaled by the length the route measured
+    4. Falls back to the sweep of fixed scale factors if that finds no
+       good enough route
+    5. Stops when a good enough route is found, when all candidates
+       are evaluated, or when the time budget runs out
+    
+    With a budget, at least one candidate is always evaluated and the
+    best route found so far is returned.
+    
+    With k > 1, alternatives are picked among the routes built by the same
+    pass, and the early exit waits for k distinct good enough routes
+    instead of one. Fewer alternatives are returned if the candidates
+    don't yield enough distinct routes.
     
     Args:
         symbol_polyline: Normalized symbol polyline (centered at origin, unit length)
@@ -200,151 +428,393 @@ def generate_route(
         start_lon: Starting longitude
         target_distance_km: Target distance in kilometers
         graph: Optional pre-loaded graph (for testing)
+        max_time_ms: Optional time budget for the whole search
+        k: Number of distinct routes wanted (best + alternatives)
+        hint: (rotation, scale_factor) of a placement known to work nearby,
+            evaluated first so a good enough one ends the search at once
     
     Returns:
-        Tuple of (coordinates, distance_m)
-        - coordinates: List of (lat, lon) points forming the route
-        - distance_m: Total distance in meters
+        RouteSearchResult with the best route and search statistics
     """
-    print(f"\n=== ROUTE GENERATION START ===")
-    print(f"Start point: ({start_lat}, {start_lon})")
-    print(f"Target distance: {target_distance_km} km (±30% tolerance = {target_distance_km * 0.7:.1f}-{target_distance_km * 1.3:.1f} km)")
-    print(f"Symbol points: {len(symbol_polyline)}")
+    started = time.perf_counter()
+    deadline = started + max_time_ms / 1000.0 if max_time_ms else None
+    
+    def elapsed_ms() -> float:
+        return (time.perf_counter() - started) * 1000.0
+    
+    def out_of_time() -> bool:
+        return deadline is not None and time.perf_counter() >= deadline
+    
+    logger.info(
+        "Route generation start",
+        extra={
+            "start": (start_lat, start_lon),
+            "target_km": target_distance_km,
+            "symbol_points": len(symbol_polyline),
+            "max_time_ms": max_time_ms
+        }
+    )
     
     # Load graph if not provided
     if graph is None:
-        # Use smaller radius for better performance (max 3 km)
-        radius_km = min(target_distance_km * 0.6, 3.0)
-        print(f"Loading OSM graph with radius: {radius_km} km...")
+        radius_km = graph_radius_km(target_distance_km)
+        logger.debug("Loading OSM graph", extra={"radius_km": radius_km})
         try:
-            graph = get_graph_around_point(start_lat, start_lon, radius_km)
-            print(f"Graph loaded: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges")
+            with timed("graph_load"):
+                graph = get_graph_around_point(start_lat, start_lon, radius_km)
+            logger.info(
+                "Graph loaded",
+                extra={"nodes": graph.number_of_nodes(), "edges": graph.number_of_edges()}
+            )
         except Exception as e:
-            print(f"ERROR loading graph: {e}")
-            return [(start_lat, start_lon)], 0.0
-    
-    # The normalized polyline is in abstract units
-    # We need to convert it to lat/lon space
-    
-    # Estimate scale: target distance in km, symbol has normalized length 1.0
-    # This gives us the scale in km, but we need it in degrees
-    # Rough approximation: 1 degree ≈ 111 km at equator
-    target_scale_km = target_distance_km
-    target_scale_deg = target_scale_km / 111.0
-    
-    # Try multiple rotations (reduced for performance)
-    rotations = [0, 90, 180, 270]  # 4 main angles instead of 8
-    best_route = None
-    best_distance = 0
-    best_success_rate = 0
-    
+            logger.error("Error loading graph", extra={"error": str(e)})
+            ROUTE_FALLBACKS.inc(reason="graph_load_error")
+            return RouteSearchResult(
+                [(start_lat, start_lon)], 0.0,
+                stop_reason="no_graph", elapsed_ms=elapsed_ms()
+            )
+    
+    # The normalized polyline has unit length: at scale factor 1 the shape's
+    # perimeter is the target distance. Its street route is longer by the
+    # graph's circuity, so the scale factor that hits the target is predicted
+    # from the circuity model; the fixed sweep is only the fallback.
+    target_scale_m = target_distance_km * 1000.0
+    with timed("circuity"):
+        predicted = round(get_circuity_model(graph).predict_scale_factor(target_scale_m), 3)
+    
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    stop_reason = "exhausted"
+    timed_out = False
+    
+    with timed("feasibility"):
+        raster = get_feasibility_raster(graph)
+    
+    def place_and_snap(rotation: float, scale_factor: float) -> Optional[Candidate]:
+        """Place and snap one candidate; None if it doesn't snap well enough."""
+        waypoints = place_symbol(
+            symbol_polyline, rotation, target_scale_m * scale_factor,
+            start_lat, start_lon
+        )
+        
+        # Placements mostly off the street network fail the snap
+        # threshold anyway: reject them without snapping
+        with timed("feasibility"):
+            max_snap_rate = raster.max_snap_rate(waypoints)
+        if max_snap_rate < MIN_SNAP_RATE:
+            ROUTE_CANDIDATES.inc(outcome="infeasible")
+            return None
+        
+        # Snap to graph
+        with timed("snap"):
+            snapped_nodes, success_rate = snap_polyline_to_graph(waypoints, graph)
+        
+        if debug_enabled:
+            logger.debug(
+                "Candidate snapped",
+                extra={
+                    "attempt": attempts,
+                    "rotation": rotation,
+                    "scale": scale_factor,
+                    "snap_rate": round(success_rate, 3)
+                }
+            )
+        
+        # Need reasonable success rate (lowered for better results)
+        if success_rate < MIN_SNAP_RATE:
+            ROUTE_CANDIDATES.inc(outcome="snap_rejected")
+            return None
+        
+        # Remove consecutive duplicate nodes to avoid backtracking
+        return Candidate(rotation, scale_factor, unique_consecutive(snapped_nodes), success_rate)
+    
+    # First pass: the hinted and predicted placements, each rescaled once by
+    # the length its route actually measures. Second pass: the sweep.
+    predicted_placements = ([hint] if hint is not None else []) + [
+        (rotation, predicted) for rotation in ROTATIONS
+    ]
+    passes = [
+        predicted_placements,
+        [(rotation, scale_factor) for rotation in ROTATIONS for scale_factor in SCALE_FACTORS]
+    ]
+    tried = set()
+    corrected = set()
     attempts = 0
-    successful_snaps = 0
-    
-    print(f"\nTrying {len(rotations)} rotations × 8 scales = {len(rotations) * 8} combinations...")
-    
-    for rotation in rotations:
-        # Transform the polyline
-        # Try more scale variations to find the right size
-        for scale_factor in [0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3]:
-            attempts += 1
-            scale = target_scale_deg * scale_factor
-            
-            # First transform with rotation and scale (centered at origin)
-            arr = np.array(symbol_polyline)
-            arr = arr * scale
-            
-            # Rotate
-            angle_rad = np.deg2rad(rotation)
-            cos_a, sin_a = np.cos(angle_rad), np.sin(angle_rad)
-            rotation_matrix = np.array([
-                [cos_a, -sin_a],
-                [sin_a, cos_a]
-            ])
-            arr = arr @ rotation_matrix.T
-            
-            # Find the closest point to origin (this will be placed at start point)
-            distances_to_origin = np.sqrt(np.sum(arr ** 2, axis=1))
-            closest_idx = np.argmin(distances_to_origin)
-            offset = arr[closest_idx]
-            
-            # Translate so the closest point is at the start location
-            arr = arr - offset + np.array([start_lat, start_lon])
-            
-            transformed = [(float(x), float(y)) for x, y in arr]
-            
-            # IMPORTANT: Simplify to reduce zigzags - keep only key points
-            # For star: ~25 points is enough to capture 5 branches
-            simplified = simplify_polyline(transformed, num_points=25)
-            
-            # Snap to graph
-            snapped_nodes, success_rate = snap_polyline_to_graph(simplified, graph)
-            
-            # Remove consecutive duplicate nodes to avoid backtracking
-            unique_nodes = []
-            for node in snapped_nodes:
-                if not unique_nodes or node != unique_nodes[-1]:
-                    unique_nodes.append(node)
-            
-            if attempts <= 3:  # Log first 3 attempts
-                print(f"  Attempt {attempts}: rotation={rotation}°, scale={scale_factor:.1f}x → snap_rate={success_rate:.1%}")
-            
-            # Need reasonable success rate (lowered for better results)
-            if success_rate < 0.2:
+    snapped = 0
+    
+    best: Optional[Candidate] = None
+    best_route: List[int] = []
+    best_distance = 0.0
+    best_score = 0.0
+    evaluated = 0
+    accepted = []
+    good_enough = set()
+    # Candidates share most snapped nodes: compute each leg once per search.
+    # A leg longer than the longest acceptable route can't be part of one.
+    leg_cache = LegCache(graph, max_leg_m=target_distance_km * 1000.0 * (1 + MAX_DISTANCE_ERROR))
+    
+    for pass_index, placements in enumerate(passes):
+        # Phase 1: place and snap the pass's candidates
+        candidates: List[Candidate] = []
+        for placement in placements:
+            if placement in tried:
                 continue
+            if (candidates or evaluated) and out_of_time():
+                timed_out = True
+                break
+            tried.add(placement)
+            attempts += 1
+            candidate = place_and_snap(*placement)
+            if candidate is not None:
+                candidates.append(candidate)
+        snapped += len(candidates)
+        
+        # Phase 2: most promising first
+        candidates.sort(key=lambda c: (
+            (c.rotation, c.scale_factor) != hint, -c.snap_rate, abs(c.scale_factor - predicted)
+        ))
+        pending = deque(candidates)
+        
+        while pending:
+            candidate = pending.popleft()
+            if evaluated and out_of_time():
+                timed_out = True
+                break
             
-            successful_snaps += 1
-            
-            # Build route using unique nodes (no consecutive duplicates)
-            route_nodes, distance_m = build_route_from_nodes(graph, unique_nodes)
+            # Build route using unique nodes (no consecutive duplicates),
+            # keeping the legs so the route can be refined later
+            candidate.legs = build_legs(graph, candidate.nodes, leg_cache)
+            route_nodes = join_legs(candidate.legs)
+            with timed("path_length"):
+                distance_m = calculate_path_length(graph, route_nodes)
+            evaluated += 1
             
-            # Check if this is better than previous attempts
-            # Prioritize shape matching over exact distance
             distance_km = distance_m / 1000.0
             distance_error = abs(distance_km - target_distance_km) / target_distance_km
             
-            # Accept routes within ±30% of target (very tolerant)
-            if distance_error > 0.3:
+            # Off target: the route's length says how far off the scale is,
+            # try the rescaled placement right after
+            placement = (candidate.rotation, candidate.scale_factor)
+            if (
+                pass_index == 0
+                and placement not in corrected
+                and distance_m > 0
+                and not is_good_enough(candidate.snap_rate, distance_error)
+            ):
+                rescaled = (candidate.rotation, round(candidate.scale_factor * target_scale_m / distance_m, 3))
+                if rescaled not in tried:
+                    tried.add(rescaled)
+                    corrected.add(rescaled)
+                    attempts += 1
+                    correction = place_and_snap(*rescaled)
+                    if correction is not None:
+                        snapped += 1
+                        pending.appendleft(correction)
+            
+            if distance_error > MAX_DISTANCE_ERROR:
+                ROUTE_CANDIDATES.inc(outcome="distance_rejected")
                 continue  # Skip routes too far from target
             
-            # Score prioritizing snap rate (shape quality) over distance precision
-            # Weight: 80% shape quality, 20% distance accuracy
-            score = success_rate * (1.0 - distance_error * 0.2)
-            best_score = best_success_rate * (1.0 - abs(best_distance / 1000.0 - target_distance_km) / target_distance_km * 0.2) if best_route else 0
+            ROUTE_CANDIDATES.inc(outcome="accepted")
             
+            score = route_score(candidate.snap_rate, distance_error)
+            accepted.append((score, candidate, route_nodes, distance_m))
             if score > best_score:
-                best_route = route_nodes
-                best_distance = distance_m
-                best_success_rate = success_rate
-                
-                # Early exit if we found a good enough route
-                if best_success_rate > 0.6 and distance_error < 0.25:
-                    print(f"✓ Excellent route found (snap={best_success_rate:.1%}, dist={distance_km:.2f}km), stopping early")
-                    break  # Exit scale factor loop
+                best, best_route, best_distance, best_score = candidate, route_nodes, distance_m, score
+            
+            # Early exit once the k best distinct routes are all good enough
+            # (for k = 1: the new best route is good enough)
+            if is_good_enough(candidate.snap_rate, distance_error):
+                good_enough.add(id(candidate))
+                selected = select_distinct_routes(accepted, k)
+                if len(selected) == k and all(id(entry[1]) in good_enough for entry in selected):
+                    logger.debug(
+                        "Excellent route found, stopping early",
+                        extra={"snap_rate": round(candidate.snap_rate, 3), "distance_km": round(distance_km, 2)}
+                    )
+                    ROUTE_EARLY_EXITS.inc()
+                    stop_reason = "good_enough"
+                    break
         
-        # Exit rotation loop if excellent route found
-        if best_route and best_success_rate > 0.6:
-            break  # Exit rotation loop
-    
-    # Convert best route to coordinates
-    print(f"\n=== RESULTS ===")
-    print(f"Total attempts: {attempts}")
-    print(f"Successful snaps (>20%): {successful_snaps}")
-    print(f"Best route found: {'YES' if best_route else 'NO'}")
-    
-    if best_route:
-        print(f"Best success rate: {best_success_rate:.1%}")
-        print(f"Route length: {best_distance/1000:.2f} km")
-        print(f"Route nodes: {len(best_route)}")
-        coordinates = nodes_to_coordinates(graph, best_route)
-        return coordinates, best_distance
-    else:
-        # Fallback: just return a small route near the start
-        print(f"⚠️ NO ROUTE FOUND - All combinations failed!")
-        print(f"Possible reasons:")
-        print(f"  - All snap rates < 20%")
-        print(f"  - Scale too large/small for this area")
-        print(f"  - Not enough streets in the area")
-        start_node = nearest_node(graph, start_lat, start_lon)
-        return [(start_lat, start_lon)], 0.0
+        if stop_reason == "good_enough" or timed_out:
+            break
+    
+    if best is not None:
+        best_placement = (best.rotation, best.scale_factor)
+        if best_placement in corrected:
+            ROUTE_SCALE_PREDICTIONS.inc(outcome="corrected")
+        elif best_placement == hint:
+            ROUTE_SCALE_PREDICTIONS.inc(outcome="hint")
+        elif best_placement in predicted_placements:
+            ROUTE_SCALE_PREDICTIONS.inc(outcome="predicted")
+        else:
+            ROUTE_SCALE_PREDICTIONS.inc(outcome="sweep")
+    
+    # Running out of time only matters if it left candidates unexplored
+    if timed_out and stop_reason != "good_enough":
+        stop_reason = "deadline"
+    exhaustive = not timed_out
+    
+    if best is not None:
+        logger.info(
+            "Route generation done",
+            extra={
+                "attempts": attempts,
+                "successful_snaps": snapped,
+                "evaluated": evaluated,
+                "stop_reason": stop_reason,
+                "snap_rate": round(best.snap_rate, 3),
+                "distance_km": round(best_distance / 1000, 2),
+                "route_nodes": len(best_route)
+            }
+        )
+        with timed("serialize"):
+            coordinates = nodes_to_coordinates(graph, best_route)
+            alternatives = [
+                RouteAlternative(
+                    nodes_to_coordinates(graph, route_nodes), distance_m, score,
+                    candidate.snap_rate, candidate.rotation, candidate.scale_factor
+                )
+                for score, candidate, route_nodes, distance_m
+                in select_distinct_routes(accepted, k)
+                if candidate is not best
+            ] if k > 1 else []
+        return RouteSearchResult(
+            coordinates, best_distance,
+            score=best_score,
+            snap_rate=best.snap_rate,
+            rotation=best.rotation,
+            scale_factor=best.scale_factor,
+            alternatives=alternatives,
+            waypoints=best.nodes,
+            legs=best.legs,
+            graph=graph,
+            candidates_evaluated=evaluated,
+            exhaustive=exhaustive,
+            stop_reason=stop_reason,
+            elapsed_ms=elapsed_ms()
+        )
+    
+    # Fallback: just return the start point
+    # Usual causes: all snap rates < 20%, scale wrong for this area,
+    # or not enough streets around the start point
+    logger.warning(
+        "No route found, all combinations failed",
+        extra={"attempts": attempts, "successful_snaps": snapped, "stop_reason": stop_reason}
+    )
+    ROUTE_FALLBACKS.inc(reason="deadline" if stop_reason == "deadline" else "no_candidate")
+    return RouteSearchResult(
+        [(start_lat, start_lon)], 0.0,
+        candidates_evaluated=evaluated,
+        exhaustive=exhaustive,
+        stop_reason=stop_reason,
+        elapsed_ms=elapsed_ms()
+    )
 
+
+def route_placement(
+    symbol_polyline: List[Tuple[float, float]],
+    start_lat: float,
+    start_lon: float,
+    target_distance_km: float,
+    rotation: float,
+    scale_factor: float,
+    graph: CompactGraph = None
+) -> RouteSearchResult:
+    """
+    Route one given placement of the symbol, without any search.
+    
+    Used to replay a placement known to work (e.g. a stored route's) at a
+    new start point. The result carries the graph, waypoints and legs, so
+    it can be refined like a searched route.
+    
+    Args:
+        symbol_polyline: Normalized symbol polyline (centered at origin, unit length)
+        start_lat: Starting latitude
+        start_lon: Starting longitude
+        target_distance_km: Target distance in kilometers
+        rotation: Rotation in degrees
+        scale_factor: Scale relative to the target distance
+        graph: Optional pre-loaded graph
+    
+    Returns:
+        RouteSearchResult; without a rotation (just the start point) if the
+        graph can't be loaded or the placement doesn't snap
+    """
+    started = time.perf_counter()
+    
+    def no_route(stop_reason: str) -> RouteSearchResult:
+        return RouteSearchResult(
+            [(start_lat, start_lon)], 0.0, graph=graph, stop_reason=stop_reason,
+            elapsed_ms=(time.perf_counter() - started) * 1000.0
+        )
+    
+    if graph is None:
+        try:
+            with timed("graph_load"):
+                graph = get_graph_around_point(start_lat, start_lon, graph_radius_km(target_distance_km))
+        except Exception as e:
+            logger.error("Error loading graph", extra={"error": str(e)})
+            return no_route("no_graph")
+    
+    waypoints = place_symbol(
+        symbol_polyline, rotation, target_distance_km * 1000.0 * scale_factor, start_lat, start_lon
+    )
+    with timed("snap"):
+        snapped_nodes, snap_rate = snap_polyline_to_graph(waypoints, graph)
+    nodes = unique_consecutive(snapped_nodes)
+    if snap_rate < MIN_SNAP_RATE or not nodes:
+        return no_route("exhausted")
+    
+    legs = build_legs(graph, nodes)
+    route_nodes = join_legs(legs)
+    with timed("path_length"):
+        distance_m = calculate_path_length(graph, route_nodes)
+    distance_error = abs(distance_m / 1000.0 - target_distance_km) / target_distance_km
+    with timed("serialize"):
+        coordinates = nodes_to_coordinates(graph, route_nodes)
+    return RouteSearchResult(
+        coordinates, distance_m,
+        score=route_score(snap_rate, distance_error),
+        snap_rate=snap_rate,
+        rotation=rotation,
+        scale_factor=scale_factor,
+        waypoints=nodes,
+        legs=legs,
+        graph=graph,
+        candidates_evaluated=1,
+        stop_reason="good_enough" if is_good_enough(snap_rate, distance_error) else "exhausted",
+        elapsed_ms=(time.perf_counter() - started) * 1000.0
+    )
+
+
+def generate_route(
+    symbol_polyline: List[Tuple[float, float]],
+    start_lat: float,
+    start_lon: float,
+    target_distance_km: float,
+    graph: CompactGraph = None,
+    max_time_ms: Optional[float] = None
+) -> Tuple[List[Tuple[float, float]], float]:
+    """
+    Generate a route that matches a symbol shape.
+    
+    Convenience wrapper around search_route returning only the route.
+    
+    Args:
+        symbol_polyline: Normalized symbol polyline (centered at origin, unit length)
+        start_lat: Starting latitude
+        start_lon: Starting longitude
+        target_distance_km: Target distance in kilometers
+        graph: Optional pre-loaded graph (for testing)
+        max_time_ms: Optional time budget for the search
+    
+    Returns:
+        Tuple of (coordinates, distance_m)
+        - coordinates: List of (lat, lon) points forming the route
+        - distance_m: Total distance in meters
+    """
+    result = search_route(
+        symbol_polyline, start_lat, start_lon, target_distance_km,
+        graph=graph, max_time_ms=max_time_ms
+    )
+    return result.coordinates, result.distance_m
@@ -1,28 +1,43 @@
 """Service for parsing and normalizing SVG shapes."""
+import hashlib
 import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
-from lxml import etree
-from svgpathtools import parse_path, Path as SvgPath
 
 from app.core.settings import settings
 from app.models.symbol import SymbolMetadata, NormalizedSymbol
+from app.services.graph_store import file_lock
 
 
-def parse_svg_to_points(svg_content: str, num_samples: int = 100) -> List[Tuple[float, float]]:
-    """
-    Parse SVG content and extract the main path as a list of 2D points.
-    
-    Args:
-        svg_content: Raw SVG file content
-        num_samples: Number of points to sample along the path
-    
-    Returns:
-        List of (x, y) tuples representing the path
-    """
-    # Parse SVG XML
-    root = etree.fromstring(svg_content.encode('utf-8'))
+logger = logging.getLogger(__name__)
+
+
+def _parse_svg(svg_content: str):
+    """Parse SVG XML without fetching or expanding external entities."""
+    # Imported on first use (or by the startup warm-up) to keep startup fast
+    from lxml import etree
+    
+    parser = etree.XMLParser(
+        resolve_entities=False,
+        no_network=True,
+        remove_comments=True,
+        remove_blank_text=True
+    )
+    try:
+        return etree.fromstring(svg_content.encode('utf-8'), parser)
+    except etree.XMLSyntaxError as e:
+        # lxml's error can't be pickled back from an upload worker
+        raise ValueError(f"Invalid SVG: {e}") from None
+
+
+def _sample_svg_path(root, num_samples: int) -> List[Tuple[float, float]]:
+    from svgpathtools import parse_path
     
     # Find all path elements (namespace-aware)
     namespaces = {'svg': 'http://www.w3.org/2000/svg'}
@@ -53,6 +68,32 @@ def parse_svg_to_points(svg_content: str, num_samples: int = 100) -> List[Tuple[
     return points
 
 
+def parse_svg_to_points(svg_content: str, num_samples: int = 100) -> List[Tuple[float, float]]:
+    """
+    Parse SVG content and extract the main path as a list of 2D points.
+    
+    Args:
+        svg_content: Raw SVG file content
+        num_samples: Number of points to sample along the path
+    
+    Returns:
+        List of (x, y) tuples representing the path
+    """
+    return _sample_svg_path(_parse_svg(svg_content), num_samples)
+
+
+def svg_content_hash(root) -> str:
+    """
+    Hash of a parsed SVG that ignores formatting.
+    
+    The document is canonicalized (C14N, comments and blank text dropped),
+    so re-indented or re-serialized copies of one SVG hash the same.
+    """
+    from lxml import etree
+    
+    return hashlib.sha256(etree.tostring(root, method="c14n", with_comments=False)).hexdigest()
+
+
 def normalize_polyline(points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
     """
     Normalize a polyline:
@@ -102,6 +143,7 @@ def save_symbol(symbol_id: str, metadata: SymbolMetadata, polyline: List[Tuple[f
         'polyline': polyline
     }
     
+    settings.symbols_dir.mkdir(parents=True, exist_ok=True)
     output_path = settings.symbols_dir / f"{symbol_id}.json"
     with open(output_path, 'w') as f:
         json.dump(symbol_data, f, indent=2)
@@ -134,6 +176,44 @@ def load_symbol(symbol_id: str) -> NormalizedSymbol:
     )
 
 
+def symbol_version(symbol_id: str) -> Tuple[int, int]:
+    """
+    Version of a stored symbol, without reading it.
+    
+    Returns:
+        (mtime_ns, size) of the symbol file
+    
+    Raises:
+        FileNotFoundError: If symbol doesn't exist
+    """
+    try:
+        stat = (settings.symbols_dir / f"{symbol_id}.json").stat()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Symbol {symbol_id} not found")
+    return stat.st_mtime_ns, stat.st_size
+
+
+def symbols_version() -> Tuple[Tuple[Tuple[str, int, int], ...], float]:
+    """
+    Version of the whole symbol registry, without reading any symbol.
+    
+    Returns:
+        Tuple of (entries, last_modified)
+        - entries: (file name, mtime_ns, size) of every symbol file, sorted
+        - last_modified: Latest modification time (epoch seconds), 0 if empty
+    """
+    entries = []
+    for symbol_file in settings.symbols_dir.glob("*.json"):
+        try:
+            stat = symbol_file.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((symbol_file.name, stat.st_mtime_ns, stat.st_size))
+    entries.sort()
+    last_modified = max((mtime_ns for _, mtime_ns, _ in entries), default=0) / 1e9
+    return tuple(entries), last_modified
+
+
 def list_symbols() -> List[SymbolMetadata]:
     """
     List all available symbols.
@@ -149,40 +229,120 @@ def list_symbols() -> List[SymbolMetadata]:
                 data = json.load(f)
                 symbols.append(SymbolMetadata(**data['metadata']))
         except Exception as e:
-            print(f"Error loading symbol {symbol_file}: {e}")
+            logger.warning("Error loading symbol", extra={"file": str(symbol_file), "error": str(e)})
     
     return symbols
 
 
-def process_svg_upload(svg_content: str, symbol_id: str, original_filename: str) -> NormalizedSymbol:
+def _hash_marker(content_hash: str) -> Path:
+    return settings.symbols_dir / ".hashes" / content_hash
+
+
+def find_symbol_by_hash(content_hash: str) -> Optional[NormalizedSymbol]:
+    """
+    Return the stored symbol with this content hash, if any.
+    
+    Args:
+        content_hash: Hash from svg_content_hash
+    
+    Returns:
+        NormalizedSymbol, or None if no stored symbol has this content
+    """
+    try:
+        symbol_id = _hash_marker(content_hash).read_text().strip()
+        return load_symbol(symbol_id)
+    except FileNotFoundError:
+        # No marker, or its symbol was deleted
+        return None
+
+
+def process_svg_upload(
+    content: bytes,
+    symbol_name: str,
+    original_filename: str
+) -> Tuple[NormalizedSymbol, bool]:
     """
     Process an uploaded SVG file: parse, normalize, and save.
     
+    Symbols are content-addressed: uploading an SVG that is already stored
+    (whatever its formatting or file name) returns the stored symbol.
+    
     Args:
-        svg_content: Raw SVG file content
-        symbol_id: Unique identifier for this symbol
+        content: Raw SVG file content
+        symbol_name: URL-safe base of the symbol ID
         original_filename: Original uploaded filename
     
     Returns:
-        NormalizedSymbol object
+        Tuple of (symbol, created); created is False for a duplicate
+    
+    Raises:
+        ValueError: If the content isn't UTF-8 XML with a usable path
     """
-    # Parse SVG to points
-    points = parse_svg_to_points(svg_content, num_samples=settings.shape_sample_points)
+    root = _parse_svg(content.decode('utf-8'))
+    content_hash = svg_content_hash(root)
+    
+    existing = find_symbol_by_hash(content_hash)
+    if existing is not None:
+        return existing, False
     
-    # Normalize
+    # Parse SVG to points and normalize
+    points = _sample_svg_path(root, settings.shape_sample_points)
     normalized_points = normalize_polyline(points)
     
     # Create metadata
+    symbol_id = f"{symbol_name}_{content_hash[:8]}"
     metadata = SymbolMetadata(
         id=symbol_id,
         name=symbol_id,
         original_filename=original_filename,
         num_points=len(normalized_points),
-        normalized_length=1.0
+        normalized_length=1.0,
+        content_hash=content_hash
     )
     
-    # Save to disk
-    save_symbol(symbol_id, metadata, normalized_points)
+    marker = _hash_marker(content_hash)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    # Concurrent uploads of the same content (other processes included)
+    # store it once; the later ones get the first one's symbol
+    with file_lock(marker.parent / ".lock"):
+        existing = find_symbol_by_hash(content_hash)
+        if existing is not None:
+            return existing, False
+        save_symbol(symbol_id, metadata, normalized_points)
+        tmp = marker.with_name(f"{content_hash}.{os.getpid()}.tmp")
+        tmp.write_text(symbol_id)
+        os.replace(tmp, marker)
+    
+    return NormalizedSymbol(metadata=metadata, polyline=normalized_points), True
+
+
+_upload_pool: Optional[ProcessPoolExecutor] = None
+_upload_pool_lock = threading.Lock()
+
+
+def get_upload_pool() -> ProcessPoolExecutor:
+    """
+    Worker processes for process_svg_upload.
     
-    return NormalizedSymbol(metadata=metadata, polyline=normalized_points)
+    Path sampling is pure Python: in separate processes it neither blocks
+    the event loop nor competes for the GIL with route generation threads.
+    """
+    global _upload_pool
+    if _upload_pool is None:
+        with _upload_pool_lock:
+            if _upload_pool is None:
+                # spawn: forking a process running threads isn't safe
+                _upload_pool = ProcessPoolExecutor(
+                    max_workers=settings.symbol_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _upload_pool
+
 
+def shutdown_upload_pool() -> None:
+    """Stop the upload worker processes (a later upload starts new ones)."""
+    global _upload_pool
+    with _upload_pool_lock:
+        pool, _upload_pool = _upload_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
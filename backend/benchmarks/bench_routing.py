@@ -0,0 +1,187 @@
+"""Benchmark generate_route on local graph fixtures.
+
+Runs every symbol in ``examples/`` x target distance x fixture density,
+without network access, and writes a JSON report that can be compared
+against a previous run to catch regressions.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.bench_routing
+    python -m benchmarks.bench_routing --repeat 10 --distances 3,5 --densities dense,sparse
+    python -m benchmarks.bench_routing --baseline benchmarks/results/baseline.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.core.metrics import start_request_timings
+from app.services.routing import search_route
+from app.services.shapes import parse_svg_to_points, normalize_polyline
+from app.core.settings import settings
+from benchmarks.fidelity import shape_fidelity
+from benchmarks.fixtures import available_fixtures, fixture_center, load_fixture
+
+
+EXAMPLES_DIR = Path(__file__).resolve().parents[2] / "examples"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Regression thresholds used by --baseline
+LATENCY_TOLERANCE = 0.20  # p95 may grow by 20 %
+FIDELITY_TOLERANCE = 0.05  # fidelity may drop by 0.05
+
+
+def load_example_symbols(names: Optional[List[str]] = None) -> Dict[str, list]:
+    """Parse and normalize the SVGs in examples/ exactly like an upload."""
+    symbols = {}
+    for svg_path in sorted(EXAMPLES_DIR.glob("*.svg")):
+        if names and svg_path.stem not in names:
+            continue
+        points = parse_svg_to_points(svg_path.read_text(), num_samples=settings.shape_sample_points)
+        symbols[svg_path.stem] = normalize_polyline(points)
+    return symbols
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_case(symbol: list, density: str, distance_km: float, repeat: int) -> dict:
+    """Benchmark one symbol x density x distance combination."""
+    load_start = time.perf_counter()
+    graph = load_fixture(density)
+    graph_load_ms = (time.perf_counter() - load_start) * 1000
+    start_lat, start_lon = fixture_center(graph)
+
+    latencies_ms = []
+    stage_runs: Dict[str, List[float]] = {}
+    candidates = 0
+    coordinates, distance_m = [], 0.0
+
+    for _ in range(repeat):
+        timings = start_request_timings()
+        start = time.perf_counter()
+        result = search_route(symbol, start_lat, start_lon, distance_km, graph=graph)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        coordinates, distance_m = result.coordinates, result.distance_m
+        candidates = result.candidates_evaluated
+        for stage, seconds in timings.items():
+            stage_runs.setdefault(stage, []).append(seconds * 1000)
+
+    # Separate pass: tracemalloc slows allocation-heavy code noticeably
+    tracemalloc.start()
+    search_route(symbol, start_lat, start_lon, distance_km, graph=graph)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "runs": repeat,
+        "p50_ms": round(_percentile(latencies_ms, 50), 2),
+        "p95_ms": round(_percentile(latencies_ms, 95), 2),
+        "mean_ms": round(statistics.mean(latencies_ms), 2),
+        "graph_load_ms": round(graph_load_ms, 2),
+        "graph_nodes": graph.number_of_nodes(),
+        "stages_p50_ms": {
+            stage: round(_percentile(values, 50), 2) for stage, values in stage_runs.items()
+        },
+        "peak_mem_mb": round(peak_bytes / 1024 / 1024, 2),
+        "candidates": candidates,
+        "route_distance_m": round(distance_m, 1),
+        "distance_error": round(abs(distance_m / 1000 - distance_km) / distance_km, 3),
+        "fidelity": round(shape_fidelity(coordinates, symbol), 3),
+    }
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Return human-readable regressions of `results` against `baseline`."""
+    previous = {
+        (c["symbol"], c["density"], c["distance_km"]): c for c in baseline["cases"]
+    }
+    regressions = []
+    for case in results["cases"]:
+        key = (case["symbol"], case["density"], case["distance_km"])
+        old = previous.get(key)
+        if old is None:
+            continue
+        label = f"{key[0]}/{key[1]}/{key[2]}km"
+        if case["p95_ms"] > old["p95_ms"] * (1 + LATENCY_TOLERANCE):
+            regressions.append(f"{label}: p95 {old['p95_ms']} -> {case['p95_ms']} ms")
+        if case["fidelity"] < old["fidelity"] - FIDELITY_TOLERANCE:
+            regressions.append(f"{label}: fidelity {old['fidelity']} -> {case['fidelity']}")
+    return regressions
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--symbols", default="", help="Comma-separated example names (default: all)")
+    parser.add_argument("--distances", default="2,5", help="Comma-separated target distances in km")
+    parser.add_argument("--densities", default="", help="Comma-separated fixtures (default: all)")
+    parser.add_argument("--output", type=Path, help="Report path (default: results/<timestamp>.json)")
+    parser.add_argument("--baseline", type=Path, help="Previous report to check for regressions")
+    args = parser.parse_args(argv)
+
+    symbols = load_example_symbols([s for s in args.symbols.split(",") if s])
+    distances = [float(d) for d in args.distances.split(",") if d]
+    densities = [d for d in args.densities.split(",") if d] or available_fixtures()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "cases": []
+    }
+
+    for density in densities:
+        for name, polyline in symbols.items():
+            for distance_km in distances:
+                case = run_case(polyline, density, distance_km, args.repeat)
+                case.update(symbol=name, density=density, distance_km=distance_km)
+                results["cases"].append(case)
+                print(
+                    f"{density:<8} {name:<10} {distance_km:>5.1f}km  "
+                    f"p50={case['p50_ms']:>9.1f}ms  p95={case['p95_ms']:>9.1f}ms  "
+                    f"mem={case['peak_mem_mb']:>6.1f}MB  cand={case['candidates']:>3}  "
+                    f"fidelity={case['fidelity']:.3f}"
+                )
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nReport written to {output}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()))
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Check routing invariants on the synthetic graph fixtures.
+
+Deterministic checks of properties the benchmarks rely on but can't see
+(a faster path search that returns a longer path still "works"). The
+checks compare optimized components against plain references on graphs
+built like the ``dense``, ``medium`` and ``sparse`` fixtures.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.check_invariants
+    python -m benchmarks.check_invariants --checks legs
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.settings import settings
+from app.services.compact_graph import CompactGraph, OneToManySearch, compact_graph
+from app.services.feasibility import FeasibilityRaster
+from app.services.graph_store import GraphStore
+from app.services.legs import LegCache
+from app.services.osm import M_PER_DEG, get_spatial_index, offsets_to_latlon
+from app.services.routing import snap_polyline_to_graph
+from benchmarks.fixtures import DENSITIES, FIXTURE_CENTER, build_grid_graph, load_fixture
+
+
+# Path lengths are float32 sums: allow rounding, not a different path
+LENGTH_TOLERANCE_M = 0.05
+
+
+def _reference_distances(graph: CompactGraph, source: int) -> np.ndarray:
+    """Single-source distances from scipy's Dijkstra on the graph's CSR arrays."""
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra
+
+    n = graph.number_of_nodes()
+    matrix = csr_matrix(
+        (graph.lengths.astype(np.float64), graph.indices, graph.indptr), shape=(n, n)
+    )
+    return dijkstra(matrix, indices=source)
+
+
+def _path_length(graph: CompactGraph, path: List[int]) -> Optional[float]:
+    """Length of a node path, or None if two consecutive nodes aren't adjacent."""
+    total = 0.0
+    for u, v in zip(path, path[1:]):
+        length = graph.edge_length(u, v)
+        if length is None:
+            return None
+        total += length
+    return total
+
+
+def check_legs(samples: int = 40) -> List[str]:
+    """OneToManySearch and LegCache paths are shortest paths (as long as a plain Dijkstra's)."""
+    failures = []
+    rng = np.random.default_rng(0)
+    for density in DENSITIES:
+        graph = load_fixture(density)
+        n = graph.number_of_nodes()
+        sources = rng.choice(n, 4, replace=False)
+        for source in sources:
+            expected = _reference_distances(graph, int(source))
+            search = OneToManySearch(int(source))
+            # Bounded like a search's legs, so some lookups take the fallback path
+            cache = LegCache(graph, max_leg_m=1500.0)
+            for target in rng.choice(n, samples, replace=False):
+                target = int(target)
+                for label, path in (
+                    ("OneToManySearch", search.path_to(target) if search.run_until(graph, target) else None),
+                    ("LegCache", cache.path(int(source), target)),
+                ):
+                    if not np.isfinite(expected[target]):
+                        if path not in (None, [int(source)]):
+                            failures.append(f"{density}: {label} found a path to unreachable {target}")
+                        continue
+                    length = _path_length(graph, path) if path else None
+                    if (
+                        length is None or path[0] != source or path[-1] != target
+                        or abs(length - expected[target]) > LENGTH_TOLERANCE_M
+                    ):
+                        failures.append(
+                            f"{density}: {label} {source}->{target} length {length}, "
+                            f"expected {expected[target]:.2f}"
+                        )
+    return failures
+
+
+def check_parallel_edges(samples: int = 200) -> List[str]:
+    """compact_graph keeps the shortest of parallel (and, undirected, reverse) edges."""
+    failures = []
+    rng = np.random.default_rng(0)
+    for density, (block_m, drop_ratio) in DENSITIES.items():
+        graph = build_grid_graph(*FIXTURE_CENTER, 1.0, block_m, drop_ratio)
+        edges = list(graph.edges(data="length"))
+        for i in rng.choice(len(edges), min(samples, len(edges)), replace=False):
+            u, v, length = edges[i]
+            # One longer and one shorter parallel street, and a shorter one-way
+            # reverse that only the undirected graph may use for u -> v
+            graph.add_edge(u, v, length=length * 1.5)
+            graph.add_edge(u, v, length=length * rng.uniform(0.2, 0.9))
+            graph.add_edge(v, u, length=length * 0.1)
+        # A zero-length self-loop must not become an edge either
+        graph.add_edge(u, u, length=0.0)
+
+        for undirected in (False, True):
+            expected: Dict[tuple, float] = {}
+            for u, v, length in graph.edges(data="length"):
+                if u == v:
+                    continue
+                for pair in ((u, v), (v, u)) if undirected else ((u, v),):
+                    expected[pair] = min(expected.get(pair, float("inf")), length)
+            compact = compact_graph(graph, undirected=undirected)
+            index = {int(osm_id): i for i, osm_id in enumerate(compact.osm_ids)}
+            # Directed edges: an undirected segment is stored both ways
+            if len(compact.indices) != len(expected):
+                failures.append(
+                    f"{density} (undirected={undirected}): {len(compact.indices)} edges, "
+                    f"expected {len(expected)}"
+                )
+            for (u, v), length in expected.items():
+                kept = compact.edge_length(index[u], index[v])
+                if kept is None or abs(kept - length) > LENGTH_TOLERANCE_M:
+                    failures.append(
+                        f"{density} (undirected={undirected}): {u}->{v} kept {kept}, "
+                        f"expected {length:.2f}"
+                    )
+    return failures
+
+
+def check_store_eviction() -> List[str]:
+    """GraphStore.evict never deletes a region a live process references."""
+    graph = compact_graph(build_grid_graph(*FIXTURE_CENTER, 0.5, 70.0, 0.05), undirected=True)
+    # A pid that was alive once and is now gone
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        names = ["own", "dead", "other", "unused"]
+        store = GraphStore(root, max_bytes=0)
+        for age, name in enumerate(names):
+            store.save(name, graph)
+            # Least recently used first, so every region is an eviction candidate
+            used = time.time() - 3600 * (len(names) - age)
+            os.utime(root / name, (used, used))
+        store.max_bytes = 2 * store.size("own")
+
+        store.acquire("own")
+        for name, pid in (("dead", child.pid), ("other", os.getppid())):
+            marker = root / "refs" / name / str(pid)
+            marker.parent.mkdir(parents=True)
+            marker.touch()
+
+        evicted = store.evict()
+        failures = []
+        if sorted(evicted) != ["dead", "unused"]:
+            failures.append(f"evicted {evicted}, expected ['dead', 'unused']")
+        for name in ("own", "other"):
+            if name not in store.regions():
+                failures.append(f"referenced region '{name}' was deleted")
+        if store.references("other") != [os.getppid()]:
+            failures.append("a live process's marker was removed")
+        return failures
+
+
+def check_feasibility_bound(samples: int = 4000) -> List[str]:
+    """
+    FeasibilityRaster never rejects a placement that snapping accepts.
+
+    The raster's rate must bound the snap rate point by point (so for any
+    polyline), checked on points spread over and around each fixture and on
+    points near the snap distance from a node, with the configured raster
+    and a coarse one whose cells outgrow feasibility_cell_m.
+    """
+    failures = []
+    rng = np.random.default_rng(0)
+    max_distance_m = settings.max_snap_distance_m
+    for density in DENSITIES:
+        graph = load_fixture(density)
+        index = get_spatial_index(graph)
+        pad = 2 * max_distance_m / M_PER_DEG
+        uniform = np.column_stack([
+            rng.uniform(graph.lats.min() - pad, graph.lats.max() + pad, samples),
+            rng.uniform(graph.lons.min() - pad, graph.lons.max() + pad, samples),
+        ])
+        angles = rng.uniform(0, 2 * np.pi, samples)
+        offsets = np.column_stack([np.cos(angles), np.sin(angles)])
+        offsets *= rng.uniform(0.9, 1.1, (samples, 1)) * max_distance_m
+        near_edge = np.vstack([
+            offsets_to_latlon(offset[None], graph.lats[node], graph.lons[node])
+            for offset, node in zip(offsets, rng.choice(graph.number_of_nodes(), samples))
+        ])
+        points = [tuple(p) for p in np.vstack([uniform, near_edge])]
+
+        rasters = {
+            "configured": FeasibilityRaster(
+                graph, index, max_distance_m, settings.feasibility_cell_m, settings.feasibility_max_cells
+            ),
+            "coarse": FeasibilityRaster(graph, index, max_distance_m, settings.feasibility_cell_m, 2000),
+        }
+        snapped = [snap_polyline_to_graph([point], graph, max_distance_m)[1] for point in points]
+        for label, raster in rasters.items():
+            rejected = [
+                point for point, rate in zip(points, snapped)
+                if rate > raster.max_snap_rate([point])
+            ]
+            for lat, lon in rejected:
+                failures.append(f"{density} ({label}): ({lat:.6f}, {lon:.6f}) snaps but the raster rejects it")
+    return failures
+
+
+CHECKS: Dict[str, Callable[[], List[str]]] = {
+    "legs": check_legs,
+    "parallel_edges": check_parallel_edges,
+    "store_eviction": check_store_eviction,
+    "feasibility_bound": check_feasibility_bound,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", default="", help="Comma-separated checks (default: all)")
+    args = parser.parse_args(argv)
+
+    names = [c for c in args.checks.split(",") if c] or list(CHECKS)
+    failed = False
+    for name in names:
+        failures = CHECKS[name]()
+        print(f"{name:18s} {'FAIL' if failures else 'ok'}")
+        for failure in failures[:10]:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
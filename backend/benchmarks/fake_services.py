@@ -0,0 +1,185 @@
+"""Local stand-ins for the Overpass and Nominatim APIs.
+
+The fake Overpass server answers ``/api/interpreter`` queries with a
+street grid covering the query polygon; the fake Nominatim answers
+``/search`` with a deterministic point near a configurable center. Both
+add a configurable latency so load tests can model slow upstreams.
+
+Point the backend at it with:
+
+    OVERPASS_ENDPOINT=http://127.0.0.1:<port>/api
+    NOMINATIM_URL=http://127.0.0.1:<port>/search
+"""
+import json
+import math
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+_POLY_RE = re.compile(r"poly:'([^']+)'")
+
+
+def overpass_grid(query: str, block_m: float) -> dict:
+    """
+    Build an Overpass JSON response: a street grid over the query polygon.
+
+    Grid nodes sit on a global lattice so overlapping queries return the
+    same node ids, as the real API would.
+    """
+    match = _POLY_RE.search(query)
+    if not match:
+        return {"elements": []}
+    values = [float(v) for v in match.group(1).split()]
+    lats, lons = values[0::2], values[1::2]
+
+    dlat = block_m / 111_320.0
+    dlon = block_m / (111_320.0 * math.cos(math.radians(round(sum(lats) / len(lats)))))
+    rows = range(math.ceil(min(lats) / dlat), math.floor(max(lats) / dlat) + 1)
+    cols = range(math.ceil(min(lons) / dlon), math.floor(max(lons) / dlon) + 1)
+
+    def node_id(i: int, j: int) -> int:
+        return (i + 1_000_000) * 10_000_000 + (j + 1_000_000)
+
+    elements = [
+        {"type": "node", "id": node_id(i, j), "lat": i * dlat, "lon": j * dlon}
+        for i in rows for j in cols
+    ]
+    way_id = 1
+    for i in rows:
+        elements.append({
+            "type": "way", "id": way_id,
+            "nodes": [node_id(i, j) for j in cols],
+            "tags": {"highway": "residential"}
+        })
+        way_id += 1
+    for j in cols:
+        elements.append({
+            "type": "way", "id": way_id,
+            "nodes": [node_id(i, j) for i in rows],
+            "tags": {"highway": "footway"}
+        })
+        way_id += 1
+    return {"version": 0.6, "generator": "fake-overpass", "elements": elements}
+
+
+def nominatim_result(query: str, center: Tuple[float, float]) -> list:
+    """Deterministic geocoding answer within ~5 km of `center`."""
+    if not query.strip() or "nowhere" in query.lower():
+        return []
+    h = zlib.crc32(query.strip().lower().encode("utf-8"))
+    lat = center[0] + ((h & 0xFFFF) / 0xFFFF - 0.5) * 0.09
+    lon = center[1] + (((h >> 16) & 0xFFFF) / 0xFFFF - 0.5) * 0.13
+    return [{"lat": f"{lat:.7f}", "lon": f"{lon:.7f}", "display_name": query}]
+
+
+class FakeServices:
+    """Threaded HTTP server hosting both fake APIs on one port."""
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        block_m: float = 100.0,
+        center: Tuple[float, float] = (48.8566, 2.3522),
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.latency_ms = latency_ms
+        self.block_m = block_m
+        self.center = center
+        self.requests = {"overpass": 0, "nominatim": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def overpass_endpoint(self) -> str:
+        return f"{self.base_url}/api"
+
+    @property
+    def nominatim_url(self) -> str:
+        return f"{self.base_url}/search"
+
+    def start(self) -> "FakeServices":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: str, content_type: str) -> None:
+                payload = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _delay(self) -> None:
+                if services.latency_ms:
+                    time.sleep(services.latency_ms / 1000)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/api/status":
+                    status = "Connected as: 0\nCurrent time: -\nAnnounced endpoint: none\n" \
+                             "Rate limit: 0\n2 slots available now.\n"
+                    self._send(200, status, "text/plain")
+                elif url.path == "/search":
+                    services.requests["nominatim"] += 1
+                    self._delay()
+                    query = parse_qs(url.query).get("q", [""])[0]
+                    body = json.dumps(nominatim_result(query, services.center))
+                    self._send(200, body, "application/json")
+                else:
+                    self._send(404, "{}", "application/json")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != "/api/interpreter":
+                    self._send(404, "{}", "application/json")
+                    return
+                services.requests["overpass"] += 1
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+                self._delay()
+                body = json.dumps(overpass_grid(form.get("data", [""])[0], services.block_m))
+                self._send(200, body, "application/json")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake Overpass/Nominatim server")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--block-m", type=float, default=100.0)
+    args = parser.parse_args()
+
+    services = FakeServices(args.latency_ms, args.block_m, port=args.port).start()
+    print(f"OVERPASS_ENDPOINT={services.overpass_endpoint}")
+    print(f"NOMINATIM_URL={services.nominatim_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
@@ -0,0 +1,65 @@
+"""Shape-fidelity score between a generated route and its symbol."""
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+from app.services.shapes import normalize_polyline
+
+
+def _resample(points: np.ndarray, num_points: int) -> np.ndarray:
+    """Resample a polyline to evenly spaced points along its length."""
+    seg = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1))
+    cumulative = np.concatenate([[0.0], np.cumsum(seg)])
+    targets = np.linspace(0.0, cumulative[-1], num_points)
+    return np.column_stack([
+        np.interp(targets, cumulative, points[:, 0]),
+        np.interp(targets, cumulative, points[:, 1])
+    ])
+
+
+def _chamfer(a: np.ndarray, b: np.ndarray) -> float:
+    d = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+    return 0.5 * (d.min(axis=1).mean() + d.min(axis=0).mean())
+
+
+def shape_fidelity(
+    route: List[Tuple[float, float]],
+    symbol_polyline: List[Tuple[float, float]],
+    num_points: int = 128,
+    rotation_step_deg: float = 5.0
+) -> float:
+    """
+    Score how closely a route reproduces a symbol, in [0, 1].
+
+    The route is projected to local meters in the engine's (north, east)
+    orientation, both shapes are normalized to unit length, and the best
+    rotation's symmetric chamfer distance is divided by the symbol's radius.
+    1.0 is a perfect match; 0.0 means the error is as large as the shape.
+    """
+    if len(route) < 2:
+        return 0.0
+
+    arr = np.asarray(route, dtype=float)
+    lat0 = arr[:, 0].mean()
+    metric = np.column_stack([
+        (arr[:, 0] - lat0) * 111_320.0,
+        (arr[:, 1] - arr[:, 1].mean()) * 111_320.0 * math.cos(math.radians(lat0))
+    ])
+    try:
+        route_norm = np.asarray(normalize_polyline([tuple(p) for p in metric]))
+    except ValueError:
+        return 0.0
+    symbol_norm = np.asarray(normalize_polyline(symbol_polyline))
+
+    route_pts = _resample(route_norm, num_points)
+    symbol_pts = _resample(symbol_norm, num_points)
+    radius = np.sqrt((symbol_pts ** 2).sum(axis=1)).max()
+
+    best = math.inf
+    for angle in np.arange(0.0, 360.0, rotation_step_deg):
+        rad = math.radians(angle)
+        rot = np.array([[math.cos(rad), -math.sin(rad)], [math.sin(rad), math.cos(rad)]])
+        best = min(best, _chamfer(symbol_pts @ rot.T, route_pts))
+
+    return float(max(0.0, 1.0 - best / radius))
@@ -0,0 +1,158 @@
+"""Street graph fixtures for offline benchmarks.
+
+Synthetic fixtures are deterministic jittered street grids whose block size
+and missing-street ratio mimic city densities. They are generated on first
+use and serialized under ``data/bench_fixtures`` so later runs load them
+from disk like a cached OSM graph. Real OSM extracts can be captured once
+with ``capture_osm_fixture`` and are then picked up by name.
+"""
+import math
+import pickle
+from pathlib import Path
+from typing import Dict, List
+
+import networkx as nx
+import numpy as np
+
+from app.core.settings import settings
+from app.services.circuity import CircuityModel
+from app.services.compact_graph import CompactGraph, compact_graph
+
+
+FIXTURES_DIR = settings.data_dir / "bench_fixtures"
+
+# Center used for synthetic fixtures (Paris): realistic latitude so the
+# degree/metre conversions in the engine behave as in production.
+FIXTURE_CENTER = (48.8566, 2.3522)
+
+# name -> (block size in m, fraction of street segments removed)
+DENSITIES: Dict[str, tuple] = {
+    "dense": (70.0, 0.05),
+    "medium": (120.0, 0.15),
+    "sparse": (200.0, 0.35),
+}
+
+
+def _haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    r = 6371000.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * r * math.asin(math.sqrt(a))
+
+
+def build_grid_graph(
+    center_lat: float,
+    center_lon: float,
+    radius_km: float,
+    block_m: float,
+    drop_ratio: float,
+    seed: int = 0
+) -> nx.MultiDiGraph:
+    """
+    Build a jittered street grid shaped like an osmnx walk graph.
+
+    Nodes carry ``x``/``y`` (lon/lat); every street is a pair of directed
+    edges with a haversine ``length`` in meters.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(2 * radius_km * 1000 / block_m) + 1
+    half = (n - 1) / 2
+    m_per_deg_lat = 111_320.0
+    m_per_deg_lon = 111_320.0 * math.cos(math.radians(center_lat))
+
+    graph = nx.MultiDiGraph(crs="epsg:4326")
+    for i in range(n):
+        for j in range(n):
+            jitter_y, jitter_x = rng.normal(0, block_m * 0.12, size=2)
+            y_m = (i - half) * block_m + jitter_y
+            x_m = (j - half) * block_m + jitter_x
+            if math.hypot(x_m, y_m) > radius_km * 1000:
+                continue
+            graph.add_node(
+                i * n + j,
+                y=center_lat + y_m / m_per_deg_lat,
+                x=center_lon + x_m / m_per_deg_lon
+            )
+
+    for i in range(n):
+        for j in range(n):
+            u = i * n + j
+            if u not in graph:
+                continue
+            for di, dj in ((0, 1), (1, 0)):
+                v = (i + di) * n + (j + dj)
+                if i + di >= n or j + dj >= n or v not in graph:
+                    continue
+                if rng.random() < drop_ratio:
+                    continue
+                length = _haversine_m(
+                    graph.nodes[u]["y"], graph.nodes[u]["x"],
+                    graph.nodes[v]["y"], graph.nodes[v]["x"]
+                )
+                graph.add_edge(u, v, 0, length=length)
+                graph.add_edge(v, u, 0, length=length)
+
+    # Keep the largest connected piece, like osmnx does after truncation
+    largest = max(nx.weakly_connected_components(graph), key=len)
+    return graph.subgraph(largest).copy()
+
+
+def fixture_path(name: str) -> Path:
+    return FIXTURES_DIR / f"{name}.pkl"
+
+
+def load_fixture(name: str, radius_km: float = 3.0) -> CompactGraph:
+    """
+    Load a fixture graph by name, generating synthetic densities on demand.
+
+    Synthetic fixtures are stored as osmnx-like graphs and compacted on
+    load, like a freshly downloaded region.
+
+    Args:
+        name: A key of DENSITIES or the name of a captured OSM fixture
+        radius_km: Radius used when generating a synthetic fixture
+    """
+    path = fixture_path(name)
+    if not path.exists():
+        if name not in DENSITIES:
+            raise FileNotFoundError(f"Fixture '{name}' not found in {FIXTURES_DIR}")
+        block_m, drop_ratio = DENSITIES[name]
+        graph = build_grid_graph(*FIXTURE_CENTER, radius_km, block_m, drop_ratio)
+        FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    with open(path, "rb") as f:
+        graph = pickle.load(f)
+    if isinstance(graph, nx.MultiDiGraph):
+        graph = compact_graph(graph, undirected=True)
+        graph.graph["circuity"] = CircuityModel.estimate(graph).to_list()
+    return graph
+
+
+def fixture_center(graph: CompactGraph) -> tuple:
+    """Return the (lat, lon) the fixture was built around."""
+    return graph.graph.get("center", FIXTURE_CENTER)
+
+
+def capture_osm_fixture(name: str, lat: float, lon: float, radius_km: float = 3.0) -> Path:
+    """Download a real OSM graph once and store it as a named fixture (needs network)."""
+    from app.services.osm import get_graph_around_point
+
+    graph = get_graph_around_point(lat, lon, radius_km)
+    graph.graph["center"] = (lat, lon)
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    path = fixture_path(name)
+    with open(path, "wb") as f:
+        pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def available_fixtures() -> List[str]:
+    """Synthetic densities plus any captured fixtures on disk."""
+    names = list(DENSITIES)
+    if FIXTURES_DIR.exists():
+        names += sorted(p.stem for p in FIXTURES_DIR.glob("*.pkl") if p.stem not in DENSITIES)
+    return names
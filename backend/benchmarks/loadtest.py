@@ -0,0 +1,295 @@
+"""Load test the API against local fake Overpass/Nominatim services.
+
+Starts the fake upstreams, runs the FastAPI app in-process with uvicorn
+(pointed at the fakes and a throwaway data directory), uploads the example
+symbols, then drives ``/route``, ``/route/gpx``, ``/symbols`` and
+``/geocode`` with a fixed number of concurrent clients for a given duration.
+
+Reports throughput, per-endpoint latency percentiles and the server's
+event-loop lag (how late a 50 ms timer fires on the server loop).
+
+Usage (from the backend directory):
+
+    python -m benchmarks.loadtest --concurrency 8 --duration 60
+    python -m benchmarks.loadtest --mix route=1 --concurrency 16 --upstream-latency-ms 500
+    python -m benchmarks.loadtest --url http://localhost:8000   # external server, no lag probe
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_services import FakeServices
+
+
+EXAMPLES_DIR = Path(__file__).resolve().parents[2] / "examples"
+DEFAULT_MIX = "route=4,gpx=1,symbols=3,geocode=2"
+GEOCODE_QUERIES = ["Paris", "Lyon", "Marseille", "Bordeaux", "Lille", "Nantes", "Nowhere Land"]
+LAG_INTERVAL_S = 0.05
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in {"route", "gpx", "symbols", "geocode"}:
+            raise ValueError(f"Unknown endpoint in mix: {name!r}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class InProcessServer:
+    """Uvicorn running the app on its own thread and event loop, with a lag probe."""
+
+    def __init__(self, port: int):
+        import uvicorn
+        from app.main import app
+
+        self.port = port
+        self.lags_ms: List[float] = []
+        self._server = uvicorn.Server(
+            # Long keep-alive: a blocked loop would otherwise close idle pooled
+            # connections late and the client would race the disconnect
+            uvicorn.Config(
+                app, host="127.0.0.1", port=port,
+                log_level="warning", timeout_keep_alive=120
+            )
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        probe = loop.create_task(self._probe_lag())
+        loop.run_until_complete(self._server.serve())
+        probe.cancel()
+        loop.run_until_complete(asyncio.gather(probe, return_exceptions=True))
+        loop.close()
+
+    async def _probe_lag(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_INTERVAL_S)
+            self.lags_ms.append((time.perf_counter() - start - LAG_INTERVAL_S) * 1000)
+
+    def start(self) -> "InProcessServer":
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+async def seed_symbols(client: httpx.AsyncClient) -> List[str]:
+    """Upload the example SVGs and return their symbol ids."""
+    ids = []
+    for svg_path in sorted(EXAMPLES_DIR.glob("*.svg")):
+        response = await client.post(
+            "/symbols",
+            files={"file": (svg_path.name, svg_path.read_bytes(), "image/svg+xml")}
+        )
+        response.raise_for_status()
+        ids.append(response.json()["metadata"]["id"])
+    return ids
+
+
+def _route_body(rng: random.Random, symbol_ids: List[str], center, spread_km: float, distances) -> dict:
+    dlat = (rng.random() - 0.5) * 2 * spread_km / 111.0
+    dlon = (rng.random() - 0.5) * 2 * spread_km / 73.0
+    return {
+        "symbol_id": rng.choice(symbol_ids),
+        "start_lat": round(center[0] + dlat, 6),
+        "start_lon": round(center[1] + dlon, 6),
+        "target_distance_km": rng.choice(distances),
+    }
+
+
+async def run_load(
+    base_url: str,
+    weights: Dict[str, float],
+    concurrency: int,
+    duration_s: float,
+    center,
+    spread_km: float,
+    distances: List[float],
+    seed: int
+) -> dict:
+    """Closed-loop load: each client issues its next request when the previous one returns."""
+    results: Dict[str, List[float]] = {name: [] for name in weights}
+    errors: Dict[str, int] = {name: 0 for name in weights}
+    error_samples: Dict[str, str] = {}
+    timeout = httpx.Timeout(600.0)
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        symbol_ids = await seed_symbols(client)
+        deadline = time.perf_counter() + duration_s
+        names, cumulative = list(weights), list(weights.values())
+
+        async def worker(worker_id: int) -> None:
+            rng = random.Random(seed + worker_id)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights=cumulative)[0]
+                if name == "route":
+                    request = client.post("/route", json=_route_body(rng, symbol_ids, center, spread_km, distances))
+                elif name == "gpx":
+                    request = client.post("/route/gpx", json=_route_body(rng, symbol_ids, center, spread_km, distances))
+                elif name == "symbols":
+                    request = client.get("/symbols")
+                else:
+                    request = client.get("/geocode", params={"address": rng.choice(GEOCODE_QUERIES)})
+
+                start = time.perf_counter()
+                try:
+                    response = await request
+                    ok = response.status_code < 500
+                    if not ok:
+                        error_samples.setdefault(name, response.text[:200])
+                except httpx.HTTPError as e:
+                    ok = False
+                    error_samples.setdefault(name, repr(e))
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if ok:
+                    results[name].append(elapsed_ms)
+                else:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        wall_s = time.perf_counter() - started
+
+    completed = sum(len(v) for v in results.values())
+    return {
+        "wall_s": round(wall_s, 2),
+        "completed": completed,
+        "errors": sum(errors.values()),
+        "error_samples": error_samples,
+        "throughput_rps": round(completed / wall_s, 3) if wall_s else 0.0,
+        "endpoints": {
+            name: {
+                "count": len(values),
+                "errors": errors[name],
+                "p50_ms": round(_percentile(values, 50), 1),
+                "p95_ms": round(_percentile(values, 95), 1),
+                "p99_ms": round(_percentile(values, 99), 1),
+                "max_ms": round(max(values), 1) if values else 0.0,
+            }
+            for name, values in results.items()
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="Test duration in seconds")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weighted endpoint mix")
+    parser.add_argument("--upstream-latency-ms", type=float, default=200.0, help="Fake Overpass/Nominatim latency")
+    parser.add_argument("--block-m", type=float, default=100.0, help="Street spacing of the fake Overpass grid")
+    parser.add_argument("--spread-km", type=float, default=2.0, help="Start points are spread this far from the center")
+    parser.add_argument("--distances", default="2,3,5", help="Comma-separated target distances in km")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Drive an already running server instead of an in-process one")
+    parser.add_argument("--output", type=Path, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    center = (48.8566, 2.3522)
+    weights = parse_mix(args.mix)
+    distances = [float(d) for d in args.distances.split(",") if d]
+
+    services = FakeServices(args.upstream_latency_ms, args.block_m, center).start()
+    server = None
+    workdir = tempfile.TemporaryDirectory(prefix="loadtest-")
+    try:
+        if args.url:
+            base_url = args.url
+            print(f"Fake upstreams at {services.base_url}; start the target server with:")
+            print(f"  OVERPASS_ENDPOINT={services.overpass_endpoint} NOMINATIM_URL={services.nominatim_url}")
+        else:
+            # Settings are read at import: configure the environment first
+            data_dir = Path(workdir.name)
+            os.environ.update({
+                "DATA_DIR": str(data_dir),
+                "SYMBOLS_DIR": str(data_dir / "symbols"),
+                "OSM_CACHE_DIR": str(data_dir / "osm_cache"),
+                "OVERPASS_ENDPOINT": services.overpass_endpoint,
+                "NOMINATIM_URL": services.nominatim_url,
+                "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+            })
+            server = InProcessServer(_free_port()).start()
+            base_url = server.url
+
+        report = asyncio.run(run_load(
+            base_url, weights, args.concurrency, args.duration,
+            center, args.spread_km, distances, args.seed
+        ))
+    finally:
+        if server is not None:
+            server.stop()
+        services.stop()
+        workdir.cleanup()
+
+    report["config"] = {
+        "concurrency": args.concurrency,
+        "duration_s": args.duration,
+        "mix": weights,
+        "upstream_latency_ms": args.upstream_latency_ms,
+    }
+    report["upstream_requests"] = dict(services.requests)
+    if server is not None:
+        lags = server.lags_ms
+        report["event_loop_lag_ms"] = {
+            "p50": round(_percentile(lags, 50), 1),
+            "p99": round(_percentile(lags, 99), 1),
+            "max": round(max(lags), 1) if lags else 0.0,
+        }
+
+    print(f"\nThroughput: {report['throughput_rps']} req/s "
+          f"({report['completed']} ok, {report['errors']} errors in {report['wall_s']} s)")
+    for name, stats in report["endpoints"].items():
+        print(f"  {name:<8} n={stats['count']:<5} err={stats['errors']:<3} "
+              f"p50={stats['p50_ms']:>8.1f}ms  p95={stats['p95_ms']:>8.1f}ms  p99={stats['p99_ms']:>8.1f}ms")
+    if "event_loop_lag_ms" in report:
+        lag = report["event_loop_lag_ms"]
+        print(f"Event-loop lag: p50={lag['p50']}ms p99={lag['p99']}ms max={lag['max']}ms")
+    print(f"Upstream requests: {report['upstream_requests']}")
+    for name, sample in report["error_samples"].items():
+        print(f"  first {name} error: {sample}")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())